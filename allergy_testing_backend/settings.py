@@ -54,6 +54,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "api.middleware.CompressionMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -61,14 +62,38 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "api.routers.ReplicaRoutingMiddleware",
 ]
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
         "rest_framework_simplejwt.authentication.JWTAuthentication",
-    )
+    ),
+    # orjson-backed when installed, stdlib json otherwise.
+    "DEFAULT_RENDERER_CLASSES": (
+        "api.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ),
+    "DEFAULT_PARSER_CLASSES": (
+        "api.parsers.FastJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ),
 }
 
+# Response compression (api.middleware.CompressionMiddleware)
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+COMPRESSION_CONTENT_TYPES = (
+    "application/json",
+    "text/csv",
+    "text/html",
+    "text/plain",
+)
+
+# Keyset pagination for list endpoints (api.pagination.KeysetPagination)
+API_PAGE_SIZE = int(os.getenv("API_PAGE_SIZE", "50"))
+API_MAX_PAGE_SIZE = int(os.getenv("API_MAX_PAGE_SIZE", "500"))
+
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=30),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=1),
@@ -119,6 +144,56 @@ else:
         }
     }
 
+# Optional read replica (api.routers.PrimaryReplicaRouter). Unset values are
+# taken from the primary; for SQLite, DB_REPLICA_NAME is the replica's file.
+if os.getenv("DB_REPLICA_HOST") or os.getenv("DB_REPLICA_NAME"):
+    DATABASES["replica"] = {
+        **DATABASES["default"],
+        **{
+            key: os.getenv(f"DB_REPLICA_{key}")
+            for key in ("NAME", "USER", "PASSWORD", "HOST", "PORT")
+            if os.getenv(f"DB_REPLICA_{key}")
+        },
+        "TEST": {"MIRROR": "default"},
+    }
+
+DATABASE_ROUTERS = ["api.routers.PrimaryReplicaRouter"]
+
+# Seconds a client keeps reading from the primary after it wrote something.
+REPLICA_PIN_SECONDS = int(os.getenv("REPLICA_PIN_SECONDS", "5"))
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    }
+}
+
+# Per-patient response cache (api.caching): an in-process LRU in front of a
+# shared tier that also holds the patient versions, so an invalidation by one
+# worker reaches all of them. Caching stays off until RESPONSE_CACHE_LOCATION
+# configures that tier. The "db" backend needs
+# `python manage.py createcachetable`.
+RESPONSE_CACHE_LRU_SIZE = int(os.getenv("RESPONSE_CACHE_LRU_SIZE", "1024"))
+RESPONSE_CACHE_ALIAS = ""
+RESPONSE_CACHE_TIMEOUT = 0
+
+if os.getenv("RESPONSE_CACHE_LOCATION"):
+    RESPONSE_CACHE_TIMEOUT = int(os.getenv("RESPONSE_CACHE_TIMEOUT", "300"))
+    CACHES["responses"] = {
+        "BACKEND": (
+            "django.core.cache.backends.db.DatabaseCache"
+            if os.getenv("RESPONSE_CACHE_BACKEND") == "db"
+            else "django.core.cache.backends.filebased.FileBasedCache"
+        ),
+        "LOCATION": os.getenv("RESPONSE_CACHE_LOCATION"),
+        "TIMEOUT": RESPONSE_CACHE_TIMEOUT,
+    }
+    RESPONSE_CACHE_ALIAS = "responses"
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -157,6 +232,32 @@ USE_TZ = True
 STATIC_URL = '/static/'
 STATIC_ROOT = BASE_DIR / 'static'
 
+# Uploaded documents are stored once per distinct content (api.storage).
+STORAGES = {
+    "default": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+    },
+    "staticfiles": {
+        "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage",
+    },
+    "documents": {
+        "BACKEND": "api.storage.ContentAddressedStorage",
+        "OPTIONS": {
+            "location": os.getenv("DOCUMENT_ROOT", BASE_DIR),
+        },
+    },
+}
+
+# Hand document downloads to the front-end server: "nginx" (X-Accel-Redirect to
+# DOCUMENT_SENDFILE_PREFIX, an internal location aliased to DOCUMENT_ROOT) or
+# "apache" (mod_xsendfile). Empty streams the file from Django.
+DOCUMENT_SENDFILE = os.getenv("DOCUMENT_SENDFILE", "")
+DOCUMENT_SENDFILE_PREFIX = os.getenv("DOCUMENT_SENDFILE_PREFIX", "/protected/")
+
+# ICD-10/CPT catalog for code autocomplete and validation (api.codes). Empty
+# uses the bundled api/data/medical_codes.tsv.
+MEDICAL_CODE_CATALOG = os.getenv("MEDICAL_CODE_CATALOG", "")
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
@@ -5,6 +5,7 @@ from api.models import (
     ServiceType,
     Vial,
     AllergyTemplate,
+    Allergen,
     AllergenTest,
     AuthorizationEntry,
 )
@@ -16,6 +17,7 @@ admin.site.register(
         ServiceType,
         Vial,
         AllergyTemplate,
+        Allergen,
         AllergenTest,
         AuthorizationEntry,
     ]
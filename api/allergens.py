@@ -0,0 +1,80 @@
+import sys
+from functools import partial
+
+from django.db import transaction
+
+from api.models import Allergen
+
+# normalized name -> (allergen id, display name). Catalog ids never change, so
+# entries stay valid for the life of the process; deletes and renames are
+# pushed in by signals.
+_catalog = {}
+
+
+def normalize_allergen_name(name):
+    """
+    Fold case, separators and whitespace so spelling variants such as
+    "Dust-Mite" and "dust  mite" map to the same catalog entry.
+    """
+    folded = name.replace("-", " ").replace("_", " ").casefold()
+    return sys.intern(" ".join(folded.split()))
+
+
+def vial_allergen_names(entries):
+    """
+    Yield the allergen names found in a Vial.allergens payload, which holds
+    either plain names or objects with a `name` key.
+    """
+    for entry in entries if isinstance(entries, list) else []:
+        if isinstance(entry, dict):
+            entry = entry.get("name") or entry.get("allergen_name")
+        if isinstance(entry, str) and entry.strip():
+            yield entry
+
+
+def _remember(entries):
+    _catalog.update(entries)
+
+
+def forget_allergen(normalized_name):
+    _catalog.pop(normalized_name, None)
+
+
+def lookup_allergens(names):
+    """
+    Map each name to its catalog `(id, display name)`, creating catalog rows
+    for names never seen before. Cached names cost no query; the rest are
+    resolved together in one SELECT (plus one INSERT and SELECT when new).
+    """
+    keys = {name: normalize_allergen_name(name) for name in names}
+    missing = {key for key in keys.values() if key not in _catalog}
+
+    found = {}
+    if missing:
+        found = _fetch(missing)
+        new = missing - found.keys()
+        if new:
+            display = {}
+            for name, key in keys.items():
+                display.setdefault(key, " ".join(name.split()))
+            Allergen.objects.bulk_create(
+                [Allergen(name=display[key], normalized_name=key) for key in new],
+                ignore_conflicts=True,
+            )
+            found.update(_fetch(new))
+        # Only cache rows once they are committed, so a rolled back
+        # transaction cannot leave ids behind that no longer exist.
+        transaction.on_commit(partial(_remember, found))
+
+    return {name: _catalog.get(key) or found[key] for name, key in keys.items()}
+
+
+def _fetch(keys):
+    rows = Allergen.objects.filter(normalized_name__in=keys).values_list(
+        "normalized_name", "id", "name"
+    )
+    return {key: (pk, name) for key, pk, name in rows}
+
+
+def allergen_ids(names):
+    return {name: pk for name, (pk, _) in lookup_allergens(names).items()}
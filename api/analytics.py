@@ -0,0 +1,182 @@
+from django.db.models import Avg, Count, F, Max, Min
+from django.db.models.functions import TruncDate
+
+from api.allergens import normalize_allergen_name
+from api.models import AllergenTest, AllergyTemplate
+from api.reactions import TEMPLATE_GRADE_LABELS, TEST_GRADE_LABELS
+
+# Per source: base queryset, lookups used by the aggregations, grade labels.
+REACTION_SOURCES = {
+    "tests": {
+        "queryset": AllergenTest.objects.all,
+        "patient": "patient_id",
+        "allergen": "allergen__normalized_name",
+        "date": TruncDate("test_date"),
+        "grade": "reaction_grade",
+        "mm": "wheal_mm",
+        "labels": TEST_GRADE_LABELS,
+    },
+    "injections": {
+        "queryset": AllergyTemplate.objects.all,
+        "patient": "vial__patient_id",
+        "allergen": "vial__allergen_catalog__normalized_name",
+        "date": F("date"),
+        "grade": "reaction_grade",
+        "mm": "reaction_mm",
+        "labels": TEMPLATE_GRADE_LABELS,
+    },
+}
+
+
+def _trend_columns(source):
+    return {
+        "count": Count("id"),
+        "avg_grade": Avg(source["grade"]),
+        "max_grade": Max(source["grade"]),
+        "avg_mm": Avg(source["mm"]),
+    }
+
+
+def reaction_analytics(source_name, patient_id=None, allergen=None, limit=100):
+    """
+    Reaction distribution, wheal size statistics and either a per-date trend
+    for one patient or per-patient figures for the cohort. Every figure is a
+    single aggregate query over the numeric reaction columns.
+    """
+    source = REACTION_SOURCES[source_name]
+    queryset = source["queryset"]()
+    if patient_id is not None:
+        queryset = queryset.filter(**{source["patient"]: patient_id})
+    if allergen:
+        queryset = queryset.filter(
+            **{source["allergen"]: normalize_allergen_name(allergen)}
+        )
+
+    distribution = (
+        queryset.values(source["grade"])
+        .annotate(count=Count("id"))
+        .order_by(source["grade"])
+    )
+    data = {
+        "source": source_name,
+        "distribution": [
+            {
+                "grade": row[source["grade"]],
+                "label": source["labels"].get(row[source["grade"]]),
+                "count": row["count"],
+            }
+            for row in distribution
+        ],
+        "size_mm": queryset.aggregate(
+            count=Count(source["mm"]),
+            avg=Avg(source["mm"]),
+            min=Min(source["mm"]),
+            max=Max(source["mm"]),
+        ),
+    }
+
+    if patient_id is not None:
+        data["trend"] = list(
+            queryset.values(day=source["date"])
+            .annotate(**_trend_columns(source))
+            .order_by("day")
+        )
+    else:
+        patients = (
+            queryset.values(patient_pk=F(source["patient"]))
+            .annotate(**_trend_columns(source))
+            .order_by("-avg_grade", "patient_pk")[:limit]
+        )
+        data["patients"] = [
+            {"patient_id": row.pop("patient_pk"), **row} for row in patients
+        ]
+    return data
+
+
+MATRIX_VALUES = {"grade": "reaction_grade", "mm": "wheal_mm"}
+
+
+def _pivot(cells, row_order, col_order, layout):
+    """
+    Lay `{(row, col): value}` out over the given row and column orders,
+    either densely (a list per row, null for missing cells) or as
+    coordinate arrays of the filled cells.
+    """
+    cells = {key: value for key, value in cells.items() if value is not None}
+    row_index = {key: i for i, key in enumerate(row_order)}
+    col_index = {key: i for i, key in enumerate(col_order)}
+
+    if layout == "auto":
+        size = len(row_order) * len(col_order)
+        layout = "dense" if size and len(cells) * 2 >= size else "sparse"
+
+    if layout == "dense":
+        values = [[None] * len(col_order) for _ in row_order]
+        for (row, col), value in cells.items():
+            values[row_index[row]][col_index[col]] = value
+        return {"layout": "dense", "values": values}
+
+    coordinates = sorted(
+        (row_index[row], col_index[col], value) for (row, col), value in cells.items()
+    )
+    return {
+        "layout": "sparse",
+        "row": [row for row, _, _ in coordinates],
+        "col": [col for _, col, _ in coordinates],
+        "values": [value for _, _, value in coordinates],
+    }
+
+
+def patient_allergen_matrix(patient_id, value="grade", layout="auto"):
+    """
+    One patient's results as allergens (rows) by test date (columns),
+    fetched with a single values_list query.
+    """
+    rows = (
+        AllergenTest.objects.filter(patient_id=patient_id)
+        .values_list("allergen_id", "allergen__name", "test_date", MATRIX_VALUES[value])
+        .order_by()
+    )
+    names = {}
+    cells = {}
+    for allergen_id, name, test_date, result in rows:
+        names[allergen_id] = name
+        cells[(allergen_id, test_date)] = result
+
+    allergens = sorted(names, key=lambda pk: names[pk].casefold())
+    dates = sorted({test_date for _, test_date in cells})
+    return {
+        "value": value,
+        "rows": {"ids": allergens, "labels": [names[pk] for pk in allergens]},
+        "columns": {"test_dates": dates},
+        **_pivot(cells, allergens, dates, layout),
+    }
+
+
+def cohort_allergen_matrix(patient_ids, value="grade", layout="auto"):
+    """
+    Several patients' latest result per allergen as patients (rows) by
+    allergens (columns), fetched with a single values_list query.
+    """
+    rows = (
+        AllergenTest.objects.filter(patient_id__in=patient_ids)
+        .values_list(
+            "patient_id", "allergen_id", "allergen__name", MATRIX_VALUES[value]
+        )
+        .order_by("test_date", "id")
+    )
+    names = {}
+    cells = {}
+    for patient_id, allergen_id, name, result in rows:
+        names[allergen_id] = name
+        # Ordered by date, so the latest result for each pair wins.
+        cells[(patient_id, allergen_id)] = result
+
+    patients = sorted({patient_id for patient_id, _ in cells})
+    allergens = sorted(names, key=lambda pk: names[pk].casefold())
+    return {
+        "value": value,
+        "rows": {"ids": patients},
+        "columns": {"ids": allergens, "labels": [names[pk] for pk in allergens]},
+        **_pivot(cells, patients, allergens, layout),
+    }
@@ -0,0 +1,170 @@
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework import status
+from rest_framework.response import Response
+
+from api.conditional import not_modified, response_validators, set_validators
+from api.routers import pinned_to_primary, reads_from_replica
+
+# Responses are cached per patient under a version token that every write to
+# the patient's vials, injections, tests or authorizations replaces, so stale
+# entries are never read again and simply age out of both tiers. The versions
+# live in the shared tier only: with per-process versions, a write handled by
+# one worker would leave the others serving stale data. Without a shared tier
+# nothing is cached.
+#
+# With a read replica, a response computed from lagging replica rows could
+# land under the version bumped by the write it has not seen yet, so only
+# responses read from the primary are stored, and clients pinned to the
+# primary to read their own writes skip the lookup.
+
+VERSION_KEY = "patient-version:{}"
+# Entries are (data, etag); v2 keeps older (data, (etag, last_modified))
+# entries from being read after a deploy.
+RESPONSE_KEY = "patient-response:v2:{}:{}:{}"
+
+
+class LRUCache:
+    """
+    Small thread-safe in-process tier in front of the shared cache, so a
+    repeat load is answered from worker memory.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout, max_entries):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + timeout, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_local = LRUCache()
+
+
+def _timeout():
+    if _shared_cache() is None:
+        return 0
+    return getattr(settings, "RESPONSE_CACHE_TIMEOUT", 300)
+
+
+def _max_entries():
+    return getattr(settings, "RESPONSE_CACHE_LRU_SIZE", 1024)
+
+
+def _shared_cache():
+    alias = getattr(settings, "RESPONSE_CACHE_ALIAS", "")
+    return caches[alias] if alias else None
+
+
+def patient_version(patient_id):
+    versions = _shared_cache()
+    key = VERSION_KEY.format(patient_id)
+    version = versions.get(key)
+    if version is None:
+        versions.add(key, uuid.uuid4().hex, None)
+        version = versions.get(key)
+    return version
+
+
+def _bump(keys):
+    versions = _shared_cache()
+    if versions is not None:
+        versions.set_many({key: uuid.uuid4().hex for key in keys}, None)
+
+
+def invalidate_patients(patient_ids):
+    """
+    Retire the cached responses of `patient_ids`. The version is replaced
+    right away, so the writing transaction reads its own changes, and again
+    on commit, so nothing cached from the old rows in between survives.
+    """
+    keys = {VERSION_KEY.format(pk) for pk in patient_ids if pk is not None}
+    if not keys:
+        return
+    _bump(keys)
+    transaction.on_commit(lambda: _bump(keys))
+
+
+def clear_response_cache():
+    _local.clear()
+    shared = _shared_cache()
+    if shared is not None:
+        shared.clear()
+
+
+def cache_patient_response(patient_param):
+    """
+    Cache successful GET responses of a view method per patient, keyed by the
+    patient's current version and the full request URL. Validators set by
+    `conditional_get` are kept with the data, so matching conditional requests
+    get their 304 from the cache too. Requests without a numeric
+    `patient_param`, or made while no shared tier is configured, are passed
+    through uncached. Requests pinned to the primary are never answered from
+    the cache, and responses read from the replica are never stored.
+    """
+
+    def decorator(method):
+        @wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            timeout = _timeout()
+            patient_id = request.query_params.get(patient_param, "")
+            if not timeout or not patient_id.isdigit():
+                return method(view, request, *args, **kwargs)
+
+            url = hashlib.sha1(request.build_absolute_uri().encode()).hexdigest()
+            variant = f"{type(view).__name__}:{request.accepted_renderer.format}:{url}"
+            key = RESPONSE_KEY.format(patient_id, patient_version(patient_id), variant)
+            shared = _shared_cache()
+            entry = None
+            if not pinned_to_primary():
+                entry = _local.get(key)
+                if entry is None:
+                    entry = shared.get(key)
+                    if entry is not None:
+                        _local.set(key, entry, timeout, _max_entries())
+            if entry is not None:
+                data, etag = entry
+                if etag is None:
+                    return Response(data, status=status.HTTP_200_OK)
+                return not_modified(request, etag) or set_validators(
+                    Response(data, status=status.HTTP_200_OK), etag
+                )
+
+            response = method(view, request, *args, **kwargs)
+            if response.status_code == status.HTTP_200_OK and not reads_from_replica():
+                entry = (response.data, response_validators(response))
+                _local.set(key, entry, timeout, _max_entries())
+                shared.set(key, entry, timeout)
+            return response
+
+        return wrapper
+
+    return decorator
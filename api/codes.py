@@ -0,0 +1,233 @@
+import re
+from bisect import bisect_left
+from functools import lru_cache
+from pathlib import Path
+
+from django.conf import settings
+
+ICD10 = "icd10"
+CPT = "cpt"
+CODE_SYSTEMS = (ICD10, CPT)
+
+DEFAULT_CATALOG = Path(__file__).resolve().parent / "data" / "medical_codes.tsv"
+
+_FORMATS = {
+    # Category (letter, digit, alphanumeric), then up to four more characters.
+    ICD10: re.compile(r"^[A-Z][0-9][0-9A-Z](?:[0-9A-Z]{1,4})?$"),
+    # Five characters: Category I codes are digits, II end in F, III in T.
+    CPT: re.compile(r"^[0-9]{4}[0-9FT]$"),
+}
+_SEPARATORS = re.compile(r"[\s,;|]+")
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def _key(code):
+    return code.strip().upper().replace(".", "")
+
+
+def normalize_code(system, code):
+    """
+    Return `code` in its canonical form (ICD-10 codes dotted after the
+    category), or None when it is not a well formed code of `system`.
+    """
+    key = _key(code)
+    if not _FORMATS[system].match(key):
+        return None
+    if system == ICD10 and len(key) > 3:
+        return f"{key[:3]}.{key[3:]}"
+    return key
+
+
+def extract_codes(system, text):
+    """
+    Pull the well formed codes of `system` out of free text such as
+    "J30.1 - Allergic rhinitis, J45.909", in order and without duplicates.
+    """
+    codes = {}
+    for token in _SEPARATORS.split(text or ""):
+        code = normalize_code(system, token.strip("-:()[]"))
+        if code:
+            codes[code] = None
+    return list(codes)
+
+
+class CodeCatalog:
+    """
+    Read-only code catalog held in sorted arrays, so code and description
+    prefix lookups are a bisect plus a short scan with no database access.
+    """
+
+    def __init__(self, rows):
+        rows = sorted(
+            (system, normalize_code(system, code), description)
+            for system, code, description in rows
+            if system in _FORMATS and normalize_code(system, code)
+        )
+        self.entries = [
+            (system, code, description) for system, code, description in rows
+        ]
+        self.descriptions = {
+            (system, code): description for system, code, description in rows
+        }
+        # (system, undotted code) and (word, index) keys, both sorted.
+        self.code_keys = [(system, _key(code)) for system, code, _ in rows]
+        self.word_keys = sorted(
+            {
+                (word, index)
+                for index, (_, _, description) in enumerate(rows)
+                for word in _WORD.findall(description.lower())
+            }
+        )
+
+    def __len__(self):
+        return len(self.entries)
+
+    def describe(self, system, code):
+        return self.descriptions.get((system, code))
+
+    def _by_code(self, system, prefix):
+        start = bisect_left(self.code_keys, (system, prefix))
+        for index in range(start, len(self.code_keys)):
+            key_system, key = self.code_keys[index]
+            if key_system != system or not key.startswith(prefix):
+                return
+            yield index
+
+    def _by_word(self, prefix):
+        start = bisect_left(self.word_keys, (prefix,))
+        for position in range(start, len(self.word_keys)):
+            word, index = self.word_keys[position]
+            if not word.startswith(prefix):
+                return
+            yield index
+
+    def search(self, query, system=None, limit=20):
+        """
+        Entries whose code starts with `query`, or whose description has
+        words starting with every word of `query`.
+        """
+        systems = [system] if system else CODE_SYSTEMS
+        prefix = _key(query)
+        matches = []
+        for code_system in systems:
+            matches.extend(self._by_code(code_system, prefix))
+
+        words = _WORD.findall(query.lower())
+        if not matches and words:
+            candidates = set(self._by_word(words[0]))
+            for word in words[1:]:
+                candidates &= set(self._by_word(word))
+            matches = sorted(
+                index
+                for index in candidates
+                if system is None or self.entries[index][0] == system
+            )
+
+        return [
+            {"system": code_system, "code": code, "description": description}
+            for code_system, code, description in (
+                self.entries[index] for index in matches[:limit]
+            )
+        ]
+
+
+def _read_catalog(path):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip() or line.startswith("#"):
+                continue
+            system, code, description = line.rstrip("\n").split("\t", 2)
+            yield system.strip().lower(), code, description.strip()
+
+
+@lru_cache(maxsize=None)
+def code_catalog():
+    """
+    The process-wide catalog, read once from MEDICAL_CODE_CATALOG.
+    """
+    path = getattr(settings, "MEDICAL_CODE_CATALOG", None) or DEFAULT_CATALOG
+    return CodeCatalog(_read_catalog(path))
+
+
+def authorization_codes(entry):
+    """
+    The (system, code) pairs written on an authorization entry.
+    """
+    return {(ICD10, code) for code in extract_codes(ICD10, entry.icd10_codes)} | {
+        (CPT, code) for code in extract_codes(CPT, entry.procedure_codes)
+    }
+
+
+def sync_authorization_codes(entries):
+    """
+    Bring the AuthorizationCode rows of `entries` in line with their text
+    fields, touching only the codes that changed.
+    """
+    from api.models import AuthorizationCode
+
+    wanted = {
+        (entry.pk, system, code)
+        for entry in entries
+        for system, code in authorization_codes(entry)
+    }
+    existing = {
+        (entry_id, system, code): pk
+        for pk, entry_id, system, code in AuthorizationCode.objects.filter(
+            authorization_entry__in=[entry.pk for entry in entries]
+        ).values_list("id", "authorization_entry_id", "system", "code")
+    }
+
+    stale = [pk for key, pk in existing.items() if key not in wanted]
+    if stale:
+        AuthorizationCode.objects.filter(id__in=stale).delete()
+    AuthorizationCode.objects.bulk_create(
+        AuthorizationCode(authorization_entry_id=entry_id, system=system, code=code)
+        for entry_id, system, code in wanted - existing.keys()
+    )
+
+
+def diagnosis_code_texts(value):
+    """
+    The strings of a Vial.diagnosis_codes value that can carry codes. Besides
+    the usual list of "J30.1 - Allergic rhinitis" strings, older vials hold a
+    single free text string or {"code": ..., "description": ...} entries.
+    """
+    for item in value if isinstance(value, list) else [value]:
+        if isinstance(item, dict):
+            item = item.get("code")
+        if isinstance(item, str) and item.strip():
+            yield item
+
+
+def vial_codes(vial):
+    """
+    The ICD-10 codes written in a vial's diagnosis_codes.
+    """
+    codes = {}
+    for text in diagnosis_code_texts(vial.diagnosis_codes):
+        codes.update(dict.fromkeys(extract_codes(ICD10, text)))
+    return list(codes)
+
+
+def sync_vial_codes(vials):
+    """
+    Bring the VialDiagnosisCode rows of `vials` in line with their
+    diagnosis_codes, touching only the codes that changed.
+    """
+    from api.models import VialDiagnosisCode
+
+    wanted = {(vial.pk, code) for vial in vials for code in vial_codes(vial)}
+    existing = {
+        (vial_id, code): pk
+        for pk, vial_id, code in VialDiagnosisCode.objects.filter(
+            vial__in=[vial.pk for vial in vials]
+        ).values_list("id", "vial_id", "code")
+    }
+
+    stale = [pk for key, pk in existing.items() if key not in wanted]
+    if stale:
+        VialDiagnosisCode.objects.filter(id__in=stale).delete()
+    VialDiagnosisCode.objects.bulk_create(
+        VialDiagnosisCode(vial_id=vial_id, code=code)
+        for vial_id, code in wanted - existing.keys()
+    )
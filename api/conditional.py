@@ -0,0 +1,89 @@
+from functools import wraps
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from rest_framework import status
+
+
+def list_validators(queryset, timestamps=("updated_at",), variant=""):
+    """
+    Return the ETag for the rows of `queryset` from a single aggregate. For
+    each `timestamps` field, the newest value catches inserts and updates and
+    the row count catches deletes; related paths such as
+    "procedures__updated_at" cover rows a response embeds.
+
+    No Last-Modified is derived: the newest timestamp does not move when a
+    row other than the newest is deleted, so If-Modified-Since would answer
+    304 with stale data.
+    """
+    aggregates = {}
+    for index, field in enumerate(timestamps):
+        relation = field.rpartition("__")[0]
+        pk = f"{relation}__id" if relation else "id"
+        aggregates[f"count_{index}"] = Count(pk, distinct=True)
+        aggregates[f"latest_{index}"] = Max(field)
+    row = queryset.order_by().aggregate(**aggregates)
+
+    parts = []
+    for index in range(len(timestamps)):
+        stamp = row[f"latest_{index}"]
+        micros = int(stamp.timestamp() * 1_000_000) if stamp else 0
+        parts += [row[f"count_{index}"], micros]
+    tag = "-".join(f"{part:x}" for part in parts)
+    return f'W/"{tag}-{variant}"' if variant else f'W/"{tag}"'
+
+
+def set_validators(response, etag):
+    response["ETag"] = etag
+    return response
+
+
+def not_modified(request, etag):
+    """
+    The 304 (or 412) response for a request whose ETag matches, or None.
+    """
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        set_validators(response, etag)
+    return response
+
+
+def response_validators(response):
+    """
+    Read back the ETag `conditional_get` put on a response, or None.
+    """
+    return response.get("ETag")
+
+
+def conditional_get(*timestamps):
+    """
+    Answer GETs of a list view with 304 Not Modified when the client's
+    If-None-Match still matches the view's `get_queryset()`, before anything
+    is serialized. The check costs one aggregate query; views whose
+    get_queryset() returns None are passed through.
+    """
+    timestamps = timestamps or ("updated_at",)
+
+    def decorator(method):
+        @wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            queryset = view.get_queryset()
+            if queryset is None:
+                return method(view, request, *args, **kwargs)
+
+            # The body differs per renderer, so the validators do as well.
+            etag = list_validators(
+                queryset, timestamps, variant=request.accepted_renderer.format
+            )
+            response = not_modified(request, etag)
+            if response is not None:
+                return response
+
+            response = method(view, request, *args, **kwargs)
+            if response.status_code == status.HTTP_200_OK:
+                set_validators(response, etag)
+            return response
+
+        return wrapper
+
+    return decorator
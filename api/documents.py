@@ -0,0 +1,242 @@
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from api.models import DocumentJob
+
+logger = logging.getLogger(__name__)
+
+# The PDF tools are optional; each step is skipped when its tool is missing.
+QPDF = "qpdf"
+PDFTOPPM = "pdftoppm"
+PDFTOTEXT = "pdftotext"
+
+THUMBNAIL_SIZE = 256
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+def enqueue_document_jobs(entries):
+    """
+    Queue processing for every entry that has an uploaded document. Jobs are
+    plain rows, so they only become visible to workers when the caller's
+    transaction commits.
+    """
+    DocumentJob.objects.bulk_create(
+        DocumentJob(authorization_entry=entry)
+        for entry in entries
+        if entry.uploaded_doc
+    )
+
+
+def claim_document_jobs(batch_size, stale_after=timedelta(minutes=30)):
+    """
+    Mark up to `batch_size` pending jobs as running and return their ids.
+    Rows locked by another worker are skipped, and running jobs that have not
+    moved for `stale_after` are taken over, since their worker died.
+    """
+    stale = timezone.now() - stale_after
+    with transaction.atomic():
+        ids = list(
+            DocumentJob.objects.select_for_update(skip_locked=True)
+            .filter(
+                Q(status=DocumentJob.PENDING)
+                | Q(status=DocumentJob.RUNNING, updated_at__lt=stale)
+            )
+            .order_by("id")
+            .values_list("id", flat=True)[:batch_size]
+        )
+        DocumentJob.objects.filter(id__in=ids).update(
+            status=DocumentJob.RUNNING,
+            attempts=F("attempts") + 1,
+            updated_at=timezone.now(),
+        )
+    return ids
+
+
+def run_document_job(job_id, max_attempts=3):
+    """
+    Process one claimed job. Failures are retried until `max_attempts`.
+    Returns None when the job is gone, as it is once its authorization entry
+    has been deleted.
+    """
+    try:
+        job = DocumentJob.objects.select_related("authorization_entry").get(pk=job_id)
+    except DocumentJob.DoesNotExist:
+        logger.info("Document job %s was deleted, skipping", job_id)
+        return None
+
+    try:
+        process_document(job.authorization_entry)
+    except Exception as exc:
+        logger.exception("Document job %s failed", job_id)
+        DocumentJob.objects.filter(pk=job_id).update(
+            status=(
+                DocumentJob.FAILED
+                if job.attempts >= max_attempts
+                else DocumentJob.PENDING
+            ),
+            last_error=str(exc),
+            updated_at=timezone.now(),
+        )
+        return False
+
+    DocumentJob.objects.filter(pk=job_id).update(
+        status=DocumentJob.DONE, last_error="", updated_at=timezone.now()
+    )
+    return True
+
+
+def _tool(name):
+    return shutil.which(name)
+
+
+def _run(*args):
+    timeout = getattr(settings, "DOCUMENT_TOOL_TIMEOUT", 120)
+    return subprocess.run(args, capture_output=True, timeout=timeout)
+
+
+def _is_pdf(path):
+    with open(path, "rb") as f:
+        return f.read(5) == b"%PDF-"
+
+
+def compress_pdf(source, workdir):
+    """
+    Linearize and recompress `source` with qpdf. Returns the path of the
+    result, or None when qpdf is missing, fails or does not shrink the file.
+    """
+    qpdf = _tool(QPDF)
+    if qpdf is None:
+        return None
+    target = os.path.join(workdir, "compressed.pdf")
+    result = _run(
+        qpdf,
+        "--linearize",
+        "--object-streams=generate",
+        "--compress-streams=y",
+        "--recompress-flate",
+        source,
+        target,
+    )
+    # Exit status 3 means qpdf succeeded with warnings.
+    if result.returncode not in (0, 3) or not os.path.exists(target):
+        logger.warning("qpdf failed: %s", result.stderr.decode(errors="replace"))
+        return None
+    if os.path.getsize(target) >= os.path.getsize(source):
+        return None
+    return target
+
+
+def render_thumbnail(source, workdir):
+    """
+    Render the first page of `source` as a PNG with pdftoppm.
+    """
+    pdftoppm = _tool(PDFTOPPM)
+    if pdftoppm is None:
+        return None
+    prefix = os.path.join(workdir, "thumbnail")
+    result = _run(
+        pdftoppm,
+        "-png",
+        "-f",
+        "1",
+        "-l",
+        "1",
+        "-singlefile",
+        "-scale-to",
+        str(THUMBNAIL_SIZE),
+        source,
+        prefix,
+    )
+    target = f"{prefix}.png"
+    if result.returncode != 0 or not os.path.exists(target):
+        logger.warning("pdftoppm failed: %s", result.stderr.decode(errors="replace"))
+        return None
+    return target
+
+
+def extract_text(source):
+    """
+    Return the text layer of `source` from pdftotext, or None.
+    """
+    pdftotext = _tool(PDFTOTEXT)
+    if pdftotext is None:
+        return None
+    result = _run(pdftotext, "-enc", "UTF-8", "-layout", source, "-")
+    if result.returncode != 0:
+        logger.warning("pdftotext failed: %s", result.stderr.decode(errors="replace"))
+        return None
+    return result.stdout.decode("utf-8", errors="replace")
+
+
+def process_document(entry):
+    """
+    Compress the entry's uploaded PDF in place, store a first-page thumbnail
+    and its text. Files other than PDFs are only marked as processed.
+    """
+    if not entry.uploaded_doc:
+        return
+
+    released = []
+    stored = []
+    update_fields = ["document_processed_at"]
+    with tempfile.TemporaryDirectory() as workdir:
+        source = os.path.join(workdir, "source.pdf")
+        with entry.uploaded_doc.open("rb") as upload, open(source, "wb") as copy:
+            shutil.copyfileobj(upload, copy, COPY_CHUNK_SIZE)
+
+        if _is_pdf(source):
+            compressed = compress_pdf(source, workdir)
+            if compressed is not None:
+                released.append(("uploaded_doc", entry.uploaded_doc.name))
+                with open(compressed, "rb") as f:
+                    entry.uploaded_doc.save(
+                        os.path.basename(entry.uploaded_doc.name), File(f), save=False
+                    )
+                stored.append(entry.uploaded_doc)
+                update_fields.append("uploaded_doc")
+                source = compressed
+
+            thumbnail = render_thumbnail(source, workdir)
+            if thumbnail is not None:
+                if entry.document_thumbnail:
+                    released.append(
+                        ("document_thumbnail", entry.document_thumbnail.name)
+                    )
+                with open(thumbnail, "rb") as f:
+                    entry.document_thumbnail.save(
+                        f"{entry.pk}.png", File(f), save=False
+                    )
+                stored.append(entry.document_thumbnail)
+                update_fields.append("document_thumbnail")
+
+            text = extract_text(source)
+            if text is not None:
+                entry.document_text = text
+                update_fields.append("document_text")
+
+    entry.document_processed_at = timezone.now()
+    try:
+        with transaction.atomic():
+            entry.save(update_fields=update_fields)
+            # The files were replaced through FieldFile.save, which the
+            # replaced-document signal does not see, so release them here.
+            for field, name in released:
+                current = getattr(entry, field)
+                if name != current.name:
+                    current.storage.delete(name)
+    except Exception:
+        # Most likely the entry was deleted while the job ran. Nothing points
+        # at the new files then, so drop the references they took.
+        for file in stored:
+            file.storage.delete(file.name)
+        raise
@@ -0,0 +1,137 @@
+import mimetypes
+import os
+import posixpath
+import re
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date
+
+CHUNK_SIZE = 64 * 1024
+
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+_DIGEST = re.compile(r"^[0-9a-f]{64}$")
+
+
+def document_etag(name, size, modified):
+    """
+    Strong ETag for a stored document. Content-addressed names carry their
+    SHA-256; older files fall back to size and modification time.
+    """
+    stem = os.path.splitext(posixpath.basename(name))[0]
+    if _DIGEST.match(stem):
+        return f'"{stem}"'
+    return f'"{size:x}-{int(modified):x}"'
+
+
+def parse_range(header, size):
+    """
+    Return `(start, end)` for a single `bytes=` range, None when the header
+    should be ignored (missing, malformed or multiple ranges), or False when
+    the range cannot be satisfied.
+
+    A last position before the first is syntactically invalid and ignored
+    (RFC 7233, section 2.1); only a range starting past the end of the file,
+    or an empty suffix, is unsatisfiable.
+    """
+    match = _RANGE.match((header or "").strip())
+    if not match or match.group(0) == "bytes=-":
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        if last and int(last) < start:
+            return None
+        end = min(int(last), size - 1) if last else size - 1
+    else:
+        # Suffix range: the last N bytes.
+        if not int(last):
+            return False
+        start = max(size - int(last), 0)
+        end = size - 1
+    if start >= size:
+        return False
+    return start, end
+
+
+def _read_range(file, start, length):
+    with file:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def _sendfile_response(storage, name):
+    backend = getattr(settings, "DOCUMENT_SENDFILE", "")
+    if backend == "nginx":
+        prefix = getattr(settings, "DOCUMENT_SENDFILE_PREFIX", "/protected/")
+        response = HttpResponse()
+        response["X-Accel-Redirect"] = posixpath.join(prefix, name)
+        return response
+    if backend == "apache":
+        response = HttpResponse()
+        response["X-Sendfile"] = storage.path(name)
+        return response
+    return None
+
+
+def serve_document(request, field_file, filename=None):
+    """
+    Respond with a stored file without buffering it in the worker.
+
+    Conditional requests are answered from the ETag alone. When
+    DOCUMENT_SENDFILE is "nginx" or "apache" the transfer, including ranges,
+    is handed to the front-end server with X-Accel-Redirect or X-Sendfile.
+    Otherwise single byte ranges are streamed in chunks and full downloads
+    go through FileResponse, which uses the server's sendfile support.
+    """
+    storage = field_file.storage
+    name = field_file.name
+    path = storage.path(name)
+    stat = os.stat(path)
+    etag = document_etag(name, stat.st_size, stat.st_mtime)
+
+    response = get_conditional_response(
+        request, etag=etag, last_modified=int(stat.st_mtime)
+    )
+    if response is None:
+        response = _sendfile_response(storage, name)
+    if response is None:
+        byte_range = None
+        if_range = request.META.get("HTTP_IF_RANGE")
+        if if_range is None or if_range == etag:
+            byte_range = parse_range(request.META.get("HTTP_RANGE"), stat.st_size)
+
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{stat.st_size}"
+        elif byte_range:
+            start, end = byte_range
+            length = end - start + 1
+            response = StreamingHttpResponse(
+                _read_range(open(path, "rb"), start, length), status=206
+            )
+            response["Content-Range"] = f"bytes {start}-{end}/{stat.st_size}"
+            response["Content-Length"] = str(length)
+        else:
+            response = FileResponse(open(path, "rb"))
+
+    filename = filename or posixpath.basename(name)
+    if response.status_code in (200, 206):
+        content_type, encoding = mimetypes.guess_type(filename)
+        response["Content-Type"] = content_type or "application/octet-stream"
+        if encoding:
+            # Served as stored; do not let clients decode it on the fly.
+            response["Content-Type"] = "application/octet-stream"
+        response["Content-Disposition"] = content_disposition_header(False, filename)
+    response["Accept-Ranges"] = "bytes"
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(stat.st_mtime)
+    # Patient documents: never cache in shared caches, revalidate each time.
+    response["Cache-Control"] = "private, no-cache"
+    return response
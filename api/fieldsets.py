@@ -0,0 +1,83 @@
+from rest_framework import status
+from rest_framework.response import Response
+
+FIELDS_PARAM = "fields"
+EXCLUDE_PARAM = "exclude"
+
+
+def _names(value):
+    return {name.strip() for name in value.split(",") if name.strip()}
+
+
+class Fieldset:
+    """
+    The output keys a client asked for with `?fields=a,b` and/or
+    `?exclude=c`. Unknown names are ignored, as with the serializer fields.
+    """
+
+    def __init__(self, fields=None, exclude=()):
+        self.fields = None if fields is None else set(fields)
+        self.exclude = set(exclude)
+
+    @classmethod
+    def from_request(cls, request):
+        params = request.query_params
+        fields = params.get(FIELDS_PARAM)
+        return cls(
+            _names(fields) if fields is not None else None,
+            _names(params.get(EXCLUDE_PARAM, "")),
+        )
+
+    def __bool__(self):
+        return self.fields is not None or bool(self.exclude)
+
+    def wants(self, name):
+        return (self.fields is None or name in self.fields) and (
+            name not in self.exclude
+        )
+
+    def pick(self, row):
+        return {key: value for key, value in row.items() if self.wants(key)}
+
+    def trim(self, data):
+        """
+        Drop unwanted keys from response data: the rows of a list or of a
+        keyset page's "results", or the keys of a single object. Returns new
+        containers, so cached data is never modified.
+        """
+        if not self:
+            return data
+        if isinstance(data, list):
+            return [self.pick(row) if isinstance(row, dict) else row for row in data]
+        if isinstance(data, dict):
+            if isinstance(data.get("results"), list) and "next" in data:
+                return {**data, "results": self.trim(data["results"])}
+            return self.pick(data)
+        return data
+
+
+ALL_FIELDS = Fieldset()
+
+
+class SparseFieldsetMixin:
+    """
+    View mixin that applies `?fields=` / `?exclude=` to successful GET
+    responses. Handlers can read `self.fieldset` to skip columns and queries
+    for keys that will be dropped anyway; the output is trimmed either way.
+    """
+
+    fieldset = ALL_FIELDS
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method in ("GET", "HEAD"):
+            self.fieldset = Fieldset.from_request(request)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if (
+            self.fieldset
+            and isinstance(response, Response)
+            and response.status_code == status.HTTP_200_OK
+        ):
+            response.data = self.fieldset.trim(response.data)
+        return super().finalize_response(request, response, *args, **kwargs)
@@ -0,0 +1,65 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Max
+
+from api.models import (
+    AllergenTest,
+    AllergyTemplate,
+    AuthorizationEntry,
+    Patient,
+    PatientSummary,
+)
+
+
+class Command(BaseCommand):
+    help = "Rebuild the per-patient summary rows used by the patient search grid"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of summary rows written per batch.",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+
+        # One grouped query per source table rather than one per patient.
+        tests = dict(
+            AllergenTest.objects.values("patient_id")
+            .annotate(latest=Max("test_date"))
+            .values_list("patient_id", "latest")
+        )
+        injections = {
+            row["vial__patient_id"]: row
+            for row in AllergyTemplate.objects.values("vial__patient_id").annotate(
+                latest=Max("date"), visits=Count("id")
+            )
+        }
+        authorizations = dict(
+            AuthorizationEntry.objects.values("patient_id")
+            .annotate(latest=Max("expiration_date"))
+            .values_list("patient_id", "latest")
+        )
+
+        summaries = []
+        for patient_id in Patient.objects.values_list("id", flat=True).iterator():
+            injection = injections.get(patient_id, {})
+            summaries.append(
+                PatientSummary(
+                    patient_id=patient_id,
+                    last_test_date=tests.get(patient_id),
+                    last_injection_date=injection.get("latest"),
+                    visit_count=injection.get("visits", 0),
+                    auth_expiration_date=authorizations.get(patient_id),
+                )
+            )
+
+        with transaction.atomic():
+            PatientSummary.objects.all().delete()
+            PatientSummary.objects.bulk_create(summaries, batch_size=batch_size)
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Backfilled {len(summaries)} patient summaries.")
+        )
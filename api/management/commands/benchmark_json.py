@@ -0,0 +1,100 @@
+import gzip
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from api.middleware import brotli
+from api.models import AllergyTemplate, Vial
+from api.renderers import FastJSONRenderer, orjson
+from api.serializers import AllergyTemplateSerializer, VialSerializer
+
+
+class Command(BaseCommand):
+    help = "Compare JSON encode time and response size of the API renderers"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--source",
+            choices=["templates", "vials"],
+            default="templates",
+            help="Which list payload to encode.",
+        )
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=5000,
+            help="Number of stored rows to serialize.",
+        )
+        parser.add_argument(
+            "--synthetic",
+            type=int,
+            help="Serialize this many unsaved injection rows instead of stored ones.",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=20,
+            help="Encode the payload this many times and report the best run.",
+        )
+
+    def payload(self, options):
+        if options["synthetic"]:
+            vial = Vial(id=1, patient_id=1, name="Trees / Grasses")
+            templates = [
+                AllergyTemplate(
+                    id=index,
+                    vial=vial,
+                    dose="0.15",
+                    date=date(2024, 1, 1) + timedelta(days=index % 365),
+                    arm="LR"[index % 2],
+                    peak_flow="350",
+                    tech_id="T1",
+                    reaction="NR",
+                    notes="Tolerated well, no local reaction.",
+                )
+                for index in range(options["synthetic"])
+            ]
+            return AllergyTemplateSerializer(templates, many=True).data
+        if options["source"] == "vials":
+            vials = Vial.objects.order_by("-id")[: options["limit"]]
+            return VialSerializer(vials, many=True).data
+        templates = AllergyTemplate.objects.select_related("vial").order_by("-id")
+        return AllergyTemplateSerializer(templates[: options["limit"]], many=True).data
+
+    def best_time(self, renderer, data, repeat):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            body = renderer.render(data, "application/json")
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best, body
+
+    def handle(self, *args, **options):
+        data = self.payload(options)
+        self.stdout.write(f"Encoding {len(data)} rows, best of {options['repeat']}.")
+        if orjson is None:
+            self.stdout.write("orjson is not installed; both renderers use json.")
+
+        results = {}
+        for name, renderer in [
+            ("json", JSONRenderer()),
+            ("fast", FastJSONRenderer()),
+        ]:
+            elapsed, body = self.best_time(renderer, data, options["repeat"])
+            results[name] = body
+            sizes = [f"{len(body)} B", f"gzip {len(gzip.compress(body))} B"]
+            if brotli is not None:
+                sizes.append(f"br {len(brotli.compress(body))} B")
+            self.stdout.write(
+                f"{name:>5}: {elapsed * 1000:8.2f} ms  {', '.join(sizes)}"
+            )
+
+        if results["json"] == results["fast"]:
+            self.stdout.write(
+                self.style.SUCCESS("Both renderers produce identical bytes.")
+            )
+        else:
+            self.stdout.write(self.style.WARNING("The renderers' output differs."))
@@ -0,0 +1,92 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.models import AllergenTest, AllergyTemplate, Vial
+from api.projections import (
+    ALLERGEN_TEST_PROJECTION,
+    ALLERGY_TEMPLATE_PROJECTION,
+    VIAL_PROJECTION,
+)
+from api.renderers import FastJSONRenderer
+from api.serializers import (
+    AllergenTestSerializer,
+    AllergyTemplateSerializer,
+    VialSerializer,
+)
+
+LISTS = {
+    "vials": (Vial.objects.all, VialSerializer, VIAL_PROJECTION),
+    "templates": (
+        lambda: AllergyTemplate.objects.select_related("vial"),
+        AllergyTemplateSerializer,
+        ALLERGY_TEMPLATE_PROJECTION,
+    ),
+    "tests": (
+        lambda: AllergenTest.objects.select_related("allergen"),
+        AllergenTestSerializer,
+        ALLERGEN_TEST_PROJECTION,
+    ),
+}
+
+
+class Command(BaseCommand):
+    help = "Compare list throughput of the model serializers and values() projections"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--list",
+            choices=sorted(LISTS),
+            action="append",
+            help="List to benchmark; may be repeated. Defaults to all of them.",
+        )
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=5000,
+            help="Number of stored rows to read per run.",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=5,
+            help="Runs per path; the best one is reported.",
+        )
+
+    def best_time(self, build, repeat):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            body = FastJSONRenderer().render(build())
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best, body
+
+    def handle(self, *args, **options):
+        limit = options["limit"]
+        for name in options["list"] or sorted(LISTS):
+            queryset, serializer_class, projection = LISTS[name]
+            rows = queryset().order_by("-id")[:limit]
+            count = rows.count()
+            if not count:
+                self.stdout.write(f"{name}: no rows, skipped.")
+                continue
+
+            # Query, serialization and rendering, as a list response does.
+            # Querysets are cloned so every run hits the database.
+            serializer_time, expected = self.best_time(
+                lambda: serializer_class(rows.all(), many=True).data,
+                options["repeat"],
+            )
+            projection_time, body = self.best_time(
+                lambda: projection.rows(projection.values(rows.all())),
+                options["repeat"],
+            )
+            self.stdout.write(
+                f"{name}: {count} rows, "
+                f"serializer {count / serializer_time:,.0f} rows/s, "
+                f"projection {count / projection_time:,.0f} rows/s "
+                f"({serializer_time / projection_time:.1f}x)"
+            )
+            if body != expected:
+                self.stdout.write(self.style.WARNING(f"{name}: output differs."))
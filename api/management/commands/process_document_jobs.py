@@ -0,0 +1,71 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from api.documents import claim_document_jobs, run_document_job
+
+
+class Command(BaseCommand):
+    help = (
+        "Process queued authorization documents: compress and linearize PDFs, "
+        "render thumbnails and extract text"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once the queue is empty instead of polling for new jobs.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=10,
+            help="Number of jobs claimed at a time.",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=5.0,
+            help="Seconds to wait before polling an empty queue again.",
+        )
+        parser.add_argument(
+            "--max-attempts",
+            type=int,
+            default=3,
+            help="Attempts before a job is marked failed.",
+        )
+        parser.add_argument(
+            "--stale-after",
+            type=int,
+            default=30,
+            help="Minutes after which a running job is considered abandoned.",
+        )
+
+    def handle(self, *args, **options):
+        stale_after = timedelta(minutes=options["stale_after"])
+        processed = failed = skipped = 0
+        while True:
+            job_ids = claim_document_jobs(options["batch_size"], stale_after)
+            if not job_ids:
+                if options["once"]:
+                    break
+                time.sleep(options["poll_interval"])
+                continue
+
+            for job_id in job_ids:
+                result = run_document_job(job_id, max_attempts=options["max_attempts"])
+                if result is None:
+                    skipped += 1
+                elif result:
+                    processed += 1
+                else:
+                    failed += 1
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Processed {processed} documents, {failed} failed, "
+                f"{skipped} skipped."
+            )
+        )
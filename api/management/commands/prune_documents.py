@@ -0,0 +1,50 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from api.models import AuthorizationEntry
+from api.storage import ContentAddressedStorage
+
+DOCUMENT_FIELDS = ("uploaded_doc", "document_thumbnail")
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete stored authorization documents that nothing references, such "
+        "as files of uploads whose transaction rolled back"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--grace-hours",
+            type=int,
+            default=24,
+            help="Keep files younger than this, so uploads in progress are spared.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="List the unreferenced files without deleting them.",
+        )
+
+    def handle(self, *args, **options):
+        grace = timedelta(hours=options["grace_hours"])
+        storages = {}
+        for name in DOCUMENT_FIELDS:
+            field = AuthorizationEntry._meta.get_field(name)
+            storages.setdefault(field.storage, set()).add(field.upload_to)
+
+        pruned = []
+        for storage, directories in storages.items():
+            if not isinstance(storage, ContentAddressedStorage):
+                continue
+            pruned += storage.prune(
+                sorted(directories), grace, dry_run=options["dry_run"]
+            )
+
+        for name in pruned:
+            self.stdout.write(name)
+        verb = "Would delete" if options["dry_run"] else "Deleted"
+        self.stdout.write(
+            self.style.SUCCESS(f"{verb} {len(pruned)} unreferenced files.")
+        )
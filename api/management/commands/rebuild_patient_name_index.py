@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.models import Patient, PatientNameToken
+from api.search import NAME_FIELDS, name_tokens
+
+
+class Command(BaseCommand):
+    help = "Rebuild the trigram index used by the patient name search"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of patients read and token rows written per batch.",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        patients = Patient.objects.order_by("id").values_list("id", *NAME_FIELDS)
+
+        indexed = 0
+        with transaction.atomic():
+            PatientNameToken.objects.all().delete()
+
+            rows = []
+            for patient_id, *parts in patients.iterator(chunk_size=batch_size):
+                rows.extend(
+                    PatientNameToken(patient_id=patient_id, token=token)
+                    for token in name_tokens(*parts)
+                )
+                indexed += 1
+                if len(rows) >= batch_size:
+                    PatientNameToken.objects.bulk_create(rows, batch_size=batch_size)
+                    rows = []
+            PatientNameToken.objects.bulk_create(rows, batch_size=batch_size)
+
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} patient names."))
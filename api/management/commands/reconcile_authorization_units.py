@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from api.models import ProcedureDetail
+from api.units import reconcile_consumed_units
+
+
+class Command(BaseCommand):
+    help = "Recount consumed units of authorized procedures from logged injections"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--patient",
+            type=int,
+            help="Only reconcile the procedures of this patient.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of procedures checked per batch.",
+        )
+
+    def handle(self, *args, **options):
+        procedures = ProcedureDetail.objects.all()
+        if options["patient"]:
+            procedures = procedures.filter(
+                authorization_entry__patient_id=options["patient"]
+            )
+
+        corrected = reconcile_consumed_units(
+            procedures, batch_size=options["batch_size"]
+        )
+        self.stdout.write(
+            self.style.SUCCESS(f"Corrected consumed units on {corrected} procedures.")
+        )
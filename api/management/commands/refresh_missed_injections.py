@@ -0,0 +1,56 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.models import MissedInjectionSnapshot
+from api.reports import refresh_missed_injection_snapshot
+
+
+class Command(BaseCommand):
+    help = "Refresh the missed injection worklist snapshot (run nightly)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--date",
+            help="Snapshot date as YYYY-MM-DD. Defaults to today.",
+        )
+        parser.add_argument(
+            "--keep-days",
+            type=int,
+            default=30,
+            help=(
+                "Delete snapshots older than this many days. 0 keeps everything. "
+                "Ignored with --date, so a back-filled snapshot is never pruned."
+            ),
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of snapshot rows written per batch.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            snapshot_date = (
+                date.fromisoformat(options["date"]) if options["date"] else date.today()
+            )
+        except ValueError:
+            raise CommandError("--date must be formatted as YYYY-MM-DD.")
+
+        written = refresh_missed_injection_snapshot(
+            snapshot_date, batch_size=options["batch_size"]
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Stored {written} overdue patients for {snapshot_date.isoformat()}."
+            )
+        )
+
+        if options["keep_days"] > 0 and not options["date"]:
+            cutoff = date.today() - timedelta(days=options["keep_days"])
+            deleted, _ = MissedInjectionSnapshot.objects.filter(
+                snapshot_date__lt=cutoff
+            ).delete()
+            if deleted:
+                self.stdout.write(f"Pruned {deleted} snapshot rows before {cutoff}.")
@@ -0,0 +1,126 @@
+import re
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_sequence, compress_string
+
+# Brotli is optional; without it responses are gzipped.
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+_ACCEPTS = re.compile(r"\s*([a-z*]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?\s*")
+
+DEFAULT_CONTENT_TYPES = (
+    "application/json",
+    "text/csv",
+    "text/html",
+    "text/plain",
+)
+
+
+def accepted_encodings(header):
+    """
+    The codings a client accepts from its Accept-Encoding header, ignoring
+    those it refuses with q=0.
+    """
+    accepted = set()
+    for item in header.lower().split(","):
+        match = _ACCEPTS.fullmatch(item)
+        if not match:
+            continue
+        coding, quality = match.groups()
+        try:
+            if quality is not None and float(quality) == 0:
+                continue
+        except ValueError:
+            continue
+        accepted.add(coding)
+    return accepted
+
+
+def _brotli_sequence(sequence):
+    compressor = brotli.Compressor()
+    for chunk in sequence:
+        data = compressor.process(chunk)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+class CompressionMiddleware:
+    """
+    Compress API responses with Brotli when it is installed and accepted,
+    gzip otherwise. Only types in COMPRESSION_CONTENT_TYPES are touched, and
+    buffered bodies below COMPRESSION_MIN_SIZE bytes are sent as they are.
+    Streaming responses (CSV exports) are compressed chunk by chunk, so they
+    are never buffered. Ranged responses and files that already carry a
+    Content-Encoding are left alone.
+
+    Like Django's GZipMiddleware, gzip output gets random padding against
+    BREACH and strong ETags are weakened, as the bytes change.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.min_size = getattr(settings, "COMPRESSION_MIN_SIZE", 1024)
+        self.content_types = tuple(
+            getattr(settings, "COMPRESSION_CONTENT_TYPES", DEFAULT_CONTENT_TYPES)
+        )
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        return self.compress(request, response)
+
+    def compressible(self, response):
+        content_type = response.get("Content-Type", "").split(";")[0].strip()
+        if content_type not in self.content_types:
+            return False
+        if response.has_header("Content-Encoding") or response.has_header(
+            "Content-Range"
+        ):
+            return False
+        if response.streaming:
+            # Async streams would need an async compressor; pass them through.
+            return not response.is_async
+        return len(response.content) >= self.min_size
+
+    def compress(self, request, response):
+        if not self.compressible(response):
+            return response
+
+        # Whatever is chosen, caches must key on the client's encodings.
+        patch_vary_headers(response, ("Accept-Encoding",))
+        accepted = accepted_encodings(request.headers.get("Accept-Encoding", ""))
+        if brotli is not None and "br" in accepted:
+            coding = "br"
+        elif "gzip" in accepted:
+            coding = "gzip"
+        else:
+            return response
+
+        if response.streaming:
+            if coding == "br":
+                content = _brotli_sequence(response.streaming_content)
+            else:
+                content = compress_sequence(
+                    response.streaming_content, max_random_bytes=100
+                )
+            response.streaming_content = content
+            del response["Content-Length"]
+        else:
+            if coding == "br":
+                compressed = brotli.compress(response.content)
+            else:
+                compressed = compress_string(response.content, max_random_bytes=100)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response["Content-Length"] = str(len(compressed))
+
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response["ETag"] = "W/" + etag
+        response["Content-Encoding"] = coding
+        return response
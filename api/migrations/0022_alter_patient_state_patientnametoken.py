@@ -0,0 +1,69 @@
+# Generated by Django 5.2 on 2026-10-18 13:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from api.search import NAME_FIELDS, name_tokens
+
+
+def index_existing_names(apps, schema_editor):
+    Patient = apps.get_model("api", "Patient")
+    PatientNameToken = apps.get_model("api", "PatientNameToken")
+
+    tokens = []
+    for patient_id, *parts in Patient.objects.values_list(
+        "id", *NAME_FIELDS
+    ).iterator():
+        tokens.extend(
+            PatientNameToken(patient_id=patient_id, token=token)
+            for token in name_tokens(*parts)
+        )
+        if len(tokens) >= 1000:
+            PatientNameToken.objects.bulk_create(tokens)
+            tokens = []
+    PatientNameToken.objects.bulk_create(tokens)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0021_physician_user_alter_patient_state"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="patient",
+            name="state",
+            field=models.CharField(
+                choices="(('AL', 'Alabama'), ('AK', 'Alaska'), ('AZ', 'Arizona'), ('AR', 'Arkansas'), ('CA', 'California'), ('CO', 'Colorado'), ('CT', 'Connecticut'), ('DE', 'Delaware'), ('DC', 'District of Columbia'), ('FL', 'Florida'), ('GA', 'Georgia'), ('HI', 'Hawaii'), ('ID', 'Idaho'), ('IL', 'Illinois'), ('IN', 'Indiana'), ('IA', 'Iowa'), ('KS', 'Kansas'), ('KY', 'Kentucky'), ('LA', 'Louisiana'), ('ME', 'Maine'), ('MD', 'Maryland'), ('MA', 'Massachusetts'), ('MI', 'Michigan'), ('MN', 'Minnesota'), ('MS', 'Mississippi'), ('MO', 'Missouri'), ('MT', 'Montana'), ('NE', 'Nebraska'), ('NV', 'Nevada'), ('NH', 'New Hampshire'), ('NJ', 'New Jersey'), ('NM', 'New Mexico'), ('NY', 'New York'), ('NC', 'North Carolina'), ('ND', 'North Dakota'), ('OH', 'Ohio'), ('OK', 'Oklahoma'), ('OR', 'Oregon'), ('PA', 'Pennsylvania'), ('RI', 'Rhode Island'), ('SC', 'South Carolina'), ('SD', 'South Dakota'), ('TN', 'Tennessee'), ('TX', 'Texas'), ('UT', 'Utah'), ('VT', 'Vermont'), ('VA', 'Virginia'), ('WA', 'Washington'), ('WV', 'West Virginia'), ('WI', 'Wisconsin'), ('WY', 'Wyoming'))",
+                max_length=50,
+            ),
+        ),
+        migrations.CreateModel(
+            name="PatientNameToken",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("token", models.CharField(max_length=3)),
+                (
+                    "patient",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="name_tokens",
+                        to="api.patient",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("token", "patient")},
+            },
+        ),
+        migrations.RunPython(index_existing_names, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2 on 2026-10-18 13:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0022_alter_patient_state_patientnametoken"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="patient",
+            name="state",
+            field=models.CharField(
+                choices="(('AL', 'Alabama'), ('AK', 'Alaska'), ('AZ', 'Arizona'), ('AR', 'Arkansas'), ('CA', 'California'), ('CO', 'Colorado'), ('CT', 'Connecticut'), ('DE', 'Delaware'), ('DC', 'District of Columbia'), ('FL', 'Florida'), ('GA', 'Georgia'), ('HI', 'Hawaii'), ('ID', 'Idaho'), ('IL', 'Illinois'), ('IN', 'Indiana'), ('IA', 'Iowa'), ('KS', 'Kansas'), ('KY', 'Kentucky'), ('LA', 'Louisiana'), ('ME', 'Maine'), ('MD', 'Maryland'), ('MA', 'Massachusetts'), ('MI', 'Michigan'), ('MN', 'Minnesota'), ('MS', 'Mississippi'), ('MO', 'Missouri'), ('MT', 'Montana'), ('NE', 'Nebraska'), ('NV', 'Nevada'), ('NH', 'New Hampshire'), ('NJ', 'New Jersey'), ('NM', 'New Mexico'), ('NY', 'New York'), ('NC', 'North Carolina'), ('ND', 'North Dakota'), ('OH', 'Ohio'), ('OK', 'Oklahoma'), ('OR', 'Oregon'), ('PA', 'Pennsylvania'), ('RI', 'Rhode Island'), ('SC', 'South Carolina'), ('SD', 'South Dakota'), ('TN', 'Tennessee'), ('TX', 'Texas'), ('UT', 'Utah'), ('VT', 'Vermont'), ('VA', 'Virginia'), ('WA', 'Washington'), ('WV', 'West Virginia'), ('WI', 'Wisconsin'), ('WY', 'Wyoming'))",
+                max_length=50,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="allergentest",
+            index=models.Index(
+                fields=["patient", "test_date", "id"],
+                name="allergentest_patient_date_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="allergytemplate",
+            index=models.Index(fields=["date", "id"], name="template_date_id_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="vial",
+            index=models.Index(fields=["created_at", "id"], name="vial_created_id_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="vial",
+            index=models.Index(
+                fields=["patient", "created_at", "id"], name="vial_patient_created_idx"
+            ),
+        ),
+    ]
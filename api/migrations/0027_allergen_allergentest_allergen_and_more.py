@@ -0,0 +1,146 @@
+# Generated by Django 5.2 on 2026-10-18 13:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def normalize(name):
+    return " ".join(name.replace("-", " ").replace("_", " ").casefold().split())
+
+
+def vial_allergen_names(entries):
+    for entry in entries if isinstance(entries, list) else []:
+        if isinstance(entry, dict):
+            entry = entry.get("name") or entry.get("allergen_name")
+        if isinstance(entry, str) and entry.strip():
+            yield entry
+
+
+def check_collisions(apps, schema_editor):
+    """
+    Spelling variants of one allergen become one catalog entry, so tests of a
+    patient on the same date can collide on the new unique key. Test results
+    must never be dropped: stop before any schema change and list them, so
+    they can be merged or re-dated by hand.
+    """
+    AllergenTest = apps.get_model("api", "AllergenTest")
+
+    groups = {}
+    rows = AllergenTest.objects.order_by("id").values_list(
+        "id", "patient_id", "allergen_name", "test_date"
+    )
+    for pk, patient_id, name, test_date in rows.iterator():
+        key = (patient_id, normalize(name)[:100], test_date)
+        groups.setdefault(key, []).append(pk)
+
+    collisions = [
+        f"patient {patient_id}, {name!r} on {test_date}: "
+        f"allergen tests {', '.join(map(str, ids))}"
+        for (patient_id, name, test_date), ids in groups.items()
+        if len(ids) > 1
+    ]
+    if collisions:
+        raise RuntimeError(
+            "Allergen tests whose names differ only in spelling share a patient "
+            "and test date. Merge or re-date them, then migrate again:\n"
+            + "\n".join(collisions)
+        )
+
+
+def build_catalog(apps, schema_editor):
+    Allergen = apps.get_model("api", "Allergen")
+    AllergenTest = apps.get_model("api", "AllergenTest")
+    Vial = apps.get_model("api", "Vial")
+
+    catalog = {}
+
+    def allergen_id(name):
+        key = normalize(name)[:100]
+        if key not in catalog:
+            allergen, _ = Allergen.objects.get_or_create(
+                normalized_name=key, defaults={"name": " ".join(name.split())[:100]}
+            )
+            catalog[key] = allergen.pk
+        return catalog[key]
+
+    names = AllergenTest.objects.values_list("allergen_name", flat=True).distinct()
+    for name in list(names):
+        AllergenTest.objects.filter(allergen_name=name).update(
+            allergen_id=allergen_id(name)
+        )
+
+    for vial in Vial.objects.only("id", "allergens").iterator():
+        ids = {allergen_id(name) for name in vial_allergen_names(vial.allergens)}
+        if ids:
+            vial.allergen_catalog.set(ids)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0026_alter_patient_state_missedinjectionsnapshot"),
+    ]
+
+    operations = [
+        migrations.RunPython(check_collisions, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name="Allergen",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("name", models.CharField(max_length=100)),
+                ("normalized_name", models.CharField(max_length=100, unique=True)),
+            ],
+            options={
+                "ordering": ["name"],
+            },
+        ),
+        migrations.AddField(
+            model_name="allergentest",
+            name="allergen",
+            field=models.ForeignKey(
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="tests",
+                to="api.allergen",
+            ),
+        ),
+        migrations.AddField(
+            model_name="vial",
+            name="allergen_catalog",
+            field=models.ManyToManyField(
+                blank=True, related_name="vials", to="api.allergen"
+            ),
+        ),
+        migrations.RunPython(build_catalog, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name="allergentest",
+            unique_together=set(),
+        ),
+        migrations.AlterField(
+            model_name="allergentest",
+            name="allergen",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="tests",
+                to="api.allergen",
+            ),
+        ),
+        migrations.RemoveField(
+            model_name="allergentest",
+            name="allergen_name",
+        ),
+        migrations.AlterUniqueTogether(
+            name="allergentest",
+            unique_together={("patient", "allergen", "test_date")},
+        ),
+    ]
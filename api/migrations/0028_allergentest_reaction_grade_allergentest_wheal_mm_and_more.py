@@ -0,0 +1,71 @@
+# Generated by Django 5.2 on 2026-10-18 13:26
+
+from django.db import migrations, models
+
+from api.reactions import template_reaction_metrics, test_reaction_metrics
+
+
+def backfill_reaction_metrics(apps, schema_editor):
+    AllergyTemplate = apps.get_model("api", "AllergyTemplate")
+    AllergenTest = apps.get_model("api", "AllergenTest")
+
+    # One UPDATE per distinct source value rather than one per row.
+    for reaction in AllergyTemplate.objects.values_list(
+        "reaction", flat=True
+    ).distinct():
+        mm, grade = template_reaction_metrics(reaction)
+        AllergyTemplate.objects.filter(reaction=reaction).update(
+            reaction_mm=mm, reaction_grade=grade
+        )
+
+    pairs = AllergenTest.objects.values_list("reaction_level", "custom_size").distinct()
+    for reaction_level, custom_size in list(pairs):
+        mm, grade = test_reaction_metrics(reaction_level, custom_size)
+        AllergenTest.objects.filter(
+            reaction_level=reaction_level, custom_size=custom_size
+        ).update(wheal_mm=mm, reaction_grade=grade)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0027_allergen_allergentest_allergen_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="allergentest",
+            name="reaction_grade",
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="allergentest",
+            name="wheal_mm",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="allergytemplate",
+            name="reaction_grade",
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="allergytemplate",
+            name="reaction_mm",
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name="patient",
+            name="state",
+            field=models.CharField(
+                choices="(('AL', 'Alabama'), ('AK', 'Alaska'), ('AZ', 'Arizona'), ('AR', 'Arkansas'), ('CA', 'California'), ('CO', 'Colorado'), ('CT', 'Connecticut'), ('DE', 'Delaware'), ('DC', 'District of Columbia'), ('FL', 'Florida'), ('GA', 'Georgia'), ('HI', 'Hawaii'), ('ID', 'Idaho'), ('IL', 'Illinois'), ('IN', 'Indiana'), ('IA', 'Iowa'), ('KS', 'Kansas'), ('KY', 'Kentucky'), ('LA', 'Louisiana'), ('ME', 'Maine'), ('MD', 'Maryland'), ('MA', 'Massachusetts'), ('MI', 'Michigan'), ('MN', 'Minnesota'), ('MS', 'Mississippi'), ('MO', 'Missouri'), ('MT', 'Montana'), ('NE', 'Nebraska'), ('NV', 'Nevada'), ('NH', 'New Hampshire'), ('NJ', 'New Jersey'), ('NM', 'New Mexico'), ('NY', 'New York'), ('NC', 'North Carolina'), ('ND', 'North Dakota'), ('OH', 'Ohio'), ('OK', 'Oklahoma'), ('OR', 'Oregon'), ('PA', 'Pennsylvania'), ('RI', 'Rhode Island'), ('SC', 'South Carolina'), ('SD', 'South Dakota'), ('TN', 'Tennessee'), ('TX', 'Texas'), ('UT', 'Utah'), ('VT', 'Vermont'), ('VA', 'Virginia'), ('WA', 'Washington'), ('WV', 'West Virginia'), ('WI', 'Wisconsin'), ('WY', 'Wyoming'))",
+                max_length=50,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="allergentest",
+            index=models.Index(
+                fields=["allergen", "reaction_grade"], name="allergentest_grade_idx"
+            ),
+        ),
+        migrations.RunPython(backfill_reaction_metrics, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2 on 2026-10-18 13:34
+
+import posixpath
+
+import api.storage
+from django.db import migrations, models
+
+
+def name_existing_documents(apps, schema_editor):
+    AuthorizationEntry = apps.get_model("api", "AuthorizationEntry")
+    entries = AuthorizationEntry.objects.exclude(uploaded_doc="").exclude(
+        uploaded_doc__isnull=True
+    )
+    for entry in entries.only("id", "uploaded_doc").iterator():
+        AuthorizationEntry.objects.filter(pk=entry.pk).update(
+            uploaded_doc_name=posixpath.basename(entry.uploaded_doc.name)[:255]
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0028_allergentest_reaction_grade_allergentest_wheal_mm_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StoredBlob",
+            fields=[
+                (
+                    "digest",
+                    models.CharField(max_length=64, primary_key=True, serialize=False),
+                ),
+                ("name", models.CharField(max_length=255, unique=True)),
+                ("size", models.PositiveBigIntegerField()),
+                ("ref_count", models.PositiveIntegerField(default=0)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="authorizationentry",
+            name="uploaded_doc_name",
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AlterField(
+            model_name="authorizationentry",
+            name="uploaded_doc",
+            field=models.FileField(
+                blank=True,
+                null=True,
+                storage=api.storage.document_storage,
+                upload_to="authorization_docs/",
+            ),
+        ),
+        migrations.RunPython(name_existing_documents, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="patient",
+            name="state",
+            field=models.CharField(
+                choices="(('AL', 'Alabama'), ('AK', 'Alaska'), ('AZ', 'Arizona'), ('AR', 'Arkansas'), ('CA', 'California'), ('CO', 'Colorado'), ('CT', 'Connecticut'), ('DE', 'Delaware'), ('DC', 'District of Columbia'), ('FL', 'Florida'), ('GA', 'Georgia'), ('HI', 'Hawaii'), ('ID', 'Idaho'), ('IL', 'Illinois'), ('IN', 'Indiana'), ('IA', 'Iowa'), ('KS', 'Kansas'), ('KY', 'Kentucky'), ('LA', 'Louisiana'), ('ME', 'Maine'), ('MD', 'Maryland'), ('MA', 'Massachusetts'), ('MI', 'Michigan'), ('MN', 'Minnesota'), ('MS', 'Mississippi'), ('MO', 'Missouri'), ('MT', 'Montana'), ('NE', 'Nebraska'), ('NV', 'Nevada'), ('NH', 'New Hampshire'), ('NJ', 'New Jersey'), ('NM', 'New Mexico'), ('NY', 'New York'), ('NC', 'North Carolina'), ('ND', 'North Dakota'), ('OH', 'Ohio'), ('OK', 'Oklahoma'), ('OR', 'Oregon'), ('PA', 'Pennsylvania'), ('RI', 'Rhode Island'), ('SC', 'South Carolina'), ('SD', 'South Dakota'), ('TN', 'Tennessee'), ('TX', 'Texas'), ('UT', 'Utah'), ('VT', 'Vermont'), ('VA', 'Virginia'), ('WA', 'Washington'), ('WV', 'West Virginia'), ('WI', 'Wisconsin'), ('WY', 'Wyoming'))",
+                max_length=50,
+            ),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2 on 2026-10-18 13:40
+
+from django.db import migrations, models
+
+
+def count_consumed_units(apps, schema_editor):
+    AllergyTemplate = apps.get_model("api", "AllergyTemplate")
+    ProcedureDetail = apps.get_model("api", "ProcedureDetail")
+
+    procedures = ProcedureDetail.objects.values_list(
+        "id", "authorization_entry__patient_id", "start_date", "end_date"
+    )
+    for pk, patient_id, start, end in procedures.iterator():
+        consumed = AllergyTemplate.objects.filter(
+            vial__patient_id=patient_id, date__gte=start, date__lte=end
+        ).count()
+        if consumed:
+            ProcedureDetail.objects.filter(pk=pk).update(consumed_units=consumed)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0031_alter_patient_state_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="proceduredetail",
+            name="consumed_units",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_consumed_units, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="patient",
+            name="state",
+            field=models.CharField(
+                choices="(('AL', 'Alabama'), ('AK', 'Alaska'), ('AZ', 'Arizona'), ('AR', 'Arkansas'), ('CA', 'California'), ('CO', 'Colorado'), ('CT', 'Connecticut'), ('DE', 'Delaware'), ('DC', 'District of Columbia'), ('FL', 'Florida'), ('GA', 'Georgia'), ('HI', 'Hawaii'), ('ID', 'Idaho'), ('IL', 'Illinois'), ('IN', 'Indiana'), ('IA', 'Iowa'), ('KS', 'Kansas'), ('KY', 'Kentucky'), ('LA', 'Louisiana'), ('ME', 'Maine'), ('MD', 'Maryland'), ('MA', 'Massachusetts'), ('MI', 'Michigan'), ('MN', 'Minnesota'), ('MS', 'Mississippi'), ('MO', 'Missouri'), ('MT', 'Montana'), ('NE', 'Nebraska'), ('NV', 'Nevada'), ('NH', 'New Hampshire'), ('NJ', 'New Jersey'), ('NM', 'New Mexico'), ('NY', 'New York'), ('NC', 'North Carolina'), ('ND', 'North Dakota'), ('OH', 'Ohio'), ('OK', 'Oklahoma'), ('OR', 'Oregon'), ('PA', 'Pennsylvania'), ('RI', 'Rhode Island'), ('SC', 'South Carolina'), ('SD', 'South Dakota'), ('TN', 'Tennessee'), ('TX', 'Texas'), ('UT', 'Utah'), ('VT', 'Vermont'), ('VA', 'Virginia'), ('WA', 'Washington'), ('WV', 'West Virginia'), ('WI', 'Wisconsin'), ('WY', 'Wyoming'))",
+                max_length=50,
+            ),
+        ),
+    ]
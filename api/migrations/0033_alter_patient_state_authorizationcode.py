@@ -0,0 +1,82 @@
+# Generated by Django 5.2 on 2026-10-18 13:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from api.codes import CPT, ICD10, extract_codes
+
+
+def index_existing_codes(apps, schema_editor):
+    AuthorizationCode = apps.get_model("api", "AuthorizationCode")
+    AuthorizationEntry = apps.get_model("api", "AuthorizationEntry")
+
+    entries = AuthorizationEntry.objects.values_list(
+        "id", "icd10_codes", "procedure_codes"
+    )
+    codes = []
+    for entry_id, icd10_codes, procedure_codes in entries.iterator():
+        for system, text in ((ICD10, icd10_codes), (CPT, procedure_codes)):
+            codes.extend(
+                AuthorizationCode(
+                    authorization_entry_id=entry_id, system=system, code=code
+                )
+                for code in extract_codes(system, text)
+            )
+    AuthorizationCode.objects.bulk_create(codes, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0032_proceduredetail_consumed_units_alter_patient_state"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="patient",
+            name="state",
+            field=models.CharField(
+                choices="(('AL', 'Alabama'), ('AK', 'Alaska'), ('AZ', 'Arizona'), ('AR', 'Arkansas'), ('CA', 'California'), ('CO', 'Colorado'), ('CT', 'Connecticut'), ('DE', 'Delaware'), ('DC', 'District of Columbia'), ('FL', 'Florida'), ('GA', 'Georgia'), ('HI', 'Hawaii'), ('ID', 'Idaho'), ('IL', 'Illinois'), ('IN', 'Indiana'), ('IA', 'Iowa'), ('KS', 'Kansas'), ('KY', 'Kentucky'), ('LA', 'Louisiana'), ('ME', 'Maine'), ('MD', 'Maryland'), ('MA', 'Massachusetts'), ('MI', 'Michigan'), ('MN', 'Minnesota'), ('MS', 'Mississippi'), ('MO', 'Missouri'), ('MT', 'Montana'), ('NE', 'Nebraska'), ('NV', 'Nevada'), ('NH', 'New Hampshire'), ('NJ', 'New Jersey'), ('NM', 'New Mexico'), ('NY', 'New York'), ('NC', 'North Carolina'), ('ND', 'North Dakota'), ('OH', 'Ohio'), ('OK', 'Oklahoma'), ('OR', 'Oregon'), ('PA', 'Pennsylvania'), ('RI', 'Rhode Island'), ('SC', 'South Carolina'), ('SD', 'South Dakota'), ('TN', 'Tennessee'), ('TX', 'Texas'), ('UT', 'Utah'), ('VT', 'Vermont'), ('VA', 'Virginia'), ('WA', 'Washington'), ('WV', 'West Virginia'), ('WI', 'Wisconsin'), ('WY', 'Wyoming'))",
+                max_length=50,
+            ),
+        ),
+        migrations.CreateModel(
+            name="AuthorizationCode",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "system",
+                    models.CharField(
+                        choices=[("icd10", "ICD-10-CM"), ("cpt", "CPT")], max_length=10
+                    ),
+                ),
+                ("code", models.CharField(max_length=10)),
+                (
+                    "authorization_entry",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="codes",
+                        to="api.authorizationentry",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["code", "system", "authorization_entry"],
+                        name="authcode_code_idx",
+                    )
+                ],
+                "unique_together": {("authorization_entry", "system", "code")},
+            },
+        ),
+        migrations.RunPython(index_existing_codes, migrations.RunPython.noop),
+    ]
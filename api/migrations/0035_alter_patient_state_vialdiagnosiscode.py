@@ -0,0 +1,69 @@
+# Generated by Django 5.2 on 2026-10-18 14:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from api.codes import ICD10, diagnosis_code_texts, extract_codes
+
+
+def index_existing_codes(apps, schema_editor):
+    Vial = apps.get_model("api", "Vial")
+    VialDiagnosisCode = apps.get_model("api", "VialDiagnosisCode")
+
+    codes = []
+    for vial_id, diagnosis_codes in Vial.objects.values_list(
+        "id", "diagnosis_codes"
+    ).iterator():
+        found = {}
+        for text in diagnosis_code_texts(diagnosis_codes):
+            found.update(dict.fromkeys(extract_codes(ICD10, text)))
+        codes.extend(VialDiagnosisCode(vial_id=vial_id, code=code) for code in found)
+    VialDiagnosisCode.objects.bulk_create(codes, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0034_allergentest_updated_at_alter_patient_state"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="patient",
+            name="state",
+            field=models.CharField(
+                choices="(('AL', 'Alabama'), ('AK', 'Alaska'), ('AZ', 'Arizona'), ('AR', 'Arkansas'), ('CA', 'California'), ('CO', 'Colorado'), ('CT', 'Connecticut'), ('DE', 'Delaware'), ('DC', 'District of Columbia'), ('FL', 'Florida'), ('GA', 'Georgia'), ('HI', 'Hawaii'), ('ID', 'Idaho'), ('IL', 'Illinois'), ('IN', 'Indiana'), ('IA', 'Iowa'), ('KS', 'Kansas'), ('KY', 'Kentucky'), ('LA', 'Louisiana'), ('ME', 'Maine'), ('MD', 'Maryland'), ('MA', 'Massachusetts'), ('MI', 'Michigan'), ('MN', 'Minnesota'), ('MS', 'Mississippi'), ('MO', 'Missouri'), ('MT', 'Montana'), ('NE', 'Nebraska'), ('NV', 'Nevada'), ('NH', 'New Hampshire'), ('NJ', 'New Jersey'), ('NM', 'New Mexico'), ('NY', 'New York'), ('NC', 'North Carolina'), ('ND', 'North Dakota'), ('OH', 'Ohio'), ('OK', 'Oklahoma'), ('OR', 'Oregon'), ('PA', 'Pennsylvania'), ('RI', 'Rhode Island'), ('SC', 'South Carolina'), ('SD', 'South Dakota'), ('TN', 'Tennessee'), ('TX', 'Texas'), ('UT', 'Utah'), ('VT', 'Vermont'), ('VA', 'Virginia'), ('WA', 'Washington'), ('WV', 'West Virginia'), ('WI', 'Wisconsin'), ('WY', 'Wyoming'))",
+                max_length=50,
+            ),
+        ),
+        migrations.CreateModel(
+            name="VialDiagnosisCode",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("code", models.CharField(max_length=10)),
+                (
+                    "vial",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="codes",
+                        to="api.vial",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["code", "vial"], name="vialcode_code_idx")
+                ],
+                "unique_together": {("vial", "code")},
+            },
+        ),
+        migrations.RunPython(index_existing_codes, migrations.RunPython.noop),
+    ]
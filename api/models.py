@@ -1,8 +1,13 @@
+import os
+
 from django.contrib.auth.models import User
 from django.db import models
 from django.utils import timezone
 from localflavor.us.us_states import US_STATES
 
+from api.reactions import template_reaction_metrics, test_reaction_metrics
+from api.storage import document_storage
+
 DEGREE_CHOICES = [
     ("MD", "Doctor of Medicine (M.D.)"),
     ("DO", "Doctor of Osteopathic Medicine (D.O.)"),
@@ -213,6 +218,105 @@ class Patient(BaseModel):
         return f"{self.first_name} {self.last_name}"
 
 
+class PatientNameToken(models.Model):
+    """
+    Description: Trigram index over a patient's name parts, used by patient search.
+    Rows are maintained by signals on Patient save and can be rebuilt with the
+    `rebuild_patient_name_index` management command.
+    Fields:
+        - patient: The patient whose name produced the token.
+        - token: A three character, case-folded trigram of one name part.
+    """
+
+    patient = models.ForeignKey(
+        Patient, on_delete=models.CASCADE, related_name="name_tokens"
+    )
+    token = models.CharField(max_length=3)
+
+    class Meta:
+        unique_together = ("token", "patient")
+
+    def __str__(self):
+        return f"{self.token} - {self.patient_id}"
+
+
+def last_test_label(last_test_date):
+    if last_test_date is None:
+        return "NA"
+    return timezone.localtime(last_test_date).date()
+
+
+def visits_exp_label(visit_count, auth_expiration_date):
+    if auth_expiration_date is None:
+        return str(visit_count) if visit_count else "NA"
+    return f"{visit_count}/{auth_expiration_date.isoformat()}"
+
+
+def billout_label(last_injection_date):
+    return last_injection_date or "NA"
+
+
+class PatientSummary(models.Model):
+    """
+    Description: Denormalized per-patient figures shown in the patient search grid.
+    Rows are updated by signals when allergen tests, injections and authorizations
+    are written, and can be rebuilt with the `backfill_patient_summaries` command.
+    Fields:
+        - patient: The patient being summarized.
+        - last_test_date: The date of the most recent allergen test.
+        - last_injection_date: The date of the most recent logged injection,
+          which is also the last billable visit ("Billout Date").
+        - visit_count: The number of logged injections.
+        - auth_expiration_date: The latest expiration date among authorizations.
+    """
+
+    patient = models.OneToOneField(
+        Patient, on_delete=models.CASCADE, primary_key=True, related_name="summary"
+    )
+    last_test_date = models.DateTimeField(null=True, blank=True)
+    last_injection_date = models.DateField(null=True, blank=True)
+    visit_count = models.PositiveIntegerField(default=0)
+    auth_expiration_date = models.DateField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "Patient summaries"
+
+    def __str__(self):
+        return f"Summary for patient {self.patient_id}"
+
+    @property
+    def last_test_label(self):
+        return last_test_label(self.last_test_date)
+
+    @property
+    def visits_exp_label(self):
+        return visits_exp_label(self.visit_count, self.auth_expiration_date)
+
+    @property
+    def billout_label(self):
+        return billout_label(self.last_injection_date)
+
+
+class Allergen(BaseModel):
+    """
+    Description: Catalog of allergens referenced by allergen tests and vials.
+    Fields:
+        - name: The display name of the allergen.
+        - normalized_name: The case- and whitespace-folded name; spelling
+          variants that fold to the same value share one catalog entry.
+    """
+
+    name = models.CharField(max_length=100)
+    normalized_name = models.CharField(max_length=100, unique=True)
+
+    class Meta:
+        ordering = ["name"]
+
+    def __str__(self):
+        return self.name
+
+
 class Vial(BaseModel):
     """
     Description: Model representing a vial used for testing.
@@ -220,7 +324,10 @@ class Vial(BaseModel):
         - patient: The patient to whom the vial belongs.
         - name: The name of the vial.
         - allergens: A JSON field for storing allergen information.
-        - diagnosis_codes: A JSON field for storing diagnosis codes.
+        - allergen_catalog: The catalog allergens named in `allergens`, kept in
+          sync on save so vials can be looked up by allergen id.
+        - diagnosis_codes: A JSON field for storing diagnosis codes. The ICD-10
+          codes in it are indexed in VialDiagnosisCode on save.
         - expiration_date: The expiration date of the vial.
     """
 
@@ -228,6 +335,9 @@ class Vial(BaseModel):
     name = models.CharField(max_length=100)
     expiration_date = models.DateField(null=True, blank=True)
     allergens = models.JSONField(default=list)
+    allergen_catalog = models.ManyToManyField(
+        Allergen, blank=True, related_name="vials"
+    )
     diagnosis_codes = models.JSONField(default=list)
 
     def __str__(self):
@@ -237,6 +347,12 @@ class Vial(BaseModel):
         unique_together = ("patient", "name")
         ordering = ["-expiration_date"]
         verbose_name_plural = "Vials"
+        indexes = [
+            models.Index(fields=["created_at", "id"], name="vial_created_id_idx"),
+            models.Index(
+                fields=["patient", "created_at", "id"], name="vial_patient_created_idx"
+            ),
+        ]
 
 
 class AllergyTemplate(BaseModel):
@@ -246,6 +362,8 @@ class AllergyTemplate(BaseModel):
         - name: The name of the allergy template.
         - allergens: A JSON field for storing allergen information.
         - diagnosis_codes: A JSON field for storing diagnosis codes.
+        - reaction_mm: The wheal size in mm derived from `reaction`.
+        - reaction_grade: The ordinal severity derived from `reaction`.
     """
 
     vial = models.ForeignKey(Vial, on_delete=models.CASCADE, related_name="templates")
@@ -256,23 +374,48 @@ class AllergyTemplate(BaseModel):
     tech_id = models.CharField(max_length=50)
     hcrm_applied = models.BooleanField(default=False)
     reaction = models.CharField(max_length=50, choices=REACTION_CHOICES)
+    reaction_mm = models.PositiveSmallIntegerField(null=True, blank=True)
+    reaction_grade = models.PositiveSmallIntegerField(null=True, blank=True)
     notes = models.TextField(null=True, blank=True)
     vial_color = models.CharField(max_length=50, null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["date", "id"], name="template_date_id_idx"),
+            models.Index(fields=["vial", "date"], name="template_vial_date_idx"),
+        ]
+
     def __str__(self):
         return f"Template for {self.vial.name} - {self.dose} on {self.date}"
 
+    def set_reaction_metrics(self):
+        self.reaction_mm, self.reaction_grade = template_reaction_metrics(self.reaction)
+
+    def save(self, *args, **kwargs):
+        self.set_reaction_metrics()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "reaction" in update_fields:
+            kwargs["update_fields"] = {
+                *update_fields,
+                "reaction_mm",
+                "reaction_grade",
+            }
+        super().save(*args, **kwargs)
+
 
 class AllergenTest(models.Model):
     """
     Description: Model representing an allergen test for a patient.
     Fields:
         - patient: The patient who is being tested.
-        - allergen_name: The name of the allergen being tested.
+        - allergen: The catalog allergen being tested.
         - category: The category of the allergen (e.g., food, environmental).
         - reaction_level: The level of reaction to the allergen.
         - custom_size: A custom size for the allergen test.
+        - wheal_mm: The wheal size in mm parsed from `custom_size`.
+        - reaction_grade: The ordinal grade (0-3) from `reaction_level`.
         - test_date: The date of the allergen test.
+        - updated_at: When the result was last recorded or changed.
     """
 
     CATEGORY_CHOICES = [
@@ -290,17 +433,46 @@ class AllergenTest(models.Model):
     patient = models.ForeignKey(
         "Patient", on_delete=models.CASCADE, related_name="allergen_tests"
     )
-    allergen_name = models.CharField(max_length=100)
+    allergen = models.ForeignKey(
+        Allergen, on_delete=models.PROTECT, related_name="tests"
+    )
     category = models.CharField(max_length=20, choices=CATEGORY_CHOICES)
     reaction_level = models.CharField(max_length=10, blank=True, null=True)
     custom_size = models.CharField(max_length=10, blank=True, null=True)
+    wheal_mm = models.FloatField(null=True, blank=True)
+    reaction_grade = models.PositiveSmallIntegerField(null=True, blank=True)
     test_date = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
-        unique_together = ("patient", "allergen_name", "test_date")
+        unique_together = ("patient", "allergen", "test_date")
+        indexes = [
+            models.Index(
+                fields=["patient", "test_date", "id"],
+                name="allergentest_patient_date_idx",
+            ),
+            models.Index(
+                fields=["allergen", "reaction_grade"],
+                name="allergentest_grade_idx",
+            ),
+        ]
 
     def __str__(self):
-        return f"{self.patient} - {self.allergen_name} - {self.reaction_level or self.custom_size}"
+        return f"{self.patient} - {self.allergen} - {self.reaction_level or self.custom_size}"
+
+    def set_reaction_metrics(self):
+        self.wheal_mm, self.reaction_grade = test_reaction_metrics(
+            self.reaction_level, self.custom_size
+        )
+
+    def save(self, *args, **kwargs):
+        self.set_reaction_metrics()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and {"reaction_level", "custom_size"} & set(
+            update_fields
+        ):
+            kwargs["update_fields"] = {*update_fields, "wheal_mm", "reaction_grade"}
+        super().save(*args, **kwargs)
 
 
 class AuthorizationEntry(BaseModel):
@@ -329,12 +501,97 @@ class AuthorizationEntry(BaseModel):
     procedure_codes = models.TextField(blank=True)  # From small textarea next to radio
 
     uploaded_doc = models.FileField(
-        upload_to="authorization_docs/", null=True, blank=True
+        upload_to="authorization_docs/",
+        storage=document_storage,
+        null=True,
+        blank=True,
+    )
+    # Stored files are named by content hash; keep the name the user uploaded.
+    uploaded_doc_name = models.CharField(max_length=255, blank=True)
+    # Filled in by the document worker (api.documents).
+    document_thumbnail = models.FileField(
+        upload_to="authorization_thumbnails/",
+        storage=document_storage,
+        null=True,
+        blank=True,
     )
+    document_text = models.TextField(blank=True)
+    document_processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["expiration_date", "patient"], name="auth_expiration_idx"
+            ),
+        ]
 
     def __str__(self):
         return f"{self.patient} - {self.drug_name} ({self.auth_number})"
 
+    def set_uploaded_doc_name(self):
+        if self.uploaded_doc and not self.uploaded_doc._committed:
+            self.uploaded_doc_name = os.path.basename(self.uploaded_doc.name)[:255]
+
+    def save(self, *args, **kwargs):
+        self.set_uploaded_doc_name()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "uploaded_doc" in update_fields:
+            kwargs["update_fields"] = {*update_fields, "uploaded_doc_name"}
+        super().save(*args, **kwargs)
+
+
+class AuthorizationCode(models.Model):
+    """
+    Description: One ICD-10 or CPT code parsed from the free text code fields of an
+    authorization entry, so entries can be found by code through an index.
+    Fields:
+        - authorization_entry: The entry the code was written on.
+        - system: "icd10" (from icd10_codes) or "cpt" (from procedure_codes).
+        - code: The normalized code, e.g. "J30.1" or "95165".
+    """
+
+    SYSTEM_CHOICES = [("icd10", "ICD-10-CM"), ("cpt", "CPT")]
+
+    authorization_entry = models.ForeignKey(
+        AuthorizationEntry, on_delete=models.CASCADE, related_name="codes"
+    )
+    system = models.CharField(max_length=10, choices=SYSTEM_CHOICES)
+    code = models.CharField(max_length=10)
+
+    class Meta:
+        unique_together = ("authorization_entry", "system", "code")
+        indexes = [
+            models.Index(
+                fields=["code", "system", "authorization_entry"],
+                name="authcode_code_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.code} ({self.system}) - {self.authorization_entry_id}"
+
+
+class VialDiagnosisCode(models.Model):
+    """
+    Description: One ICD-10 code parsed from the diagnosis_codes of a vial, so
+    vials can be found by diagnosis through an index.
+    Fields:
+        - vial: The vial the code was written on.
+        - code: The normalized code, e.g. "J30.1".
+    """
+
+    vial = models.ForeignKey(Vial, on_delete=models.CASCADE, related_name="codes")
+    code = models.CharField(max_length=10)
+
+    class Meta:
+        unique_together = ("vial", "code")
+        indexes = [
+            models.Index(fields=["code", "vial"], name="vialcode_code_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.code} - {self.vial_id}"
+
 
 class ProcedureDetail(BaseModel):
     """
@@ -351,6 +608,113 @@ class ProcedureDetail(BaseModel):
     end_date = models.DateField()
     frequency = models.CharField(max_length=100)
     description = models.TextField(blank=True)
+    # Injections logged inside start_date..end_date, maintained by api.units.
+    consumed_units = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return f"{self.code} ({self.units} units)"
+
+    @property
+    def remaining_units(self):
+        return self.units - self.consumed_units
+
+
+class MissedInjectionSnapshot(models.Model):
+    """
+    Description: Precomputed list of patients overdue for an injection as of a given
+    day, refreshed by the `refresh_missed_injections` management command and served
+    to the front desk outreach worklist.
+    Fields:
+        - snapshot_date: The day the snapshot was computed for.
+        - patient: The overdue patient.
+        - patient_name: The patient's full name at snapshot time.
+        - phone: The patient's phone number at snapshot time.
+        - last_injection_date: The date of the patient's most recent injection.
+        - days_since_last_injection: Days between the last injection and snapshot_date.
+    """
+
+    snapshot_date = models.DateField()
+    patient = models.ForeignKey(
+        Patient, on_delete=models.CASCADE, related_name="missed_injection_snapshots"
+    )
+    patient_name = models.CharField(max_length=310)
+    phone = models.CharField(max_length=20)
+    last_injection_date = models.DateField()
+    days_since_last_injection = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = ("snapshot_date", "patient")
+        indexes = [
+            models.Index(
+                fields=["snapshot_date", "days_since_last_injection", "patient"],
+                name="missed_snapshot_days_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.patient_name} - {self.days_since_last_injection} days ({self.snapshot_date})"
+
+
+class StoredBlob(models.Model):
+    """
+    Description: One stored copy of an uploaded document, shared by every upload
+    with the same content (see api.storage.ContentAddressedStorage).
+    Fields:
+        - digest: SHA-256 of the content, hex encoded.
+        - name: Storage name the content is saved under.
+        - size: Size of the content in bytes.
+        - ref_count: Number of file fields currently pointing at this copy.
+        - created_at: When the content was first stored.
+    """
+
+    digest = models.CharField(max_length=64, primary_key=True)
+    name = models.CharField(max_length=255, unique=True)
+    size = models.PositiveBigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count} refs)"
+
+
+class DocumentJob(models.Model):
+    """
+    Description: A queued processing run (compression, thumbnail, text extraction)
+    for the document uploaded with an authorization entry, picked up by the
+    `process_document_jobs` management command.
+    Fields:
+        - authorization_entry: The entry whose uploaded document is processed.
+        - status: Pending, running, done or failed.
+        - attempts: Number of times a worker has picked the job up.
+        - last_error: Error message of the last failed attempt.
+        - created_at: When the job was queued.
+        - updated_at: When the job last changed state.
+    """
+
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    ]
+
+    authorization_entry = models.ForeignKey(
+        AuthorizationEntry, on_delete=models.CASCADE, related_name="document_jobs"
+    )
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "id"], name="documentjob_status_idx"),
+        ]
+
+    def __str__(self):
+        return f"Document job {self.pk} for entry {self.authorization_entry_id} ({self.status})"
@@ -0,0 +1,152 @@
+import base64
+import binascii
+import json
+
+from django.conf import settings
+from django.core.exceptions import FieldError, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def _encode_value(value):
+    # Keep full precision: DjangoJSONEncoder truncates microseconds, which
+    # would make the cursor skip or repeat rows sharing a millisecond.
+    return value.isoformat()
+
+
+class KeysetPagination(BasePagination):
+    """
+    Opaque cursor pagination over a fixed ordering backed by an index, e.g.
+    ("-created_at", "-id"). Each page is fetched with a WHERE clause on the
+    last row of the previous page, so no OFFSET or COUNT(*) is ever issued
+    and deep pages cost the same as the first one.
+
+    Views pick the ordering with a `pagination_ordering` attribute. Paging is
+    opt-in: unless the request carries `cursor` or `page_size` (or the view
+    sets `pagination_required = True`) the plain list is returned as before.
+    """
+
+    ordering = ("-created_at", "-id")
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+    invalid_cursor_message = "Invalid cursor"
+
+    def is_requested(self, request, view=None):
+        if getattr(view, "pagination_required", False):
+            return True
+        params = request.query_params
+        return self.cursor_query_param in params or self.page_size_query_param in params
+
+    def get_ordering(self, view=None):
+        return tuple(getattr(view, "pagination_ordering", self.ordering))
+
+    def get_page_size(self, request):
+        default = getattr(settings, "API_PAGE_SIZE", 50)
+        maximum = getattr(settings, "API_MAX_PAGE_SIZE", 500)
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return default
+        if page_size <= 0:
+            return default
+        return min(page_size, maximum)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not self.is_requested(request, view):
+            return None
+
+        self.request = request
+        self.ordering = self.get_ordering(view)
+        self.page_size = self.get_page_size(request)
+
+        queryset = queryset.order_by(*self.ordering)
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            values = self.cursor_values(queryset, self.decode_cursor(cursor))
+            queryset = queryset.filter(self._after(values))
+
+        rows = list(queryset[: self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[: self.page_size]
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.get_next_link(), "results": data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        values = [self._value(last, field.lstrip("-")) for field in self.ordering]
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode_cursor(values),
+        )
+
+    def encode_cursor(self, values):
+        payload = json.dumps(values, default=_encode_value, separators=(",", ":"))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+    def decode_cursor(self, cursor):
+        try:
+            padded = cursor + "=" * (-len(cursor) % 4)
+            values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return values
+
+    def cursor_values(self, queryset, values):
+        """
+        Convert decoded cursor values with the fields (or annotations) they
+        order by, so a tampered cursor is a 404 rather than a database or
+        lookup error.
+        """
+        query = queryset.query.chain()
+        converted = []
+        for field, value in zip(self.ordering, values):
+            if isinstance(value, (dict, list, bool)):
+                raise NotFound(self.invalid_cursor_message)
+            try:
+                output_field = query.resolve_ref(field.lstrip("-")).output_field
+                value = output_field.to_python(value)
+            except (FieldError, ValidationError, TypeError, ValueError):
+                raise NotFound(self.invalid_cursor_message)
+            if value is None:
+                raise NotFound(self.invalid_cursor_message)
+            converted.append(value)
+        return converted
+
+    def _value(self, row, field):
+        if isinstance(row, dict):
+            return row[field]
+        return getattr(row, field)
+
+    def _after(self, values):
+        """
+        Build `(a, b, c) > (x, y, z)` for the ordering, expanded into the
+        OR-of-ANDs form the ORM can express and index range scans can use.
+        """
+        condition = Q()
+        equal = Q()
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip("-")
+            lookup = "lt" if field.startswith("-") else "gt"
+            condition |= equal & Q(**{f"{name}__{lookup}": value})
+            equal &= Q(**{name: value})
+        return condition
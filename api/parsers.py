@@ -0,0 +1,104 @@
+import codecs
+import re
+
+from django.conf import settings
+from django.utils.datastructures import MultiValueDict
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import (
+    DataAndFiles,
+    FormParser,
+    JSONParser,
+    MultiPartParser,
+)
+
+from api.renderers import FastJSONRenderer, orjson
+
+# "entries[0].procedures[1].code" -> "entries", "0", "procedures", "1", "code"
+_KEY_PART = re.compile(r"[^.\[\]]+|\[\]")
+
+
+def _key_path(key):
+    return [
+        int(part) if part.isdigit() else part for part in _KEY_PART.findall(key)
+    ] or [key]
+
+
+def _listify(node):
+    """
+    Turn the int-keyed dicts built by `nest` into lists, ordered by index.
+    Gaps in the numbering are closed rather than padded.
+    """
+    if not isinstance(node, dict):
+        return node
+    if node and all(isinstance(key, int) for key in node):
+        return [_listify(node[index]) for index in sorted(node)]
+    return {key: _listify(value) for key, value in node.items()}
+
+
+def nest(data, files=None):
+    """
+    Build nested dicts and lists from bracket or dot notation form keys, e.g.
+    `entries[0].procedures[1].code` or `entries[0][procedures][1][code]`, in
+    a single pass over the keys. Uploaded files are placed in the structure
+    next to the plain values. A key ending in `[]` keeps every value sent for
+    it as a list; any other repeated key keeps its last value, as QueryDict
+    does.
+    """
+    root = {}
+    sources = [data] + ([files] if files else [])
+    for source in sources:
+        for key, values in source.lists():
+            path = _key_path(key)
+            many = len(path) > 1 and path[-1] == "[]"
+            *parents, leaf = path[:-1] if many else path
+            node = root
+            for part in parents:
+                child = node.get(part)
+                if not isinstance(child, dict):
+                    child = node[part] = {}
+                node = child
+            if many:
+                node[leaf] = list(values)
+            else:
+                node[leaf] = values[-1] if values else None
+    return _listify(root)
+
+
+class NestedParserMixin:
+    """
+    Parser mixin that returns nested request data for bracket notation keys.
+    Files end up inside `request.data` where their key points, so
+    `request.FILES` is left empty.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parsed = super().parse(stream, media_type, parser_context)
+        if isinstance(parsed, DataAndFiles):
+            return DataAndFiles(nest(parsed.data, parsed.files), MultiValueDict())
+        return nest(parsed)
+
+
+class NestedMultiPartParser(NestedParserMixin, MultiPartParser):
+    pass
+
+
+class NestedFormParser(NestedParserMixin, FormParser):
+    pass
+
+
+class FastJSONParser(JSONParser):
+    """
+    JSONParser that decodes UTF-8 bodies with orjson when it is installed.
+    orjson rejects NaN and infinities, as the strict stdlib parser does.
+    """
+
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get("encoding", settings.DEFAULT_CHARSET)
+        if orjson is None or codecs.lookup(encoding).name != "utf-8":
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f"JSON parse error - {exc}")
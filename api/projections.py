@@ -0,0 +1,145 @@
+from django.utils import timezone
+
+from api.models import billout_label, last_test_label, visits_exp_label
+
+# Read-only list serialization straight from values() rows: only the listed
+# columns are selected, no model instances are built and no serializer fields
+# run. Each projection mirrors one serializer key for key, and the converters
+# reproduce the DRF field output, so responses are byte-identical to it (see
+# ProjectionParityTests).
+
+
+def drf_datetime(value):
+    # serializers.DateTimeField with the default ISO 8601 format.
+    if not value:
+        return None
+    value = value.astimezone(timezone.get_current_timezone()).isoformat()
+    if value.endswith("+00:00"):
+        value = value[:-6] + "Z"
+    return value
+
+
+def drf_date(value):
+    return value.isoformat() if value else None
+
+
+class Projection:
+    """
+    An ordered list of `(key, lookup, convert)` columns. `convert` may be None
+    for values that the serializer passes through unchanged.
+    """
+
+    def __init__(self, *columns):
+        self.columns = columns
+        self.lookups = [lookup for _, lookup, _ in columns]
+
+    def values(self, queryset, *extra):
+        """
+        `queryset` reduced to the projected columns, plus `extra` lookups such
+        as the ones keyset pagination reads from the last row.
+        """
+        # values() without arguments would select every column.
+        return queryset.values(*dict.fromkeys([*self.lookups, *extra]) or ["pk"])
+
+    def select(self, fieldset):
+        """
+        The columns whose keys `fieldset` (api.fieldsets.Fieldset) wants, so
+        that unwanted ones are neither selected nor converted.
+        """
+        if not fieldset:
+            return self
+        return Projection(
+            *(column for column in self.columns if fieldset.wants(column[0]))
+        )
+
+    def rows(self, values):
+        columns = self.columns
+        return [
+            {
+                key: row[lookup] if convert is None else convert(row[lookup])
+                for key, lookup, convert in columns
+            }
+            for row in values
+        ]
+
+
+# VialSerializer
+VIAL_PROJECTION = Projection(
+    ("id", "id", None),
+    ("created_at", "created_at", drf_datetime),
+    ("updated_at", "updated_at", drf_datetime),
+    ("name", "name", None),
+    ("expiration_date", "expiration_date", drf_date),
+    ("allergens", "allergens", None),
+    ("diagnosis_codes", "diagnosis_codes", None),
+    ("patient", "patient", None),
+)
+
+# AllergenTestSerializer
+ALLERGEN_TEST_PROJECTION = Projection(
+    ("id", "id", None),
+    ("allergen_name", "allergen__name", None),
+    ("category", "category", None),
+    ("reaction_level", "reaction_level", None),
+    ("custom_size", "custom_size", None),
+    ("wheal_mm", "wheal_mm", None),
+    ("reaction_grade", "reaction_grade", None),
+    ("test_date", "test_date", drf_datetime),
+    ("updated_at", "updated_at", drf_datetime),
+    ("patient", "patient", None),
+)
+
+# AllergyTemplateSerializer
+ALLERGY_TEMPLATE_PROJECTION = Projection(
+    ("id", "id", None),
+    ("vial_name", "vial__name", None),
+    ("vial_color", "vial_color", None),
+    ("vial", "vial", None),
+    ("dose", "dose", None),
+    ("date", "date", drf_date),
+    ("arm", "arm", None),
+    ("peak_flow", "peak_flow", None),
+    ("tech_id", "tech_id", None),
+    ("hcrm_applied", "hcrm_applied", None),
+    ("reaction", "reaction", None),
+    ("reaction_mm", "reaction_mm", None),
+    ("reaction_grade", "reaction_grade", None),
+    ("notes", "notes", None),
+)
+
+PATIENT_SEARCH_LOOKUPS = (
+    "id",
+    "first_name",
+    "middle_name",
+    "last_name",
+    "birth_date",
+    "insurance_type",
+    "referral",
+    "summary__last_test_date",
+    "summary__visit_count",
+    "summary__auth_expiration_date",
+    "summary__last_injection_date",
+)
+
+
+def patient_search_rows(values):
+    """
+    The rows of PatienSearchView from values() of PATIENT_SEARCH_LOOKUPS;
+    patients without a summary row read as an empty summary.
+    """
+    return [
+        {
+            "Patient Id": row["id"],
+            "Patient Name": f"{row['first_name']} {row['middle_name']} {row['last_name']}",
+            "Date of birth": row["birth_date"],
+            "Last Test Date": last_test_label(row["summary__last_test_date"]),
+            "Insurance": row["insurance_type"],
+            "Referral": "Yes" if row["referral"] else "No",
+            "Visits/Exp": visits_exp_label(
+                row["summary__visit_count"] or 0,
+                row["summary__auth_expiration_date"],
+            ),
+            "Billout Date": billout_label(row["summary__last_injection_date"]),
+        }
+        for row in values
+    ]
@@ -0,0 +1,54 @@
+import re
+
+# AllergyTemplate.reaction -> (wheal size in mm, ordinal grade). "MR" is
+# recorded without a measurement; ">10mm" is stored as 11mm, the smallest
+# size it can stand for.
+TEMPLATE_REACTION_SCALE = {
+    "NR": (0, 0),
+    "MR": (None, 1),
+    "3mm": (3, 2),
+    "4mm": (4, 3),
+    "5mm": (5, 4),
+    "6mm": (6, 5),
+    "7mm": (7, 6),
+    "8mm": (8, 7),
+    "9mm": (9, 8),
+    "10mm": (10, 9),
+    ">10mm": (11, 10),
+}
+TEMPLATE_GRADE_LABELS = {
+    grade: reaction for reaction, (_, grade) in TEMPLATE_REACTION_SCALE.items()
+}
+
+# AllergenTest.reaction_level -> ordinal grade.
+TEST_REACTION_GRADES = {"None": 0, "1+": 1, "2+": 2, "3+": 3}
+TEST_GRADE_LABELS = {grade: level for level, grade in TEST_REACTION_GRADES.items()}
+
+_PLUS_GRADE = re.compile(r"^\s*([0-4])\s*\+\s*$")
+_SIZE_MM = re.compile(r"^\s*(>?)\s*(\d+(?:\.\d+)?)\s*(?:mm)?\s*$", re.IGNORECASE)
+
+
+def template_reaction_metrics(reaction):
+    """
+    Return `(mm, grade)` for an AllergyTemplate reaction code.
+    """
+    return TEMPLATE_REACTION_SCALE.get(reaction, (None, None))
+
+
+def test_reaction_metrics(reaction_level, custom_size):
+    """
+    Return `(mm, grade)` for an AllergenTest. `custom_size` holds either a
+    wheal size ("5mm", "5", "7.5 mm", ">10mm") or, on some rows, a grade
+    ("2+"). Open-ended sizes are stored 1mm above their bound, as in
+    TEMPLATE_REACTION_SCALE.
+    """
+    grade = TEST_REACTION_GRADES.get(reaction_level)
+    mm = None
+    if custom_size:
+        plus = _PLUS_GRADE.match(custom_size)
+        size = _SIZE_MM.match(custom_size)
+        if plus:
+            grade = int(plus.group(1)) if grade is None else grade
+        elif size:
+            mm = float(size.group(2)) + (1 if size.group(1) else 0)
+    return mm, grade
@@ -0,0 +1,96 @@
+import csv
+import io
+import math
+from decimal import Decimal
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+# orjson is optional and not in requirements.txt; without it the stdlib
+# encoder is used.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Emitted raw by orjson; DRF escapes them so the output stays valid JavaScript.
+_JS_UNSAFE = ((b"\xe2\x80\xa8", b"\\u2028"), (b"\xe2\x80\xa9", b"\\u2029"))
+
+
+def _has_non_finite(value):
+    """
+    Whether `value` holds a NaN or infinite float or Decimal, at any depth of
+    its dicts, lists and tuples.
+    """
+    stack = [value]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, dict):
+            stack.extend(value.values())
+        elif isinstance(value, (list, tuple)):
+            stack.extend(value)
+        elif isinstance(value, (float, Decimal)) and not math.isfinite(value):
+            return True
+    return False
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    Drop-in JSONRenderer that encodes with orjson when it is installed and
+    falls back to the stdlib encoder otherwise, or when indented, ASCII-only
+    or spaced output is asked for.
+
+    Datetimes, dates and times are handed to DRF's encoder so they keep its
+    formatting, as are Decimals, lazy strings and the other types orjson does
+    not know; UUIDs and plain values are encoded natively. The output parses
+    to the same data as JSONRenderer's and is byte-identical except for floats
+    in exponent form, which orjson writes without a plus sign or leading zero
+    ("1e16" rather than "1e+16"). NaN and infinities raise ValueError, as
+    under DRF's STRICT_JSON; orjson would write them as null, so payloads
+    containing null are checked for them first.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None
+            or data is None
+            or self.ensure_ascii
+            or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {})
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = orjson.dumps(
+            data,
+            default=self.encoder_class().default,
+            option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS,
+        )
+        if self.strict and b"null" in ret and _has_non_finite(data):
+            raise ValueError("Out of range float values are not JSON compliant")
+        for raw, escaped in _JS_UNSAFE:
+            if raw in ret:
+                ret = ret.replace(raw, escaped)
+        return ret
+
+
+class CSVRenderer(BaseRenderer):
+    """
+    Lets CSV export views satisfy `Accept: text/csv`. Exports stream their own
+    body; this renderer only has to cope with plain payloads such as errors.
+    """
+
+    media_type = "text/csv"
+    format = "csv"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        if isinstance(data, (str, bytes)):
+            return data if isinstance(data, bytes) else data.encode(self.charset)
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        items = data.items() if isinstance(data, dict) else enumerate(data)
+        for key, value in items:
+            writer.writerow([key, value])
+        return buffer.getvalue().encode(self.charset)
@@ -0,0 +1,242 @@
+import csv
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import Max, Q
+
+from api.models import (
+    AuthorizationEntry,
+    MissedInjectionSnapshot,
+    Patient,
+    ProcedureDetail,
+)
+from api.units import remaining_units
+
+MISSED_INJECTION_FIELDS = (
+    "id",
+    "first_name",
+    "middle_name",
+    "last_name",
+    "phone",
+    "last_injection_date",
+)
+
+SNAPSHOT_EXPORT_FIELDS = (
+    "patient_id",
+    "patient_name",
+    "phone",
+    "last_injection_date",
+    "days_since_last_injection",
+)
+
+AUTHORIZATION_SUMMARY_FIELDS = (
+    "id",
+    "patient_id",
+    "patient__first_name",
+    "patient__middle_name",
+    "patient__last_name",
+    "patient__phone",
+    "drug_name",
+    "insurance",
+    "auth_number",
+    "expiration_date",
+)
+
+PROCEDURE_SUMMARY_FIELDS = (
+    "code",
+    "units",
+    "consumed_units",
+    "start_date",
+    "end_date",
+)
+
+LOW_UNITS_FIELDS = (
+    "id",
+    "code",
+    "units",
+    "consumed_units",
+    "remaining_units",
+    "start_date",
+    "end_date",
+    "authorization_entry_id",
+    "authorization_entry__auth_number",
+    "authorization_entry__drug_name",
+    "authorization_entry__patient_id",
+    "authorization_entry__patient__first_name",
+    "authorization_entry__patient__middle_name",
+    "authorization_entry__patient__last_name",
+)
+
+
+def missed_injections(threshold_date, as_of=None):
+    """
+    Patients whose most recent injection happened before `threshold_date`,
+    as one grouped query returning only the columns the report needs.
+
+    `as_of` ignores injections logged after that day, so the report can be
+    reproduced for a past date.
+    """
+    latest = Max("vial__templates__date")
+    if as_of is not None:
+        latest = Max(
+            "vial__templates__date", filter=Q(vial__templates__date__lte=as_of)
+        )
+    return (
+        Patient.objects.annotate(last_injection_date=latest)
+        .filter(last_injection_date__lt=threshold_date)
+        .values(*MISSED_INJECTION_FIELDS)
+    )
+
+
+def _full_name(row):
+    return f"{row['first_name']} {row['middle_name']} {row['last_name']}"
+
+
+def missed_injection_row(row, today):
+    return {
+        "patient_id": row["id"],
+        "patient_name": _full_name(row),
+        "phone": row["phone"],
+        "last_injection_date": row["last_injection_date"],
+        "weeks_since_last_injection": (today - row["last_injection_date"]).days // 7,
+    }
+
+
+def snapshot_row(snapshot):
+    return {
+        "patient_id": snapshot.patient_id,
+        "patient_name": snapshot.patient_name,
+        "phone": snapshot.phone,
+        "last_injection_date": snapshot.last_injection_date,
+        "weeks_since_last_injection": snapshot.days_since_last_injection // 7,
+    }
+
+
+def refresh_missed_injection_snapshot(snapshot_date, batch_size=1000):
+    """
+    Replace the snapshot for `snapshot_date` with every patient whose last
+    injection before that day is older than the day itself. Returns the
+    number of rows written.
+    """
+    rows = (
+        missed_injections(snapshot_date, as_of=snapshot_date)
+        .order_by()
+        .iterator(chunk_size=batch_size)
+    )
+    snapshots = (
+        MissedInjectionSnapshot(
+            snapshot_date=snapshot_date,
+            patient_id=row["id"],
+            patient_name=_full_name(row),
+            phone=row["phone"],
+            last_injection_date=row["last_injection_date"],
+            days_since_last_injection=(snapshot_date - row["last_injection_date"]).days,
+        )
+        for row in rows
+    )
+
+    written = 0
+    with transaction.atomic():
+        MissedInjectionSnapshot.objects.filter(snapshot_date=snapshot_date).delete()
+        while batch := list(islice(snapshots, batch_size)):
+            MissedInjectionSnapshot.objects.bulk_create(batch)
+            written += len(batch)
+    return written
+
+
+class _Echo:
+    """
+    File-like object whose write() hands the formatted line straight back,
+    so csv.writer can feed a streaming response.
+    """
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(header, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def expiring_authorizations(start, end):
+    """
+    Authorization entries of every patient expiring between `start` and `end`
+    inclusive, read through the (expiration_date, patient) index.
+    """
+    return AuthorizationEntry.objects.filter(
+        expiration_date__gte=start, expiration_date__lte=end
+    ).values(*AUTHORIZATION_SUMMARY_FIELDS)
+
+
+def procedure_summaries(entry_ids):
+    """
+    Map each authorization entry id to its procedures, in one query.
+    """
+    procedures = {entry_id: [] for entry_id in entry_ids}
+    rows = (
+        ProcedureDetail.objects.filter(authorization_entry_id__in=entry_ids)
+        .order_by("authorization_entry_id", "start_date", "id")
+        .values("authorization_entry_id", *PROCEDURE_SUMMARY_FIELDS)
+    )
+    for row in rows:
+        row["remaining_units"] = row["units"] - row["consumed_units"]
+        procedures[row.pop("authorization_entry_id")].append(row)
+    return procedures
+
+
+def authorization_summary_row(row, procedures, today):
+    name = (
+        row["patient__first_name"],
+        row["patient__middle_name"],
+        row["patient__last_name"],
+    )
+    return {
+        "id": row["id"],
+        "patient_id": row["patient_id"],
+        "patient_name": " ".join(part for part in name if part),
+        "phone": row["patient__phone"],
+        "drug_name": row["drug_name"],
+        "insurance": row["insurance"],
+        "auth_number": row["auth_number"],
+        "expiration_date": row["expiration_date"],
+        "days_remaining": (row["expiration_date"] - today).days,
+        "procedures": procedures.get(row["id"], []),
+    }
+
+
+def low_unit_procedures(threshold, today):
+    """
+    Authorized procedures still in effect on `today` that have `threshold`
+    units or fewer left.
+    """
+    return (
+        ProcedureDetail.objects.filter(end_date__gte=today)
+        .annotate(remaining_units=remaining_units())
+        .filter(remaining_units__lte=threshold)
+        .values(*LOW_UNITS_FIELDS)
+    )
+
+
+def low_units_row(row):
+    name = (
+        row["authorization_entry__patient__first_name"],
+        row["authorization_entry__patient__middle_name"],
+        row["authorization_entry__patient__last_name"],
+    )
+    return {
+        "id": row["id"],
+        "code": row["code"],
+        "units": row["units"],
+        "consumed_units": row["consumed_units"],
+        "remaining_units": row["remaining_units"],
+        "start_date": row["start_date"],
+        "end_date": row["end_date"],
+        "authorization_entry_id": row["authorization_entry_id"],
+        "auth_number": row["authorization_entry__auth_number"],
+        "drug_name": row["authorization_entry__drug_name"],
+        "patient_id": row["authorization_entry__patient_id"],
+        "patient_name": " ".join(part for part in name if part),
+    }
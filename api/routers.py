@@ -0,0 +1,139 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA_DB_ALIAS = "replica"
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+PIN_COOKIE = "db_primary"
+FORCE_PRIMARY_HEADER = "HTTP_X_DB_PRIMARY"
+
+
+class RoutingState:
+    """
+    Per-request routing decision. `replica` starts out true for safe requests
+    and is switched off for the rest of the request by the first write.
+    """
+
+    def __init__(self, replica=False):
+        self.replica = replica
+        self.wrote = False
+
+
+# Unset outside of requests, so commands, migrations and the shell always
+# use the primary.
+_routing = ContextVar("db_routing", default=None)
+
+
+def replica_configured():
+    return REPLICA_DB_ALIAS in connections.databases
+
+
+def reads_from_replica():
+    """
+    Whether reads of the current request go to the replica, which may lag.
+    """
+    state = _routing.get()
+    return state is not None and state.replica and replica_configured()
+
+
+def pinned_to_primary():
+    """
+    Whether the current safe request was kept on the primary, because the
+    client wrote recently or asked for it, and must read its own writes.
+    """
+    state = _routing.get()
+    return state is not None and not state.replica and replica_configured()
+
+
+@contextmanager
+def use_primary():
+    """
+    Send every query inside the block to the primary, e.g. to read a row
+    right after another process wrote it.
+    """
+    token = _routing.set(RoutingState(replica=False))
+    try:
+        yield
+    finally:
+        _routing.reset(token)
+
+
+class PrimaryReplicaRouter:
+    """
+    Route reads of safe (GET/HEAD/OPTIONS) requests to the "replica" alias
+    when one is configured, and everything else to the primary.
+
+    A request that writes is pinned to the primary for the rest of its
+    queries, and ReplicaRoutingMiddleware keeps the client on the primary
+    for REPLICA_PIN_SECONDS afterwards so it reads its own writes despite
+    replication lag. Reads inside a transaction on the primary stay there.
+    """
+
+    # DatabaseCache rows (response cache versions) must never lag.
+    primary_apps = ("django_cache",)
+
+    def db_for_read(self, model, **hints):
+        state = _routing.get()
+        if (
+            state is not None
+            and model._meta.app_label not in self.primary_apps
+            and state.replica
+            and replica_configured()
+            and not connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return REPLICA_DB_ALIAS
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = _routing.get()
+        if state is not None and model._meta.app_label not in self.primary_apps:
+            state.wrote = True
+            state.replica = False
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica gets its schema through replication.
+        return db != REPLICA_DB_ALIAS
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Decide per request whether reads may use the replica. Clients can force
+    the primary with an `X-DB-Primary: 1` header; a request that writes sets
+    a short-lived cookie that does the same for the follow-up reads.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def use_replica(self, request):
+        return (
+            request.method in SAFE_METHODS
+            and request.META.get(FORCE_PRIMARY_HEADER) != "1"
+            and PIN_COOKIE not in request.COOKIES
+        )
+
+    def __call__(self, request):
+        state = RoutingState(replica=self.use_replica(request))
+        token = _routing.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _routing.reset(token)
+
+        if state.wrote and replica_configured():
+            response.set_cookie(
+                PIN_COOKIE,
+                "1",
+                max_age=getattr(settings, "REPLICA_PIN_SECONDS", 5),
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
@@ -0,0 +1,105 @@
+from django.db import transaction
+from django.db.models import Count, Q
+
+from api.models import Patient, PatientNameToken
+
+# Word boundary markers. Spaces are avoided on purpose because MySQL PAD SPACE
+# collations ignore trailing whitespace when comparing strings.
+WORD_START = "^"
+WORD_END = "$"
+
+NAME_FIELDS = ("first_name", "middle_name", "last_name")
+
+
+def _words(value):
+    return (value or "").casefold().split()
+
+
+def _trigrams(word):
+    padded = f"{WORD_START}{WORD_START}{word}{WORD_END}"
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def name_tokens(*parts):
+    """
+    Return the set of trigrams indexed for the given name parts.
+    """
+    tokens = set()
+    for part in parts:
+        for word in _words(part):
+            tokens |= _trigrams(word)
+    return tokens
+
+
+def query_tokens(query):
+    """
+    Split a search string into the trigrams every match must contain and the
+    word boundary trigrams that only boost the ranking of prefix and whole-word
+    matches. Words shorter than three characters have no interior trigram, so
+    they require their word-start token and match the start of a name word.
+    """
+    required = set()
+    boost = set()
+    for word in _words(query):
+        start = f"{WORD_START}{WORD_START}{word}"
+        boost.add(start[:3])
+        if len(word) >= 2:
+            boost.add(start[1:4])
+            boost.add(f"{word[-2:]}{WORD_END}")
+        if len(word) >= 3:
+            required |= {word[i : i + 3] for i in range(len(word) - 2)}
+        else:
+            required.add(start[-3:])
+    return required, boost - required
+
+
+def sync_patient_name_tokens(patient):
+    """
+    Bring the token rows of a single patient in line with its current name,
+    touching only the tokens that changed.
+    """
+    wanted = name_tokens(*(getattr(patient, field) for field in NAME_FIELDS))
+    existing = set(
+        PatientNameToken.objects.filter(patient=patient).values_list("token", flat=True)
+    )
+    if wanted == existing:
+        return
+
+    with transaction.atomic():
+        stale = existing - wanted
+        if stale:
+            PatientNameToken.objects.filter(patient=patient, token__in=stale).delete()
+        PatientNameToken.objects.bulk_create(
+            PatientNameToken(patient=patient, token=token)
+            for token in wanted - existing
+        )
+
+
+def search_patients(query):
+    """
+    Return patients with every word of `query` in one of their name parts,
+    best matches first; words under three characters must start a name word.
+    The token table narrows the candidates and the words are then checked
+    against the names themselves, since holding all trigrams of a word does
+    not mean holding the word.
+    """
+    required, boost = query_tokens(query)
+    if not required:
+        return Patient.objects.none()
+
+    patients = Patient.objects.all()
+    for word in _words(query):
+        patients = patients.filter(
+            Q(first_name__icontains=word)
+            | Q(middle_name__icontains=word)
+            | Q(last_name__icontains=word)
+        )
+    return (
+        patients.filter(name_tokens__token__in=required | boost)
+        .annotate(
+            token_hits=Count("name_tokens", filter=Q(name_tokens__token__in=required)),
+            search_rank=Count("name_tokens"),
+        )
+        .filter(token_hits=len(required))
+        .order_by("-search_rank", "last_name", "first_name", "id")
+    )
@@ -1,7 +1,15 @@
+from collections import Counter
+
 from rest_framework import serializers
+from django.db import connection, transaction
 from django.utils import timezone
 
+from api import summaries
+from api.caching import invalidate_patients
+from api.allergens import allergen_ids, lookup_allergens, normalize_allergen_name
+from api.codes import ICD10, diagnosis_code_texts, extract_codes
 from api.models import (
+    Allergen,
     Vial,
     Patient,
     AllergyTemplate,
@@ -9,46 +17,59 @@ from api.models import (
     AuthorizationEntry,
     ProcedureDetail,
 )
+from api.units import reconcile_consumed_units, record_injection_units
 
 
-class PatientSerializer(serializers.ModelSerializer):
-    referral = serializers.SerializerMethodField()
-    visits_exp = serializers.SerializerMethodField()
-    last_test_date = serializers.SerializerMethodField()
-    billout_date = serializers.SerializerMethodField()
-
-    class Meta:
-        model = Patient
-        fields = [
-            "id",
-            "first_name",
-            "middle_name",
-            "last_name",
-            "birth_date",
-            "insurance_type",
-            "referral",
-            "visits_exp",
-            "last_test_date",
-            "billout_date",
-        ]
-
-    def get_referral(self, obj):
-        return "Yes" if obj.referral else "No"
-
-    def get_visits_exp(self, obj):
-        return "NA"
+class SparseFieldsMixin:
+    """
+    ModelSerializer mixin taking a `fieldset` (api.fieldsets.Fieldset) that
+    drops the top-level fields it does not want.
+    """
 
-    def get_last_test_date(self, obj):
-        return "NA"
+    def __init__(self, *args, fieldset=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fieldset:
+            for name in list(self.fields):
+                if not fieldset.wants(name):
+                    self.fields.pop(name)
 
-    def get_billout_date(self, obj):
-        return "NA"
+    def column_names(self):
+        """
+        The concrete model columns the remaining fields read, for `.only()`.
+        Fields with other sources must not read deferred columns.
+        """
+        concrete = {field.name for field in self.Meta.model._meta.concrete_fields}
+        return ["pk", *(f.source for f in self.fields.values() if f.source in concrete)]
 
 
 class VialSerializer(serializers.ModelSerializer):
     class Meta:
         model = Vial
-        fields = "__all__"
+        # allergen_catalog mirrors `allergens` and is maintained on save.
+        exclude = ["allergen_catalog"]
+
+    def validate_diagnosis_codes(self, value):
+        if not isinstance(value, (list, str)):
+            raise serializers.ValidationError("Expected a list of ICD-10 codes.")
+        # Entries already on the vial are kept as stored, whatever their shape,
+        # so an unchanged vial can always be saved again. New entries are a
+        # string such as "J30.1 - Allergic rhinitis" or a {"code": ...} object
+        # and must carry at least one well formed ICD-10 code.
+        stored = self.instance.diagnosis_codes if self.instance else []
+        stored = stored if isinstance(stored, list) else [stored]
+        invalid = [
+            item
+            for item in (value if isinstance(value, list) else [value])
+            if item not in stored
+            and not any(
+                extract_codes(ICD10, text) for text in diagnosis_code_texts([item])
+            )
+        ]
+        if invalid:
+            raise serializers.ValidationError(
+                f"Invalid ICD-10 codes: {', '.join(map(str, invalid))}"
+            )
+        return value
 
     # def validate(self, attrs):
     #     patient = attrs.get("patient")
@@ -84,65 +105,420 @@ class AllergyTemplateSerializer(serializers.ModelSerializer):
             "tech_id",
             "hcrm_applied",
             "reaction",
+            "reaction_mm",
+            "reaction_grade",
             "notes",
         ]
+        read_only_fields = ["reaction_mm", "reaction_grade"]
 
     def get_vial_name(self, obj):
         return obj.vial.name if obj.vial else None
 
 
+class InjectionRecordSerializer(serializers.ModelSerializer):
+    """
+    One row of an injection session. The vial is taken as a plain id so the
+    whole session can be checked against the vials in a single query.
+    """
+
+    vial = serializers.IntegerField(min_value=1)
+
+    class Meta:
+        model = AllergyTemplate
+        fields = [
+            "vial",
+            "vial_color",
+            "dose",
+            "date",
+            "arm",
+            "peak_flow",
+            "tech_id",
+            "hcrm_applied",
+            "reaction",
+            "notes",
+        ]
+
+
+class InjectionSessionSerializer(serializers.Serializer):
+    """
+    Validates a whole shot clinic session of injection records together and
+    inserts them with one bulk_create. Nothing is written if any row fails.
+    """
+
+    patient = serializers.PrimaryKeyRelatedField(
+        queryset=Patient.objects.all(), required=False
+    )
+    injections = serializers.ListField(
+        child=serializers.DictField(), allow_empty=False, max_length=1000
+    )
+
+    def validate(self, attrs):
+        patient = attrs.get("patient")
+        records = [InjectionRecordSerializer(data=row) for row in attrs["injections"]]
+        errors = {
+            index: record.errors
+            for index, record in enumerate(records)
+            if not record.is_valid()
+        }
+
+        vial_ids = {
+            record.validated_data["vial"]
+            for index, record in enumerate(records)
+            if index not in errors
+        }
+        vials = Vial.objects.only("id", "name", "patient_id").in_bulk(vial_ids)
+        for index, record in enumerate(records):
+            if index in errors:
+                continue
+            vial = vials.get(record.validated_data["vial"])
+            if vial is None:
+                errors[index] = {"vial": ["Vial does not exist."]}
+            elif patient is not None and vial.patient_id != patient.pk:
+                errors[index] = {"vial": ["Vial does not belong to this patient."]}
+
+        if errors:
+            # Same shape as a ListSerializer: one entry per row, {} when valid.
+            raise serializers.ValidationError(
+                {"injections": [errors.get(index, {}) for index in range(len(records))]}
+            )
+
+        attrs["records"] = [
+            {**record.validated_data, "vial": vials[record.validated_data["vial"]]}
+            for record in records
+        ]
+        return attrs
+
+    def create(self, validated_data):
+        templates = [AllergyTemplate(**record) for record in validated_data["records"]]
+        for template in templates:
+            template.set_reaction_metrics()
+
+        latest = {}
+        counts = Counter()
+        for template in templates:
+            patient_id = template.vial.patient_id
+            counts[patient_id] += 1
+            latest[patient_id] = max(
+                template.date, latest.get(patient_id, template.date)
+            )
+
+        with transaction.atomic():
+            AllergyTemplate.objects.bulk_create(templates)
+            # bulk_create sends no post_save, so fold the session in here.
+            for patient_id, count in counts.items():
+                summaries.record_injections(patient_id, latest[patient_id], count)
+            record_injection_units(
+                (template.vial.patient_id, template.date) for template in templates
+            )
+            invalidate_patients(counts)
+        return templates
+
+
+class AllergenNameField(serializers.Field):
+    """
+    Reads and writes an AllergenTest's catalog allergen by name. Validation
+    yields an unsaved Allergen; `resolve_allergen` swaps in the catalog row on
+    save, so requests that fail validation never add to the catalog.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault("source", "allergen")
+        super().__init__(**kwargs)
+        self.name_field = serializers.CharField(max_length=100)
+
+    def to_internal_value(self, data):
+        name = self.name_field.run_validation(data)
+        return Allergen(name=name, normalized_name=normalize_allergen_name(name))
+
+    def to_representation(self, value):
+        return value.name
+
+
 class AllergenTestSerializer(serializers.ModelSerializer):
+    allergen_name = AllergenNameField()
+
     class Meta:
         model = AllergenTest
-        fields = "__all__"
+        exclude = ["allergen"]
+        read_only_fields = ["wheal_mm", "reaction_grade"]
+        # DRF only derives this from unique_together when every field in it is
+        # declared under its model name; allergen is exposed as allergen_name.
+        extra_kwargs = {"test_date": {"default": timezone.now}}
+
+    def resolve_allergen(self, validated_data):
+        """
+        Replace the unsaved allergen from AllergenNameField with its catalog
+        row, creating the row for a name never seen before.
+        """
+        if "allergen" in validated_data:
+            name = validated_data["allergen"].name
+            pk, display = lookup_allergens([name])[name]
+            validated_data["allergen"] = Allergen(
+                pk=pk, name=display, normalized_name=normalize_allergen_name(name)
+            )
+        return validated_data
 
     def create(self, validated_data):
+        validated_data = self.resolve_allergen(validated_data)
+        # Same key as the panel upsert: one row per allergen and test date.
         instance, created = AllergenTest.objects.update_or_create(
             patient=validated_data["patient"],
-            allergen_name=validated_data["allergen_name"],
+            allergen=validated_data["allergen"],
+            test_date=validated_data.get("test_date", timezone.now()),
             defaults={
                 "category": validated_data.get("category"),
                 "reaction_level": validated_data.get("reaction_level"),
                 "custom_size": validated_data.get("custom_size"),
-                "test_date": validated_data.get("test_date", timezone.now()),
             },
         )
         return instance
 
+    def update(self, instance, validated_data):
+        return super().update(instance, self.resolve_allergen(validated_data))
+
+
+class AllergenPanelResultSerializer(serializers.ModelSerializer):
+    allergen_name = serializers.CharField(max_length=100)
+
+    class Meta:
+        model = AllergenTest
+        fields = ["allergen_name", "category", "reaction_level", "custom_size"]
+
+
+class AllergenPanelSerializer(serializers.Serializer):
+    """
+    Validates a whole skin-test panel for one patient and saves it as a single
+    set-based upsert keyed on (patient, allergen, test_date).
+    """
+
+    patient = serializers.PrimaryKeyRelatedField(queryset=Patient.objects.all())
+    test_date = serializers.DateTimeField(required=False)
+    results = AllergenPanelResultSerializer(many=True, allow_empty=False)
+
+    def validate_results(self, results):
+        names = Counter(
+            normalize_allergen_name(result["allergen_name"]) for result in results
+        )
+        duplicates = sorted(name for name, count in names.items() if count > 1)
+        if duplicates:
+            raise serializers.ValidationError(
+                f"Duplicate allergens in panel: {', '.join(duplicates)}"
+            )
+        return results
+
+    def create(self, validated_data):
+        patient = validated_data["patient"]
+        test_date = validated_data.get("test_date") or timezone.now()
+        results = validated_data["results"]
+        ids = allergen_ids([result["allergen_name"] for result in results])
+        tests = [
+            AllergenTest(
+                patient=patient,
+                test_date=test_date,
+                allergen_id=ids[result["allergen_name"]],
+                category=result.get("category"),
+                reaction_level=result.get("reaction_level"),
+                custom_size=result.get("custom_size"),
+            )
+            for result in results
+        ]
+        for test in tests:
+            test.set_reaction_metrics()
+
+        # MySQL upserts on any unique key and rejects an explicit target.
+        conflict_target = {}
+        if connection.features.supports_update_conflicts_with_target:
+            conflict_target["unique_fields"] = ["patient", "allergen", "test_date"]
+
+        with transaction.atomic():
+            AllergenTest.objects.bulk_create(
+                tests,
+                update_conflicts=True,
+                update_fields=[
+                    "category",
+                    "reaction_level",
+                    "custom_size",
+                    "wheal_mm",
+                    "reaction_grade",
+                    "updated_at",
+                ],
+                **conflict_target,
+            )
+            summaries.record_test(patient.pk, test_date)
+            invalidate_patients([patient.pk])
+
+        # bulk_create cannot report ids of updated rows on every backend.
+        return list(
+            AllergenTest.objects.filter(
+                patient=patient,
+                test_date=test_date,
+                allergen_id__in=ids.values(),
+            )
+            .select_related("allergen")
+            .order_by("allergen__name")
+        )
+
 
 class ProcedureDetailSerializer(serializers.ModelSerializer):
+    # Writable so updates can match submitted procedures to existing rows.
+    id = serializers.IntegerField(required=False)
+    remaining_units = serializers.IntegerField(read_only=True)
+
     class Meta:
         model = ProcedureDetail
         exclude = ["authorization_entry"]
+        read_only_fields = ["consumed_units"]
+
 
+def _new_procedure(entry, data):
+    fields = {field: value for field, value in data.items() if field != "id"}
+    return ProcedureDetail(authorization_entry=entry, **fields)
 
-class AuthorizationEntrySerializer(serializers.ModelSerializer):
+
+def _create_procedures(entries, procedures_per_entry):
+    created = ProcedureDetail.objects.bulk_create(
+        _new_procedure(entry, procedure)
+        for entry, procedures in zip(entries, procedures_per_entry)
+        for procedure in procedures
+    )
+    if created:
+        # Count injections already logged inside the new windows.
+        reconcile_consumed_units(
+            ProcedureDetail.objects.filter(authorization_entry__in=entries)
+        )
+
+
+def _sync_procedures(entry, procedures_data):
+    """
+    Apply the submitted procedures to an entry as a diff: rows are matched by
+    id when one is given, otherwise by (code, start_date); matches are
+    updated only when a value changed, unmatched rows are deleted and the
+    rest inserted.
+    """
+    existing = list(entry.procedures.all())
+    by_id = {procedure.id: procedure for procedure in existing}
+    by_key = {
+        (procedure.code, procedure.start_date): procedure for procedure in existing
+    }
+
+    now = timezone.now()
+    changed = []
+    changed_fields = set()
+    created = []
+    for data in procedures_data:
+        data = dict(data)
+        procedure_id = data.pop("id", None)
+        if procedure_id is not None:
+            procedure = by_id.get(procedure_id)
+        else:
+            # Partial updates may leave out either key field.
+            procedure = by_key.get((data.get("code"), data.get("start_date")))
+        if procedure is None or procedure.id not in by_id:
+            created.append(_new_procedure(entry, data))
+            continue
+
+        del by_id[procedure.id]
+        fields = [
+            field for field, value in data.items() if getattr(procedure, field) != value
+        ]
+        if fields:
+            for field in fields:
+                setattr(procedure, field, data[field])
+            procedure.updated_at = now
+            changed.append(procedure)
+            changed_fields.update(fields)
+
+    if by_id:
+        ProcedureDetail.objects.filter(id__in=by_id).delete()
+    if changed:
+        ProcedureDetail.objects.bulk_update(changed, [*changed_fields, "updated_at"])
+    if created:
+        ProcedureDetail.objects.bulk_create(created)
+    if created or {"start_date", "end_date"} & changed_fields:
+        reconcile_consumed_units(entry.procedures.all())
+
+
+class AuthorizationEntryListSerializer(serializers.ListSerializer):
+    """
+    Creates a batch of authorization entries and all of their procedures in
+    one transaction, inserting the procedures with a single bulk_create.
+    """
+
+    def create(self, validated_data):
+        procedures_per_entry = [item.pop("procedures", []) for item in validated_data]
+        entries = [AuthorizationEntry(**item) for item in validated_data]
+
+        with transaction.atomic():
+            # The procedures need the entry ids, which MySQL cannot return
+            # from a bulk insert, so the entries are saved one by one and
+            # their post_save handlers keep the summary, code index and
+            # response cache current.
+            for entry in entries:
+                entry.save()
+            _create_procedures(entries, procedures_per_entry)
+        return entries
+
+
+class AuthorizationEntrySerializer(SparseFieldsMixin, serializers.ModelSerializer):
     procedures = ProcedureDetailSerializer(many=True)
 
     class Meta:
         model = AuthorizationEntry
-        fields = "__all__"
-        read_only_fields = ["created_at", "updated_at"]
+        # The extracted text can be long; list responses link the thumbnail.
+        exclude = ["document_text"]
+        read_only_fields = [
+            "created_at",
+            "updated_at",
+            "uploaded_doc_name",
+            "document_thumbnail",
+            "document_processed_at",
+        ]
+        list_serializer_class = AuthorizationEntryListSerializer
+
+    def validate_procedures(self, procedures):
+        # Partial updates skip required fields, but procedures that match no
+        # existing row are inserted and need all of them.
+        child = self.fields["procedures"].child
+        required = [name for name, field in child.fields.items() if field.required]
+        ids, keys = set(), set()
+        if self.instance is not None:
+            for pk, code, start_date in self.instance.procedures.values_list(
+                "id", "code", "start_date"
+            ):
+                ids.add(pk)
+                keys.add((code, start_date))
+        for index, procedure in enumerate(procedures):
+            # Matched as in _sync_procedures.
+            if "id" in procedure:
+                if procedure["id"] in ids:
+                    continue
+            elif (procedure.get("code"), procedure.get("start_date")) in keys:
+                continue
+            missing = [name for name in required if name not in procedure]
+            if missing:
+                raise serializers.ValidationError(
+                    f"Procedure {index} is new and needs {', '.join(missing)}."
+                )
+        return procedures
 
     def create(self, validated_data):
         procedures_data = validated_data.pop("procedures", [])
-        entry = AuthorizationEntry.objects.create(**validated_data)
-        for proc_data in procedures_data:
-            ProcedureDetail.objects.create(authorization_entry=entry, **proc_data)
+        with transaction.atomic():
+            entry = AuthorizationEntry.objects.create(**validated_data)
+            _create_procedures([entry], [procedures_data])
         return entry
 
     def update(self, instance, validated_data):
-        procedures_data = validated_data.pop("procedures", [])
+        procedures_data = validated_data.pop("procedures", None)
 
-        # Update fields on the main instance
-        for attr, value in validated_data.items():
-            setattr(instance, attr, value)
-        instance.save()
+        with transaction.atomic():
+            for attr, value in validated_data.items():
+                setattr(instance, attr, value)
+            instance.save()
 
-        # Optional: clear and recreate all procedures
-        instance.procedures.all().delete()
-        for proc_data in procedures_data:
-            ProcedureDetail.objects.create(authorization_entry=instance, **proc_data)
+            # Partial updates without procedures leave them untouched.
+            if procedures_data is not None:
+                _sync_procedures(instance, procedures_data)
 
         return instance
 
@@ -0,0 +1,212 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from api import summaries
+from api.allergens import (
+    allergen_ids,
+    forget_allergen,
+    vial_allergen_names,
+)
+from api.caching import invalidate_patients
+from api.codes import sync_authorization_codes, sync_vial_codes
+from api.models import (
+    Allergen,
+    AllergenTest,
+    AllergyTemplate,
+    AuthorizationEntry,
+    Patient,
+    PatientSummary,
+    ProcedureDetail,
+    Vial,
+)
+from api.search import sync_patient_name_tokens
+from api.units import reconcile_consumed_units, record_injection_units
+
+
+def _template_patient_id(template):
+    try:
+        return template.vial.patient_id
+    except Vial.DoesNotExist:
+        # The vial is already gone, as part of a cascading delete.
+        return None
+
+
+@receiver(post_save, sender=Patient)
+def index_patient_name(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    sync_patient_name_tokens(instance)
+
+
+@receiver(post_save, sender=Patient)
+def create_patient_summary(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        PatientSummary.objects.get_or_create(patient=instance)
+
+
+@receiver(post_save, sender=Allergen)
+@receiver(post_delete, sender=Allergen)
+def refresh_allergen_cache(sender, instance, **kwargs):
+    forget_allergen(instance.normalized_name)
+
+
+@receiver(post_save, sender=Vial)
+def link_vial_allergens(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    names = list(vial_allergen_names(instance.allergens))
+    instance.allergen_catalog.set(set(allergen_ids(names).values()))
+
+
+@receiver(post_save, sender=Vial)
+def index_vial_codes(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    sync_vial_codes([instance])
+
+
+@receiver(post_save, sender=AllergenTest)
+def summarize_allergen_test(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        summaries.record_test(instance.patient_id, instance.test_date)
+    else:
+        summaries.refresh_patient_summary(instance.patient_id, summaries.TEST_FIELDS)
+
+
+@receiver(post_delete, sender=AllergenTest)
+def unsummarize_allergen_test(sender, instance, **kwargs):
+    summaries.refresh_patient_summary(
+        instance.patient_id, summaries.TEST_FIELDS, create=False
+    )
+
+
+@receiver(pre_save, sender=AllergyTemplate)
+def remember_injection_slot(sender, instance, raw=False, **kwargs):
+    if raw or instance._state.adding:
+        return
+    instance._previous_slot = (
+        AllergyTemplate.objects.filter(pk=instance.pk)
+        .values_list("vial__patient_id", "date")
+        .first()
+    )
+
+
+@receiver(post_save, sender=AllergyTemplate)
+def consume_injection_units(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    slot = (_template_patient_id(instance), instance.date)
+    previous = instance.__dict__.pop("_previous_slot", None)
+    if created:
+        record_injection_units([slot])
+    elif previous is not None and previous != slot:
+        record_injection_units([previous], delta=-1)
+        record_injection_units([slot])
+
+
+@receiver(post_save, sender=AllergyTemplate)
+def summarize_injection(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    patient_id = _template_patient_id(instance)
+    if created:
+        summaries.record_injections(patient_id, instance.date)
+    else:
+        summaries.refresh_patient_summary(patient_id, summaries.INJECTION_FIELDS)
+
+
+@receiver(post_delete, sender=AllergyTemplate)
+def unsummarize_injection(sender, instance, **kwargs):
+    patient_id = _template_patient_id(instance)
+    if patient_id is not None:
+        summaries.refresh_patient_summary(
+            patient_id, summaries.INJECTION_FIELDS, create=False
+        )
+        record_injection_units([(patient_id, instance.date)], delta=-1)
+
+
+@receiver(post_save, sender=ProcedureDetail)
+def count_procedure_units(sender, instance, raw=False, **kwargs):
+    # A new or moved window may already cover logged injections.
+    if raw:
+        return
+    reconcile_consumed_units(ProcedureDetail.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=AuthorizationEntry)
+def summarize_authorization(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    summaries.refresh_patient_summary(
+        instance.patient_id, summaries.AUTHORIZATION_FIELDS
+    )
+
+
+@receiver(post_save, sender=AuthorizationEntry)
+def index_authorization_codes(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    sync_authorization_codes([instance])
+
+
+@receiver(post_delete, sender=AuthorizationEntry)
+def unsummarize_authorization(sender, instance, **kwargs):
+    summaries.refresh_patient_summary(
+        instance.patient_id, summaries.AUTHORIZATION_FIELDS, create=False
+    )
+
+
+@receiver(pre_save, sender=AuthorizationEntry)
+def remember_replaced_document(sender, instance, raw=False, **kwargs):
+    if raw or instance._state.adding or instance.uploaded_doc._committed:
+        return
+    instance._replaced_document = (
+        AuthorizationEntry.objects.filter(pk=instance.pk)
+        .values_list("uploaded_doc", flat=True)
+        .first()
+    )
+
+
+@receiver(post_save, sender=AuthorizationEntry)
+def release_replaced_document(sender, instance, raw=False, **kwargs):
+    # Released after the new file is stored, so re-uploading the same
+    # content never drops its blob to zero references in between.
+    replaced = instance.__dict__.pop("_replaced_document", None)
+    if replaced and replaced != instance.uploaded_doc.name:
+        instance.uploaded_doc.storage.delete(replaced)
+
+
+@receiver(post_delete, sender=AuthorizationEntry)
+def release_document(sender, instance, **kwargs):
+    if instance.uploaded_doc:
+        instance.uploaded_doc.delete(save=False)
+    if instance.document_thumbnail:
+        instance.document_thumbnail.delete(save=False)
+
+
+@receiver(post_save, sender=Vial)
+@receiver(post_delete, sender=Vial)
+@receiver(post_save, sender=AllergenTest)
+@receiver(post_delete, sender=AllergenTest)
+@receiver(post_save, sender=AuthorizationEntry)
+@receiver(post_delete, sender=AuthorizationEntry)
+def invalidate_patient_responses(sender, instance, raw=False, **kwargs):
+    invalidate_patients([instance.patient_id])
+
+
+@receiver(post_save, sender=AllergyTemplate)
+@receiver(post_delete, sender=AllergyTemplate)
+def invalidate_injection_responses(sender, instance, raw=False, **kwargs):
+    invalidate_patients([_template_patient_id(instance)])
+
+
+@receiver(post_save, sender=ProcedureDetail)
+@receiver(post_delete, sender=ProcedureDetail)
+def invalidate_procedure_responses(sender, instance, raw=False, **kwargs):
+    invalidate_patients(
+        AuthorizationEntry.objects.filter(
+            pk=instance.authorization_entry_id
+        ).values_list("patient_id", flat=True)
+    )
@@ -0,0 +1,189 @@
+import hashlib
+import os
+import posixpath
+import re
+import tempfile
+import time
+from datetime import timedelta
+
+from django.core.files.storage import FileSystemStorage, storages
+from django.db import transaction
+from django.db.models import F
+
+PART_SUFFIX = ".part"
+# <upload_to>/<ab>/<sha256><ext>, as written by ContentAddressedStorage._save.
+BLOB_NAME = re.compile(r"(^|/)([0-9a-f]{2})/\2[0-9a-f]{62}(\.[^/]*)?$")
+
+
+def document_storage():
+    """
+    Storage for uploaded documents, configured as STORAGES["documents"].
+    Passed to FileFields as a callable so migrations do not pin the backend.
+    """
+    return storages["documents"]
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File system storage that keeps one copy of each distinct upload.
+
+    Uploads are streamed to a temporary file chunk by chunk while their
+    SHA-256 is computed, then stored as `<upload_to>/<ab>/<digest><ext>`.
+    Saving a file that is already stored only bumps the reference count of
+    its StoredBlob row; deleting releases one reference and the file goes
+    away with the last one, once the release commits. Names without a
+    StoredBlob row (files written before this storage) behave like plain
+    FileSystemStorage files. Files of saves that rolled back are left for
+    `prune` (the prune_documents command).
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # The final name is derived from the content in _save.
+        return name
+
+    def _save(self, name, content):
+        directory, basename = posixpath.split(name)
+        extension = os.path.splitext(basename)[1].lower()
+        os.makedirs(self.path(directory or "."), exist_ok=True)
+
+        digest = hashlib.sha256()
+        size = 0
+        handle, temp_path = tempfile.mkstemp(
+            dir=self.path(directory or "."), suffix=PART_SUFFIX
+        )
+        try:
+            with os.fdopen(handle, "wb") as temp:
+                if hasattr(content, "seek"):
+                    content.seek(0)
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    temp.write(chunk)
+                    size += len(chunk)
+
+            digest = digest.hexdigest()
+            # The reference is taken and the file put in place under the blob
+            # row lock, so a concurrent release of the same content cannot
+            # remove the file in between.
+            with transaction.atomic():
+                stored_name = self._retain(
+                    digest,
+                    posixpath.join(directory, digest[:2], digest + extension),
+                    size,
+                )
+                path = self.path(stored_name)
+                if os.path.exists(path):
+                    os.unlink(temp_path)
+                else:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    os.replace(temp_path, path)
+                    if self.file_permissions_mode is not None:
+                        os.chmod(path, self.file_permissions_mode)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+        return stored_name
+
+    def _retain(self, digest, name, size):
+        """
+        Add a reference to the blob with this digest, creating it if needed,
+        and return the name its content is stored under. Must run in a
+        transaction: the blob row stays locked until it ends.
+        """
+        from api.models import StoredBlob
+
+        blob, created = StoredBlob.objects.select_for_update().get_or_create(
+            digest=digest, defaults={"name": name, "size": size, "ref_count": 1}
+        )
+        if not created:
+            StoredBlob.objects.filter(pk=digest).update(ref_count=F("ref_count") + 1)
+        return blob.name
+
+    def delete(self, name):
+        from api.models import StoredBlob
+
+        if not name:
+            return
+        with transaction.atomic():
+            blob = StoredBlob.objects.select_for_update().filter(name=name).first()
+            if blob is None:
+                transaction.on_commit(
+                    lambda: super(ContentAddressedStorage, self).delete(name)
+                )
+                return
+            if blob.ref_count == 0:
+                # Already released; the file goes once that release commits.
+                return
+            StoredBlob.objects.filter(pk=blob.pk).update(ref_count=F("ref_count") - 1)
+            if blob.ref_count == 1:
+                # The row is kept at zero references until the file is gone,
+                # so that a save of the same content waits for the removal.
+                transaction.on_commit(lambda: self._delete_unreferenced(name))
+
+    def _delete_unreferenced(self, name):
+        from api.models import StoredBlob
+
+        with transaction.atomic():
+            blob = StoredBlob.objects.select_for_update().filter(name=name).first()
+            # The same content may have been uploaded again since the release.
+            if blob is None or blob.ref_count > 0:
+                return
+            super().delete(name)
+            blob.delete()
+
+    def prune(self, directories, grace=timedelta(days=1), dry_run=False):
+        """
+        Delete files under `directories` that no blob row references, such as
+        the ones written by saves whose transaction rolled back, temporary
+        files left by interrupted saves, and released blobs still on disk. Only content-addressed names and
+        files older than `grace` are considered, so files of saves still in
+        flight and files stored before this storage are kept. Returns the
+        names deleted, or that would be with `dry_run`.
+        """
+        from api.models import StoredBlob
+
+        cutoff = time.time() - grace.total_seconds()
+        candidates = []
+        walked = (
+            entry
+            for directory in directories
+            for entry in os.walk(self.path(directory))
+        )
+        for directory, _, filenames in walked:
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                if os.path.getmtime(path) >= cutoff:
+                    continue
+                name = os.path.relpath(path, self.location).replace(os.sep, "/")
+                if filename.endswith(PART_SUFFIX) or BLOB_NAME.search(name):
+                    candidates.append(name)
+
+        referenced = set()
+        for start in range(0, len(candidates), 500):
+            referenced.update(
+                StoredBlob.objects.filter(
+                    name__in=candidates[start : start + 500]
+                ).values_list("name", flat=True)
+            )
+        pruned = []
+        # Released blobs whose removal never ran, e.g. the process exited
+        # between the commit and its on_commit callback.
+        for name in StoredBlob.objects.filter(ref_count=0).values_list(
+            "name", flat=True
+        ):
+            if not dry_run:
+                self._delete_unreferenced(name)
+            pruned.append(name)
+        for name in candidates:
+            if name in referenced:
+                continue
+            if dry_run:
+                pruned.append(name)
+                continue
+            with transaction.atomic():
+                # A save of this content may have committed since the lookup.
+                if StoredBlob.objects.select_for_update().filter(name=name).exists():
+                    continue
+                super().delete(name)
+            pruned.append(name)
+        return pruned
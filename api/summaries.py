@@ -0,0 +1,79 @@
+from django.db.models import Count, F, Max, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from api.models import (
+    AllergenTest,
+    AllergyTemplate,
+    AuthorizationEntry,
+    PatientSummary,
+)
+
+TEST_FIELDS = ("last_test_date",)
+INJECTION_FIELDS = ("last_injection_date", "visit_count")
+AUTHORIZATION_FIELDS = ("auth_expiration_date",)
+ALL_FIELDS = TEST_FIELDS + INJECTION_FIELDS + AUTHORIZATION_FIELDS
+
+
+def _compute(patient_id, fields):
+    values = {}
+    if set(fields) & set(TEST_FIELDS):
+        values.update(
+            AllergenTest.objects.filter(patient_id=patient_id).aggregate(
+                last_test_date=Max("test_date")
+            )
+        )
+    if set(fields) & set(INJECTION_FIELDS):
+        values.update(
+            AllergyTemplate.objects.filter(vial__patient_id=patient_id).aggregate(
+                last_injection_date=Max("date"), visit_count=Count("id")
+            )
+        )
+    if set(fields) & set(AUTHORIZATION_FIELDS):
+        values.update(
+            AuthorizationEntry.objects.filter(patient_id=patient_id).aggregate(
+                auth_expiration_date=Max("expiration_date")
+            )
+        )
+    return values
+
+
+def refresh_patient_summary(patient_id, fields=ALL_FIELDS, create=True):
+    """
+    Recompute the given summary columns of one patient from the source tables.
+
+    With `create=False` a missing summary row is left missing; deletion
+    handlers use this so a cascading patient delete cannot resurrect it.
+    """
+    values = _compute(patient_id, fields)
+    if create:
+        PatientSummary.objects.update_or_create(patient_id=patient_id, defaults=values)
+    else:
+        PatientSummary.objects.filter(patient_id=patient_id).update(**values)
+
+
+def _latest(field, value):
+    return Greatest(Coalesce(field, Value(value)), Value(value))
+
+
+def record_test(patient_id, test_date):
+    """
+    Fold a newly written allergen test into the patient's summary.
+    """
+    updated = PatientSummary.objects.filter(patient_id=patient_id).update(
+        last_test_date=_latest("last_test_date", test_date)
+    )
+    if not updated:
+        refresh_patient_summary(patient_id)
+
+
+def record_injections(patient_id, latest_date, count=1):
+    """
+    Fold `count` newly logged injections, the newest on `latest_date`, into
+    the patient's summary.
+    """
+    updated = PatientSummary.objects.filter(patient_id=patient_id).update(
+        last_injection_date=_latest("last_injection_date", latest_date),
+        visit_count=F("visit_count") + count,
+    )
+    if not updated:
+        refresh_patient_summary(patient_id)
@@ -1,3 +1,2578 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+import time as time_module
+import uuid
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from importlib import import_module
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DatabaseError, connections, transaction
+from django.http import HttpResponse, QueryDict, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import http_date
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from api.models import (
+    Allergen,
+    AuthorizationCode,
+    DocumentJob,
+    StoredBlob,
+    PatientNameToken,
+    PatientSummary,
+    AllergenTest,
+    AllergyTemplate,
+    AuthorizationEntry,
+    Patient,
+    ProcedureDetail,
+    MissedInjectionSnapshot,
+    Vial,
+    VialDiagnosisCode,
+)
+from api import summaries
+from api.allergens import allergen_ids, lookup_allergens
+from api.caching import LRUCache, clear_response_cache
+from api.codes import CPT, ICD10, CodeCatalog, extract_codes, normalize_code
+from api.documents import (
+    claim_document_jobs,
+    enqueue_document_jobs,
+    process_document,
+    run_document_job,
+)
+from api.downloads import parse_range
+from api.middleware import CompressionMiddleware
+from api.pagination import KeysetPagination
+from api.parsers import FastJSONParser, NestedMultiPartParser, nest
+from api.renderers import FastJSONRenderer
+from api.search import NAME_FIELDS, name_tokens, search_patients
+from api.serializers import (
+    AllergenTestSerializer,
+    AuthorizationEntrySerializer,
+    AllergyTemplateSerializer,
+    InjectionSessionSerializer,
+    VialSerializer,
+)
+from api.storage import ContentAddressedStorage
+from api.units import reconcile_consumed_units
+from api.routers import (
+    PIN_COOKIE,
+    REPLICA_DB_ALIAS,
+    PrimaryReplicaRouter,
+    ReplicaRoutingMiddleware,
+    pinned_to_primary,
+    reads_from_replica,
+    use_primary,
+)
+
+
+def create_patient(index, first_name="John", last_name="Doe", **extra):
+    data = {
+        "first_name": first_name,
+        "last_name": last_name,
+        "birth_date": date(1990, 1, 1),
+        "gender": "Male",
+        "marital_status": "Single",
+        "ssn": f"000-00-{index:04d}",
+        "address": "1 Main St",
+        "city": "Albany",
+        "state": "NY",
+        "zip_code": "12207",
+        "phone": "5550000000",
+        "language": "French",
+        "ethnicity": "Hispanic and Latino",
+        "insurance_type": "Primary",
+        "insurance_id": f"INS{index}",
+        "group_number": "G1",
+        "date_of_service": date(2024, 1, 1),
+        "plan_number": f"PLAN{index}",
+        "payer_phone": "5550000001",
+        "payer_fax": "5550000002",
+        "relationship": "Self",
+    }
+    data.update(extra)
+    return Patient.objects.create(**data)
+
+
+def create_authorization(patient, **extra):
+    data = {
+        "patient": patient,
+        "drug_name": "Xolair",
+        "dose": "150mg",
+        "frequency": "Monthly",
+        "insurance": "Aetna",
+        "auth_number": "AUTH1",
+        "expiration_date": date.today(),
+    }
+    data.update(extra)
+    return AuthorizationEntry.objects.create(**data)
+
+
+def use_temporary_document_root(test):
+    """
+    Store authorization documents in a directory removed after `test`. The
+    file fields resolve their storage once at import, so they are patched.
+    """
+    root = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, root, ignore_errors=True)
+    storage = ContentAddressedStorage(location=root)
+    for name in ("uploaded_doc", "document_thumbnail"):
+        patcher = mock.patch.object(
+            AuthorizationEntry._meta.get_field(name), "storage", storage
+        )
+        patcher.start()
+        test.addCleanup(patcher.stop)
+    return root
+
+
+@override_settings(RESPONSE_CACHE_TIMEOUT=0)
+class QueryBudgetTests(TestCase):
+    """
+    Every read endpoint must cost a fixed number of queries no matter how many
+    rows it returns. Each budget is checked against a small and a larger data
+    set so an N+1 lookup shows up as a failure here instead of in production.
+    Budgets are for a cold response cache, so it is turned off, and include
+    the aggregate conditional list views run for their ETag.
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.patient = create_patient(1)
+        self.rows = 0
+
+    def populate(self, rows):
+        """
+        Add `rows` more vials, injections, tests and authorizations.
+        """
+        start, self.rows = self.rows, self.rows + rows
+        allergens = lookup_allergens([f"Allergen {i}" for i in range(start, self.rows)])
+        for i in range(start, self.rows):
+            vial = Vial.objects.create(
+                patient=self.patient,
+                name=f"Vial {i}",
+                allergens=[f"Allergen {i}"],
+            )
+            AllergyTemplate.objects.create(
+                vial=vial,
+                dose="0.1",
+                date=date(2024, 1, 1) + timedelta(days=i),
+                arm="L",
+                peak_flow="300",
+                tech_id="T1",
+                reaction="NR",
+            )
+            AllergenTest.objects.create(
+                patient=self.patient,
+                allergen_id=allergens[f"Allergen {i}"][0],
+                category="Foods",
+                reaction_level="2+",
+                test_date=timezone.now() - timedelta(days=i),
+            )
+            entry = AuthorizationEntry.objects.create(
+                patient=self.patient,
+                drug_name="Xolair",
+                dose="150mg",
+                frequency="Monthly",
+                insurance="Aetna",
+                auth_number=f"AUTH{i}",
+                expiration_date=date.today() + timedelta(days=i),
+            )
+            ProcedureDetail.objects.bulk_create(
+                ProcedureDetail(
+                    authorization_entry=entry,
+                    code="95165",
+                    units=10,
+                    start_date=date(2024, 1, 1),
+                    end_date=date(2024, 12, 31),
+                    frequency="Weekly",
+                )
+                for _ in range(3)
+            )
+
+    def assertQueryBudget(self, budget, url, params=None):
+        for rows in (2, 20):
+            with self.subTest(rows=rows):
+                self.populate(rows - self.rows)
+                with self.assertNumQueries(budget):
+                    response = self.client.get(url, params or {})
+                self.assertLess(response.status_code, 400, response.content)
+
+    def test_patient_search(self):
+        self.assertQueryBudget(1, "/api/search/", {"name": "john"})
+
+    def test_vial_list(self):
+        self.assertQueryBudget(2, "/api/vials/", {"patient": self.patient.id})
+
+    def test_vial_list_paginated(self):
+        self.assertQueryBudget(2, "/api/vials/", {"page_size": 5})
+
+    def test_allergy_template_list(self):
+        self.assertQueryBudget(
+            2, "/api/allergy-templates/", {"patient": self.patient.id}
+        )
+
+    def test_allergy_template_list_paginated(self):
+        self.assertQueryBudget(2, "/api/allergy-templates/", {"page_size": 5})
+
+    def test_allergen_test_list(self):
+        self.assertQueryBudget(
+            2, "/api/allergen-tests/", {"patientId": self.patient.id}
+        )
+
+    def test_allergen_matrix(self):
+        self.assertQueryBudget(
+            1, "/api/allergen-tests/matrix/", {"patient": self.patient.id}
+        )
+
+    def test_missed_injections(self):
+        self.assertQueryBudget(1, "/api/missed-injections/")
+
+    def test_reaction_analytics(self):
+        self.assertQueryBudget(
+            3, "/api/analytics/reactions/", {"patient": self.patient.id}
+        )
+
+    def test_authorization_entries(self):
+        self.assertQueryBudget(
+            3, "/api/authorization-entries/", {"patient_id": self.patient.id}
+        )
+
+    def test_expiring_authorizations(self):
+        self.assertQueryBudget(2, "/api/authorization-entries/expiring/", {"days": 60})
+
+    def test_low_units(self):
+        self.assertQueryBudget(
+            1, "/api/authorization-entries/low-units/", {"threshold": 10}
+        )
+
+    def test_not_modified(self):
+        self.populate(5)
+        for url, params in [
+            ("/api/vials/", {"patient": self.patient.id}),
+            ("/api/allergy-templates/", {"patient": self.patient.id}),
+            ("/api/allergen-tests/", {"patientId": self.patient.id}),
+            ("/api/authorization-entries/", {"patient_id": self.patient.id}),
+        ]:
+            with self.subTest(url=url):
+                etag = self.client.get(url, params)["ETag"]
+                with self.assertNumQueries(1):
+                    response = self.client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.content, b"")
+
+
+class ReplicaRouterTests(SimpleTestCase):
+    """
+    Safe requests read from the replica until they write; writes, forced
+    requests and clients pinned by a recent write stay on the primary.
+    """
+
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+        self.factory = RequestFactory()
+        replica = mock.patch.dict(
+            connections.databases, {REPLICA_DB_ALIAS: connections.databases["default"]}
+        )
+        replica.start()
+        self.addCleanup(replica.stop)
+
+    def route(self, request, write=False):
+        """
+        Run `request` through the middleware and return the read aliases seen
+        before and after an optional write, plus the response.
+        """
+        seen = []
+
+        def view(request):
+            seen.append(self.router.db_for_read(Patient))
+            if write:
+                seen.append(self.router.db_for_write(Patient))
+            seen.append(self.router.db_for_read(Patient))
+            return HttpResponse()
+
+        response = ReplicaRoutingMiddleware(view)(request)
+        return seen, response
+
+    def test_outside_request_uses_primary(self):
+        self.assertEqual(self.router.db_for_read(Patient), "default")
+
+    def test_safe_request_reads_replica(self):
+        seen, response = self.route(self.factory.get("/"))
+        self.assertEqual(seen, [REPLICA_DB_ALIAS, REPLICA_DB_ALIAS])
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    def test_write_pins_request_and_client(self):
+        seen, response = self.route(self.factory.get("/"), write=True)
+        self.assertEqual(seen, [REPLICA_DB_ALIAS, "default", "default"])
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+    def test_unsafe_request_uses_primary(self):
+        seen, _ = self.route(self.factory.post("/"))
+        self.assertEqual(seen, ["default", "default"])
+
+    def test_pinned_or_forced_request_uses_primary(self):
+        pinned = self.factory.get("/")
+        pinned.COOKIES[PIN_COOKIE] = "1"
+        forced = self.factory.get("/", HTTP_X_DB_PRIMARY="1")
+        for request in (pinned, forced):
+            seen, _ = self.route(request)
+            self.assertEqual(seen, ["default", "default"])
+
+    def test_cache_routing_flags(self):
+        def view(request):
+            return HttpResponse(f"{reads_from_replica()} {pinned_to_primary()}")
+
+        forced = self.factory.get("/", HTTP_X_DB_PRIMARY="1")
+        for request, expected in (
+            (self.factory.get("/"), b"True False"),
+            (forced, b"False True"),
+        ):
+            response = ReplicaRoutingMiddleware(view)(request)
+            self.assertEqual(response.content, expected)
+        self.assertFalse(reads_from_replica() or pinned_to_primary())
+
+    def test_use_primary(self):
+        def view(request):
+            with use_primary():
+                alias = self.router.db_for_read(Patient)
+            return HttpResponse(alias)
+
+        response = ReplicaRoutingMiddleware(view)(self.factory.get("/"))
+        self.assertEqual(response.content, b"default")
+
+    def test_replica_is_not_migrated(self):
+        self.assertTrue(self.router.allow_migrate("default", "api"))
+        self.assertFalse(self.router.allow_migrate(REPLICA_DB_ALIAS, "api"))
+
+
+@override_settings(
+    CACHES={
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+        "responses": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "responses",
+        },
+    },
+    RESPONSE_CACHE_ALIAS="responses",
+    RESPONSE_CACHE_TIMEOUT=300,
+)
+class ResponseCacheTests(TestCase):
+    """
+    Repeat loads of a patient's data are served from the response cache, and
+    any write for that patient, bulk paths included, retires it.
+    """
+
+    def setUp(self):
+        clear_response_cache()
+        self.addCleanup(clear_response_cache)
+        self.client = APIClient()
+        self.patient = create_patient(1)
+        self.other = create_patient(2)
+        self.vial = Vial.objects.create(patient=self.patient, name="Vial 1")
+
+    def log_injections(self, count):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                "/api/allergy-templates/bulk/",
+                {
+                    "patient": self.patient.id,
+                    "injections": [
+                        {
+                            "vial": self.vial.id,
+                            "dose": "0.1",
+                            "date": f"2024-01-{day + 1:02d}",
+                            "arm": "L",
+                            "peak_flow": "300",
+                            "tech_id": "T1",
+                            "reaction": "NR",
+                        }
+                        for day in range(count)
+                    ],
+                },
+                format="json",
+            )
+        self.assertEqual(response.status_code, 201, response.content)
+
+    def get_templates(self, patient):
+        response = self.client.get("/api/allergy-templates/", {"patient": patient.id})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_repeat_load_skips_database(self):
+        self.log_injections(2)
+        first = self.get_templates(self.patient)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_templates(self.patient), first)
+
+    def test_conditional_repeat_load_skips_database(self):
+        self.log_injections(1)
+        response = self.client.get(
+            "/api/allergy-templates/", {"patient": self.patient.id}
+        )
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                "/api/allergy-templates/",
+                {"patient": self.patient.id},
+                HTTP_IF_NONE_MATCH=response["ETag"],
+            )
+        self.assertEqual(response.status_code, 304)
+
+    def test_bulk_write_invalidates_patient(self):
+        self.log_injections(1)
+        self.assertEqual(len(self.get_templates(self.patient)), 1)
+        self.get_templates(self.other)
+
+        self.log_injections(2)
+        self.assertEqual(len(self.get_templates(self.patient)), 3)
+        with self.assertNumQueries(0):
+            self.get_templates(self.other)
+
+    def test_delete_invalidates_patient(self):
+        self.log_injections(1)
+        self.assertEqual(len(self.get_templates(self.patient)), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            AllergyTemplate.objects.filter(vial=self.vial).delete()
+        self.assertEqual(self.get_templates(self.patient), [])
+
+    def test_write_on_one_worker_invalidates_the_others(self):
+        # Each worker has its own in-process tier; only the shared one is
+        # common to them.
+        workers = [LRUCache(), LRUCache()]
+
+        def load(worker):
+            with mock.patch("api.caching._local", worker):
+                return self.get_templates(self.patient)
+
+        self.log_injections(1)
+        for worker in workers:
+            self.assertEqual(len(load(worker)), 1)
+        with self.assertNumQueries(0):
+            load(workers[1])
+
+        with mock.patch("api.caching._local", workers[0]):
+            self.log_injections(1)
+        self.assertEqual(len(load(workers[1])), 2)
+
+    def test_replica_reads_are_not_stored(self):
+        self.log_injections(1)
+        with mock.patch("api.caching.reads_from_replica", return_value=True):
+            self.get_templates(self.patient)
+        with CaptureQueriesContext(connections["default"]) as queries:
+            self.get_templates(self.patient)
+        self.assertTrue(queries.captured_queries)
+        with self.assertNumQueries(0):
+            self.get_templates(self.patient)
+
+    def test_pinned_requests_skip_cache(self):
+        self.log_injections(1)
+        self.get_templates(self.patient)
+        # Changed without invalidation: only an uncached read can see it.
+        AllergyTemplate.objects.update(dose="0.5")
+        self.assertEqual(self.get_templates(self.patient)[0]["dose"], "0.1")
+        with mock.patch("api.caching.pinned_to_primary", return_value=True):
+            self.assertEqual(self.get_templates(self.patient)[0]["dose"], "0.5")
+
+    @override_settings(RESPONSE_CACHE_ALIAS="")
+    def test_nothing_cached_without_shared_tier(self):
+        self.log_injections(1)
+        self.get_templates(self.patient)
+        with CaptureQueriesContext(connections["default"]) as queries:
+            self.get_templates(self.patient)
+        self.assertTrue(queries.captured_queries)
+
+
+@override_settings(RESPONSE_CACHE_TIMEOUT=0)
+class ConditionalGetTests(TestCase):
+    """
+    List validators change with every insert, update or delete of the rows a
+    response shows, including embedded related rows.
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.patient = create_patient(1)
+        entry = AuthorizationEntry.objects.create(
+            patient=self.patient,
+            drug_name="Xolair",
+            dose="150mg",
+            frequency="Monthly",
+            insurance="Aetna",
+            auth_number="AUTH1",
+            expiration_date=date.today(),
+        )
+        self.procedures = [
+            ProcedureDetail.objects.create(
+                authorization_entry=entry,
+                code=code,
+                units=10,
+                start_date=date(2024, 1, 1),
+                end_date=date(2024, 12, 31),
+                frequency="Weekly",
+            )
+            for code in ("95165", "95117")
+        ]
+
+    def get(self, etag=None):
+        headers = {"HTTP_IF_NONE_MATCH": etag} if etag else {}
+        return self.client.get(
+            "/api/authorization-entries/", {"patient_id": self.patient.id}, **headers
+        )
+
+    def test_related_update_and_delete_change_etag(self):
+        etag = self.get()["ETag"]
+        self.assertEqual(self.get(etag).status_code, 304)
+
+        newest = self.procedures[-1]
+        newest.units = 20
+        newest.save()
+        response = self.get(etag)
+        self.assertEqual(response.status_code, 200)
+
+        etag = response["ETag"]
+        self.procedures[0].delete()
+        response = self.get(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()[0]["procedures"]), 1)
+
+    def test_delete_of_older_row_changes_validators(self):
+        older = Vial.objects.create(patient=self.patient, name="Older")
+        Vial.objects.create(patient=self.patient, name="Newer")
+        params = {"patient": self.patient.id}
+        response = self.client.get("/api/vials/", params)
+        self.assertNotIn("Last-Modified", response)
+        etag = response["ETag"]
+
+        older.delete()
+        since = http_date(time_module.time() + 60)
+        response = self.client.get(
+            "/api/vials/", params, HTTP_IF_NONE_MATCH=etag, HTTP_IF_MODIFIED_SINCE=since
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row["name"] for row in response.json()], ["Newer"])
+        response = self.client.get("/api/vials/", params, HTTP_IF_MODIFIED_SINCE=since)
+        self.assertEqual(response.status_code, 200)
+
+
+class FastJSONTests(SimpleTestCase):
+    """
+    The fast renderer and parser are interchangeable with DRF's, and large
+    text responses are compressed while small or binary ones are not.
+    """
+
+    data = {
+        "when": datetime(2024, 5, 1, 8, 30, 15, 123456, tzinfo=dt_timezone.utc),
+        "day": date(2024, 5, 1),
+        "at": time(8, 30),
+        "cost": Decimal("12.50"),
+        "id": uuid.UUID("12345678-1234-5678-1234-567812345678"),
+        "notes": "line\u2028separator, caf\u00e9",
+        "counts": {1: 2},
+        "rows": [None, True, 1.5, ("a", "b")],
+    }
+
+    def test_renderer_matches_drf(self):
+        self.assertEqual(
+            FastJSONRenderer().render(self.data), JSONRenderer().render(self.data)
+        )
+
+    def test_floats(self):
+        data = {"rows": [1e16, 1e-7, 0.1, 2.0]}
+        self.assertEqual(
+            json.loads(FastJSONRenderer().render(data)),
+            json.loads(JSONRenderer().render(data)),
+        )
+        for value in (float("nan"), float("inf"), -float("inf"), Decimal("NaN")):
+            data = {"rows": [{"rate": value}, None]}
+            for renderer in (FastJSONRenderer(), JSONRenderer()):
+                with self.assertRaises(ValueError):
+                    renderer.render(data)
+
+    def test_stdlib_fallback(self):
+        with mock.patch("api.renderers.orjson", None), mock.patch(
+            "api.parsers.orjson", None
+        ):
+            body = FastJSONRenderer().render(self.data)
+            self.assertEqual(body, JSONRenderer().render(self.data))
+            self.assertEqual(
+                FastJSONParser().parse(io.BytesIO(b'{"a": [1, null]}')),
+                {"a": [1, None]},
+            )
+
+    def test_parser_round_trip(self):
+        body = FastJSONRenderer().render({"a": [1, "b", None]})
+        self.assertEqual(
+            FastJSONParser().parse(io.BytesIO(body)), {"a": [1, "b", None]}
+        )
+
+    def test_compression(self):
+        factory = RequestFactory()
+        request = factory.get("/", HTTP_ACCEPT_ENCODING="gzip")
+        body = FastJSONRenderer().render([self.data] * 50)
+
+        def respond(content, content_type="application/json"):
+            return CompressionMiddleware(
+                lambda request: HttpResponse(content, content_type=content_type)
+            )(request)
+
+        response = respond(body)
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(response.content), body)
+        self.assertNotIn("Content-Encoding", respond(b"[]"))
+        self.assertNotIn("Content-Encoding", respond(body, "application/pdf"))
+
+        streamed = CompressionMiddleware(
+            lambda request: StreamingHttpResponse(
+                iter([body, body]), content_type="text/csv"
+            )
+        )(request)
+        self.assertEqual(
+            gzip.decompress(b"".join(streamed.streaming_content)), body + body
+        )
+
+
+@override_settings(RESPONSE_CACHE_TIMEOUT=0)
+class ProjectionParityTests(TestCase):
+    """
+    The values()-based list endpoints return exactly the bytes the model
+    serializers would.
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.patient = create_patient(1, middle_name="Q")
+        create_patient(2, last_name="Doerr")
+        PatientSummary.objects.filter(patient=self.patient).update(
+            last_test_date=datetime(2024, 3, 1, 23, 30, tzinfo=dt_timezone.utc),
+            visit_count=4,
+            auth_expiration_date=date(2024, 9, 1),
+            last_injection_date=date(2024, 2, 1),
+        )
+        allergens = lookup_allergens(["Cat", "Ragweed"])
+        for index, (expires, notes) in enumerate(
+            [(None, None), (date(2025, 1, 1), "Large local \u2028 reaction")]
+        ):
+            vial = Vial.objects.create(
+                patient=self.patient,
+                name=f"Vial {index}",
+                expiration_date=expires,
+                allergens=["Cat", {"name": "Ragweed", "dilution": 0.5}],
+                diagnosis_codes=["J30.1 - Allergic rhinitis"],
+            )
+            AllergyTemplate.objects.create(
+                vial=vial,
+                dose="0.05",
+                date=date(2024, 1, 1 + index),
+                arm="R",
+                peak_flow="320",
+                tech_id="T2",
+                reaction="NR",
+                notes=notes,
+            )
+        for (pk, _), size in zip(allergens.values(), [None, "7mm"]):
+            AllergenTest.objects.create(
+                patient=self.patient,
+                allergen_id=pk,
+                category="food",
+                reaction_level="2+" if size is None else None,
+                custom_size=size,
+            )
+
+    def assertSameBody(self, url, params, serializer_class, queryset, ordering):
+        """
+        Compare the plain list, whose order comes from the view's queryset,
+        and the first keyset page.
+        """
+        response = self.client.get(url, params)
+        expected = serializer_class(queryset, many=True).data
+        self.assertEqual(response.content, JSONRenderer().render(expected))
+
+        response = self.client.get(url, {**params, "page_size": 1})
+        first = serializer_class(queryset.order_by(*ordering)[:1], many=True).data
+        expected = {"next": response.json()["next"], "results": first}
+        self.assertEqual(response.content, JSONRenderer().render(expected))
+
+    def test_vials(self):
+        self.assertSameBody(
+            "/api/vials/",
+            {"patient": self.patient.id},
+            VialSerializer,
+            Vial.objects.filter(patient=self.patient),
+            ("-created_at", "-id"),
+        )
+
+    def test_allergy_templates(self):
+        self.assertSameBody(
+            "/api/allergy-templates/",
+            {"patient": self.patient.id},
+            AllergyTemplateSerializer,
+            AllergyTemplate.objects.filter(vial__patient=self.patient),
+            ("-date", "-id"),
+        )
+
+    def test_allergen_tests(self):
+        self.assertSameBody(
+            "/api/allergen-tests/",
+            {"patientId": self.patient.id},
+            AllergenTestSerializer,
+            AllergenTest.objects.filter(patient=self.patient).order_by("-test_date"),
+            ("-test_date", "-id"),
+        )
+
+    def test_patient_search(self):
+        expected = []
+        for patient in Patient.objects.select_related("summary").order_by("id"):
+            summary = getattr(patient, "summary", None) or PatientSummary()
+            expected.append(
+                {
+                    "Patient Id": patient.id,
+                    "Patient Name": f"{patient.first_name} {patient.middle_name} {patient.last_name}",
+                    "Date of birth": patient.birth_date,
+                    "Last Test Date": summary.last_test_label,
+                    "Insurance": patient.insurance_type,
+                    "Referral": "Yes" if patient.referral else "No",
+                    "Visits/Exp": summary.visits_exp_label,
+                    "Billout Date": summary.billout_label,
+                }
+            )
+        response = self.client.get("/api/search/", {"name": "john"})
+        rows = sorted(response.json(), key=lambda row: row["Patient Id"])
+        self.assertEqual(rows, json.loads(JSONRenderer().render(expected)))
+
+
+@override_settings(RESPONSE_CACHE_TIMEOUT=0)
+class SparseFieldsetTests(TestCase):
+    """
+    `?fields=` and `?exclude=` trim the response and the columns read.
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.patient = create_patient(1)
+        vial = Vial.objects.create(
+            patient=self.patient, name="Trees", allergens=["Oak"]
+        )
+        AllergyTemplate.objects.create(
+            vial=vial, dose="0.05", date=date(2024, 1, 1), notes="Tolerated well"
+        )
+        entry = AuthorizationEntry.objects.create(
+            patient=self.patient,
+            drug_name="Xolair",
+            dose="150mg",
+            frequency="Monthly",
+            insurance="Aetna",
+            auth_number="AUTH1",
+            expiration_date=date.today(),
+            visit_history="Visit notes",
+        )
+        ProcedureDetail.objects.create(
+            authorization_entry=entry,
+            code="95165",
+            units=10,
+            start_date=date(2024, 1, 1),
+            end_date=date(2024, 12, 31),
+            frequency="Weekly",
+        )
+
+    def get(self, url, params):
+        with CaptureQueriesContext(connections["default"]) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        sql = " ".join(query["sql"] for query in queries.captured_queries)
+        return response.json(), sql
+
+    def test_projected_list(self):
+        rows, sql = self.get(
+            "/api/vials/", {"patient": self.patient.id, "fields": "id,name"}
+        )
+        self.assertEqual(list(rows[0]), ["id", "name"])
+        self.assertNotIn('"allergens"', sql)
+
+        page, sql = self.get(
+            "/api/allergy-templates/",
+            {"patient": self.patient.id, "exclude": "notes", "page_size": 1},
+        )
+        self.assertNotIn("notes", page["results"][0])
+        self.assertIn("dose", page["results"][0])
+        self.assertNotIn('"notes"', sql)
+
+    def test_authorization_entries(self):
+        params = {"patient_id": self.patient.id}
+        rows, sql = self.get(
+            "/api/authorization-entries/", {**params, "fields": "id,drug_name"}
+        )
+        self.assertEqual(rows, [{"id": rows[0]["id"], "drug_name": "Xolair"}])
+        self.assertNotIn('"visit_history"', sql)
+        self.assertNotIn('"document_text"', sql)
+        self.assertNotIn('FROM "api_proceduredetail"', sql)
+
+        rows, sql = self.get(
+            "/api/authorization-entries/", {**params, "exclude": "visit_history"}
+        )
+        self.assertNotIn("visit_history", rows[0])
+        self.assertEqual(rows[0]["procedures"][0]["code"], "95165")
+        self.assertNotIn('"visit_history"', sql)
+
+    def test_report_without_procedures(self):
+        page, sql = self.get(
+            "/api/authorization-entries/expiring/", {"exclude": "procedures"}
+        )
+        self.assertEqual(page["results"][0]["auth_number"], "AUTH1")
+        self.assertNotIn("procedures", page["results"][0])
+        self.assertNotIn('FROM "api_proceduredetail"', sql)
+
+    def test_unfiltered_response_unchanged(self):
+        rows, _ = self.get("/api/vials/", {"patient": self.patient.id})
+        expected = VialSerializer(Vial.objects.all(), many=True).data
+        self.assertEqual(rows, json.loads(JSONRenderer().render(expected)))
+
+
+@override_settings(RESPONSE_CACHE_TIMEOUT=0)
+class AllergenCatalogTests(TestCase):
+    """
+    Allergen names are resolved to catalog rows only when a test is saved.
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.patient = create_patient(1)
+
+    def test_invalid_request_adds_no_allergen(self):
+        response = self.client.post(
+            "/api/allergen-tests/",
+            {
+                "allergen_name": "Birch",
+                "patient": self.patient.id + 1000,
+                "category": "environmental",
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Allergen.objects.filter(normalized_name="birch").exists())
+
+    def test_create_and_rename(self):
+        response = self.client.post(
+            "/api/allergen-tests/",
+            {
+                "allergen_name": "Dust-Mite",
+                "patient": self.patient.id,
+                "category": "environmental",
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["allergen_name"], "Dust-Mite")
+        test = AllergenTest.objects.get()
+        self.assertEqual(test.allergen.normalized_name, "dust mite")
+
+        response = self.client.patch(
+            f"/api/allergen-tests/{test.pk}/",
+            {"allergen_name": "dust  mite"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Allergen.objects.count(), 1)
+
+        response = self.client.patch(
+            f"/api/allergen-tests/{test.pk}/", {"allergen_name": "Cat"}, format="json"
+        )
+        self.assertEqual(response.json()["allergen_name"], "Cat")
+        test.refresh_from_db()
+        self.assertEqual(test.allergen.normalized_name, "cat")
+
+
+class AllergenPanelTests(TestCase):
+    """
+    Panels upsert one row per (patient, allergen, test date), and single test
+    creates use the same key.
+    """
+
+    first = "2024-03-01T10:00:00Z"
+    second = "2024-04-01T10:00:00Z"
+
+    def setUp(self):
+        self.client = APIClient()
+        self.patient = create_patient(1)
+
+    def panel(self, test_date, results):
+        return self.client.post(
+            "/api/allergen-tests/panel/",
+            {"patient": self.patient.id, "test_date": test_date, "results": results},
+            format="json",
+        )
+
+    def result(self, name, level="1+", category="environmental"):
+        return {"allergen_name": name, "category": category, "reaction_level": level}
+
+    def test_insert_then_update_same_date(self):
+        response = self.panel(self.first, [self.result("Cat"), self.result("Birch")])
+        self.assertEqual(response.status_code, 201)
+        rows = response.json()
+        self.assertEqual([row["allergen_name"] for row in rows], ["Birch", "Cat"])
+        self.assertEqual({row["reaction_level"] for row in rows}, {"1+"})
+        self.assertEqual({row["patient"] for row in rows}, {self.patient.id})
+
+        response = self.panel(self.first, [self.result("cat", level="3+")])
+        self.assertEqual(response.status_code, 201)
+        (row,) = response.json()
+        self.assertEqual((row["allergen_name"], row["reaction_level"]), ("Cat", "3+"))
+        self.assertEqual(row["reaction_grade"], 3)
+        self.assertEqual(AllergenTest.objects.count(), 2)
+        self.assertEqual(row["id"], AllergenTest.objects.get(allergen__name="Cat").pk)
+
+        self.panel(self.second, [self.result("Cat")])
+        self.assertEqual(AllergenTest.objects.count(), 3)
+        self.patient.summary.refresh_from_db()
+        self.assertEqual(self.patient.summary.last_test_date.month, 4)
+
+    def test_duplicate_names_rejected(self):
+        response = self.panel(
+            self.first, [self.result("Dust-Mite"), self.result("dust mite")]
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("dust mite", str(response.json()["results"]))
+        self.assertFalse(AllergenTest.objects.exists())
+
+    def test_single_create_after_panels(self):
+        self.panel(self.first, [self.result("Cat")])
+        self.panel(self.second, [self.result("Cat")])
+        data = {
+            "allergen_name": "cat",
+            "patient": self.patient.id,
+            "category": "environmental",
+            "reaction_level": "2+",
+        }
+        response = self.client.post(
+            "/api/allergen-tests/", {**data, "test_date": self.second}, format="json"
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(AllergenTest.objects.count(), 2)
+        self.assertEqual(
+            AllergenTest.objects.get(test_date__month=4).reaction_level, "2+"
+        )
+
+        response = self.client.post("/api/allergen-tests/", data, format="json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(AllergenTest.objects.count(), 3)
+
+
+@override_settings(RESPONSE_CACHE_TIMEOUT=0)
+class AllergenMatrixTests(TestCase):
+    """
+    Matrix payloads for one patient and for a cohort, in dense and sparse
+    layouts.
+    """
+
+    first = datetime(2024, 3, 1, 10, tzinfo=dt_timezone.utc)
+    second = datetime(2024, 4, 1, 10, tzinfo=dt_timezone.utc)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.patient = create_patient(1)
+        self.other = create_patient(2)
+        self.outsider = create_patient(3)
+        self.allergens = allergen_ids(["Birch", "cat", "Dust"])
+        self.add(self.patient, "Birch", self.first, reaction_level="1+")
+        self.add(self.patient, "Birch", self.second, reaction_level="3+")
+        self.add(self.patient, "cat", self.first, custom_size="5mm")
+        self.add(self.patient, "Dust", self.second, reaction_level="2+")
+        # Saved newest first, so the cohort view has to go by date, not id.
+        self.add(self.other, "cat", self.second, reaction_level="2+")
+        self.add(self.other, "cat", self.first, reaction_level="1+")
+        self.add(self.outsider, "Dust", self.first, reaction_level="3+")
+
+    def add(self, patient, name, test_date, **result):
+        AllergenTest.objects.create(
+            patient=patient,
+            allergen_id=self.allergens[name],
+            category="environmental",
+            test_date=test_date,
+            **result,
+        )
+
+    def matrix(self, **params):
+        response = self.client.get("/api/allergen-tests/matrix/", params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_patient_matrix(self):
+        data = self.matrix(patient=self.patient.id)
+        self.assertEqual(data["value"], "grade")
+        self.assertEqual(
+            data["rows"],
+            {
+                "ids": [self.allergens[name] for name in ("Birch", "cat", "Dust")],
+                "labels": ["Birch", "cat", "Dust"],
+            },
+        )
+        self.assertEqual(
+            data["columns"],
+            {"test_dates": ["2024-03-01T10:00:00Z", "2024-04-01T10:00:00Z"]},
+        )
+        # Half the cells are filled, so auto picks the dense layout.
+        self.assertEqual(data["layout"], "dense")
+        self.assertEqual(data["values"], [[1, 3], [None, None], [None, 2]])
+
+        data = self.matrix(patient=self.patient.id, layout="sparse")
+        self.assertEqual(
+            (data["layout"], data["row"], data["col"], data["values"]),
+            ("sparse", [0, 0, 2], [0, 1, 1], [1, 3, 2]),
+        )
+
+        data = self.matrix(patient=self.patient.id, value="mm")
+        self.assertEqual(
+            (data["layout"], data["row"], data["col"], data["values"]),
+            ("sparse", [1], [0], [5.0]),
+        )
+        data = self.matrix(patient=self.patient.id, value="mm", layout="dense")
+        self.assertEqual(data["values"], [[None, None], [5.0, None], [None, None]])
+
+    def test_cohort_matrix_uses_latest_result(self):
+        patients = f"{self.patient.id},{self.other.id}"
+        data = self.matrix(patients=patients, layout="dense")
+        self.assertEqual(data["rows"], {"ids": [self.patient.id, self.other.id]})
+        self.assertEqual(
+            data["columns"],
+            {
+                "ids": [self.allergens[name] for name in ("Birch", "cat", "Dust")],
+                "labels": ["Birch", "cat", "Dust"],
+            },
+        )
+        self.assertEqual(data["values"], [[3, None, 2], [None, 2, None]])
+
+        data = self.matrix(patients=patients, layout="sparse")
+        self.assertEqual(
+            (data["row"], data["col"], data["values"]),
+            ([0, 0, 1], [0, 2, 1], [3, 2, 2]),
+        )
+
+    def test_invalid_parameters(self):
+        url = "/api/allergen-tests/matrix/"
+        for params in [
+            {"patient": self.patient.id, "value": "size"},
+            {"patient": self.patient.id, "layout": "csr"},
+            {"patients": "1,x"},
+            {},
+        ]:
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(url, params).status_code, 400)
+
+
+class DocumentJobTests(TestCase):
+    """
+    The document queue: claiming, retries, deleted entries and the
+    compression and thumbnail pipeline (with the PDF tools mocked).
+    """
+
+    def setUp(self):
+        self.root = use_temporary_document_root(self)
+        self.patient = create_patient(1)
+
+    def create_entry(self, content=b"%PDF-1.4 original", name="auth.pdf"):
+        return create_authorization(
+            self.patient, uploaded_doc=SimpleUploadedFile(name, content)
+        )
+
+    def test_enqueue_skips_entries_without_document(self):
+        with_doc = self.create_entry()
+        without_doc = create_authorization(self.patient, auth_number="AUTH2")
+        enqueue_document_jobs([with_doc, without_doc])
+        self.assertEqual(
+            list(DocumentJob.objects.values_list("authorization_entry", flat=True)),
+            [with_doc.pk],
+        )
+
+    def test_claim_and_stale_takeover(self):
+        enqueue_document_jobs([self.create_entry(), self.create_entry(b"%PDF-2")])
+        first, second = DocumentJob.objects.order_by("id")
+
+        self.assertEqual(claim_document_jobs(1), [first.pk])
+        self.assertEqual(claim_document_jobs(10), [second.pk])
+        self.assertEqual(claim_document_jobs(10), [])
+
+        DocumentJob.objects.filter(pk=first.pk).update(
+            updated_at=timezone.now() - timedelta(hours=1)
+        )
+        self.assertEqual(claim_document_jobs(10), [first.pk])
+        first.refresh_from_db()
+        self.assertEqual((first.status, first.attempts), (DocumentJob.RUNNING, 2))
+
+    def test_retry_until_max_attempts(self):
+        enqueue_document_jobs([self.create_entry()])
+        job = DocumentJob.objects.get()
+        with mock.patch(
+            "api.documents.process_document", side_effect=OSError("disk full")
+        ):
+            for status in (DocumentJob.PENDING, DocumentJob.FAILED):
+                self.assertEqual(claim_document_jobs(10), [job.pk])
+                with self.assertLogs("api.documents", "ERROR"):
+                    self.assertFalse(run_document_job(job.pk, max_attempts=2))
+                job.refresh_from_db()
+                self.assertEqual(job.status, status)
+        self.assertEqual(job.last_error, "disk full")
+        self.assertEqual(claim_document_jobs(10), [])
+
+    def test_deleted_entry_is_skipped(self):
+        entry = self.create_entry()
+        enqueue_document_jobs([entry])
+        job_ids = claim_document_jobs(10)
+        entry.delete()
+        self.assertIsNone(run_document_job(job_ids[0]))
+
+        out = io.StringIO()
+        with mock.patch(
+            "api.management.commands.process_document_jobs.claim_document_jobs",
+            side_effect=[job_ids, []],
+        ):
+            call_command("process_document_jobs", "--once", stdout=out)
+        self.assertIn("0 failed, 1 skipped", out.getvalue())
+
+    @staticmethod
+    def write(name, content, before=None):
+        """
+        A stand-in for a PDF tool that writes `content` to `name` in the
+        job's work directory, calling `before` first.
+        """
+
+        def tool(source, workdir):
+            if before is not None:
+                before()
+            path = os.path.join(workdir, name)
+            with open(path, "wb") as f:
+                f.write(content)
+            return path
+
+        return tool
+
+    def test_pdf_is_compressed_thumbnailed_and_indexed(self):
+        entry = self.create_entry()
+        original = entry.uploaded_doc.name
+        write = self.write
+
+        with mock.patch(
+            "api.documents.compress_pdf", side_effect=write("c.pdf", b"%PDF-small")
+        ), mock.patch(
+            "api.documents.render_thumbnail", side_effect=write("t.png", b"PNG")
+        ), mock.patch(
+            "api.documents.extract_text", return_value="Xolair 150mg"
+        ), self.captureOnCommitCallbacks(
+            execute=True
+        ):
+            process_document(entry)
+
+        entry.refresh_from_db()
+        self.assertNotEqual(entry.uploaded_doc.name, original)
+        self.assertEqual(entry.uploaded_doc_name, "auth.pdf")
+        with entry.uploaded_doc.open("rb") as f:
+            self.assertEqual(f.read(), b"%PDF-small")
+        with entry.document_thumbnail.open("rb") as f:
+            self.assertEqual(f.read(), b"PNG")
+        self.assertEqual(entry.document_text, "Xolair 150mg")
+        self.assertIsNotNone(entry.document_processed_at)
+        # The replaced original was its blob's only reference.
+        self.assertFalse(StoredBlob.objects.filter(name=original).exists())
+        self.assertFalse(os.path.exists(os.path.join(self.root, original)))
+
+    def test_entry_deleted_while_processing_releases_new_files(self):
+        entry = self.create_entry()
+
+        def deleted():
+            AuthorizationEntry.objects.get(pk=entry.pk).delete()
+
+        with mock.patch(
+            "api.documents.compress_pdf",
+            side_effect=self.write("c.pdf", b"%PDF-small", before=deleted),
+        ), mock.patch(
+            "api.documents.render_thumbnail", side_effect=self.write("t.png", b"PNG")
+        ), mock.patch(
+            "api.documents.extract_text", return_value=None
+        ), self.captureOnCommitCallbacks(
+            execute=True
+        ):
+            with self.assertRaises(DatabaseError):
+                process_document(entry)
+
+        new_names = [entry.uploaded_doc.name, entry.document_thumbnail.name]
+        self.assertFalse(StoredBlob.objects.exists())
+        for name in new_names:
+            self.assertFalse(os.path.exists(os.path.join(self.root, name)))
+
+    def test_other_files_are_only_marked_processed(self):
+        entry = self.create_entry(b"plain text", name="auth.txt")
+        with mock.patch("api.documents.compress_pdf") as compress:
+            process_document(entry)
+        compress.assert_not_called()
+        entry.refresh_from_db()
+        self.assertIsNotNone(entry.document_processed_at)
+        self.assertFalse(entry.document_thumbnail)
+
+
+class ContentAddressedStorageTests(TestCase):
+    """
+    Identical uploads share one file, which goes with its last reference,
+    and files left by rolled back saves are pruned.
+    """
+
+    def setUp(self):
+        self.root = use_temporary_document_root(self)
+        self.storage = AuthorizationEntry._meta.get_field("uploaded_doc").storage
+
+    def save(self, content, name="authorization_docs/auth.pdf"):
+        return self.storage.save(name, ContentFile(content))
+
+    def exists(self, name):
+        return os.path.exists(os.path.join(self.root, name))
+
+    def age(self, name):
+        old = time_module.time() - 2 * 86400
+        os.utime(os.path.join(self.root, name), (old, old))
+
+    def test_same_content_is_stored_once(self):
+        first = self.save(b"%PDF-1")
+        second = self.save(b"%PDF-1", name="authorization_docs/copy.pdf")
+        self.assertEqual(first, second)
+        self.assertEqual(StoredBlob.objects.get(name=first).ref_count, 2)
+        self.assertEqual(
+            len(os.listdir(os.path.dirname(os.path.join(self.root, first)))), 1
+        )
+        self.assertNotEqual(self.save(b"%PDF-2"), first)
+
+    def test_last_release_deletes_file(self):
+        name = self.save(b"%PDF-1")
+        self.save(b"%PDF-1")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.storage.delete(name)
+        self.assertEqual(StoredBlob.objects.get(name=name).ref_count, 1)
+        self.assertTrue(self.exists(name))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.storage.delete(name)
+        self.assertFalse(StoredBlob.objects.filter(name=name).exists())
+        self.assertFalse(self.exists(name))
+
+    def test_save_during_release_keeps_file(self):
+        name = self.save(b"%PDF-1")
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.storage.delete(name)
+        # The same content is uploaded again before the removal runs.
+        self.assertEqual(self.save(b"%PDF-1"), name)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(StoredBlob.objects.get(name=name).ref_count, 1)
+        self.assertTrue(self.exists(name))
+
+    def test_rolled_back_save_is_pruned(self):
+        kept = self.save(b"%PDF-kept")
+        # Stored before content addressing, so it has no blob row.
+        legacy = "authorization_docs/legacy.pdf"
+        with open(os.path.join(self.root, legacy), "wb") as f:
+            f.write(b"%PDF-legacy")
+        with self.assertRaises(ValueError), transaction.atomic():
+            orphan = self.save(b"%PDF-orphan")
+            raise ValueError
+        self.assertTrue(self.exists(orphan))
+        self.assertFalse(StoredBlob.objects.filter(name=orphan).exists())
+
+        for name in (kept, legacy, orphan):
+            self.age(name)
+        out = io.StringIO()
+        call_command("prune_documents", stdout=out)
+        self.assertIn("Deleted 1 unreferenced files.", out.getvalue())
+        self.assertFalse(self.exists(orphan))
+        self.assertTrue(self.exists(kept))
+        self.assertTrue(self.exists(legacy))
+
+
+class DocumentDownloadTests(TestCase):
+    """
+    Document downloads: byte ranges, If-Range, conditional requests and the
+    hand-off to the front-end server.
+    """
+
+    content = b"%PDF-0123456789"
+
+    def setUp(self):
+        use_temporary_document_root(self)
+        self.client = APIClient()
+        self.client.force_authenticate(
+            get_user_model().objects.create_user("staff", password="secret")
+        )
+        self.entry = create_authorization(
+            create_patient(1),
+            uploaded_doc=SimpleUploadedFile("auth.pdf", self.content),
+        )
+        self.url = f"/api/authorization-entries/{self.entry.pk}/document/"
+
+    def get(self, **headers):
+        return self.client.get(self.url, **headers)
+
+    def test_parse_range(self):
+        self.assertEqual(parse_range("bytes=0-4", 10), (0, 4))
+        self.assertEqual(parse_range("bytes=5-", 10), (5, 9))
+        self.assertEqual(parse_range("bytes=8-20", 10), (8, 9))
+        self.assertEqual(parse_range("bytes=-3", 10), (7, 9))
+        self.assertEqual(parse_range("bytes=-30", 10), (0, 9))
+        for ignored in (None, "", "bytes=-", "bytes=5-3", "bytes=0-1,3-4", "items=0-1"):
+            self.assertIsNone(parse_range(ignored, 10), ignored)
+        for unsatisfiable in ("bytes=10-", "bytes=10-12", "bytes=-0"):
+            self.assertIs(parse_range(unsatisfiable, 10), False, unsatisfiable)
+
+    def test_full_download(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), self.content)
+        self.assertEqual(response["Content-Type"], "application/pdf")
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertIn('filename="auth.pdf"', response["Content-Disposition"])
+
+    def test_range(self):
+        response = self.get(HTTP_RANGE="bytes=5-8")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b"".join(response.streaming_content), self.content[5:9])
+        self.assertEqual(response["Content-Range"], f"bytes 5-8/{len(self.content)}")
+        self.assertEqual(response["Content-Length"], "4")
+
+        response = self.get(HTTP_RANGE="bytes=-3")
+        self.assertEqual(b"".join(response.streaming_content), self.content[-3:])
+
+    def test_invalid_range_is_ignored(self):
+        response = self.get(HTTP_RANGE="bytes=5-3")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), self.content)
+
+    def test_unsatisfiable_range(self):
+        response = self.get(HTTP_RANGE=f"bytes={len(self.content)}-")
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], f"bytes */{len(self.content)}")
+
+    def test_if_range(self):
+        etag = self.get()["ETag"]
+        response = self.get(HTTP_RANGE="bytes=0-3", HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b"".join(response.streaming_content), self.content[:4])
+
+        response = self.get(HTTP_RANGE="bytes=0-3", HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), self.content)
+
+    def test_not_modified(self):
+        etag = self.get()["ETag"]
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        self.assertNotIn("Content-Disposition", response)
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+    @override_settings(DOCUMENT_SENDFILE="nginx", DOCUMENT_SENDFILE_PREFIX="/files/")
+    def test_accel_redirect(self):
+        response = self.get(HTTP_RANGE="bytes=0-3")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b"")
+        self.assertEqual(
+            response["X-Accel-Redirect"], f"/files/{self.entry.uploaded_doc.name}"
+        )
+        self.assertEqual(response["Content-Type"], "application/pdf")
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304)
+
+
+class NestedParserTests(SimpleTestCase):
+    """
+    Bracket and dot notation form keys become nested lists and dicts.
+    """
+
+    def test_indices_out_of_order_and_missing(self):
+        data = QueryDict(mutable=True)
+        data["entries[2].drug_name"] = "C"
+        data["entries[0][drug_name]"] = "A"
+        data["entries[0][procedures][5][code]"] = "95165"
+        data["entries[0].procedures[1].code"] = "95117"
+        self.assertEqual(
+            nest(data),
+            {
+                "entries": [
+                    {
+                        "drug_name": "A",
+                        "procedures": [{"code": "95117"}, {"code": "95165"}],
+                    },
+                    {"drug_name": "C"},
+                ]
+            },
+        )
+
+    def test_repeated_keys(self):
+        data = QueryDict("codes[]=J30.1&codes[]=J45&dose=1&dose=2")
+        self.assertEqual(nest(data), {"codes": ["J30.1", "J45"], "dose": "2"})
+
+    def test_mixed_keys_stay_a_dict(self):
+        data = QueryDict("entries[0]=x&entries[name]=y")
+        self.assertEqual(nest(data), {"entries": {0: "x", "name": "y"}})
+
+    def test_multipart_files_are_nested(self):
+        boundary = "BoUnDaRy"
+        body = (
+            f"--{boundary}\r\n"
+            'Content-Disposition: form-data; name="entries[0].drug_name"\r\n\r\n'
+            f"Xolair\r\n--{boundary}\r\n"
+            'Content-Disposition: form-data; name="entries[0].docs"; '
+            'filename="auth.pdf"\r\n'
+            "Content-Type: application/pdf\r\n\r\n"
+            f"%PDF-1\r\n--{boundary}--\r\n"
+        ).encode()
+        request = RequestFactory().post(
+            "/", body, content_type=f"multipart/form-data; boundary={boundary}"
+        )
+        parsed = NestedMultiPartParser().parse(
+            io.BytesIO(body),
+            f"multipart/form-data; boundary={boundary}",
+            {"request": request, "encoding": "utf-8"},
+        )
+        entry = parsed.data["entries"][0]
+        self.assertEqual(entry["drug_name"], "Xolair")
+        self.assertEqual(entry["docs"].read(), b"%PDF-1")
+        self.assertFalse(parsed.files)
+
+
+class AuthorizationEntryPostTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.patient = create_patient(1)
+
+    def test_malformed_entries_are_rejected(self):
+        for data, format in [
+            ({"patientId": self.patient.id, "entries": ["x"]}, "json"),
+            ({"patientId": self.patient.id, "entries[0]": "x"}, "multipart"),
+            (
+                {"patientId": self.patient.id, "entries[0].procedures": "x"},
+                "multipart",
+            ),
+            (
+                {"patientId": self.patient.id, "entries": [{"procedures": [1]}]},
+                "json",
+            ),
+        ]:
+            with self.subTest(data=data):
+                response = self.client.post(
+                    "/api/authorization-entries/", data, format=format
+                )
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("list of objects", response.json()["message"])
+        self.assertFalse(AuthorizationEntry.objects.exists())
+
+    def test_entries_keep_index_order(self):
+        data = {"patientId": self.patient.id}
+        for index in (3, 0):
+            data.update(
+                {
+                    f"entries[{index}].drug_name": "Xolair",
+                    f"entries[{index}].dose": "150mg",
+                    f"entries[{index}].frequency": "Monthly",
+                    f"entries[{index}].insurance": "Aetna",
+                    f"entries[{index}].auth_number": f"AUTH{index}",
+                    f"entries[{index}].expiration_date": "2030-01-01",
+                    f"entries[{index}].cost_estimate": "",
+                    f"entries[{index}].visit_history": "",
+                    f"entries[{index}].procedures[0].description": "Injections",
+                    f"entries[{index}].procedures[0].code": "95165",
+                    f"entries[{index}].procedures[0].units": "10",
+                    f"entries[{index}].procedures[0].start_date": "2024-01-01",
+                    f"entries[{index}].procedures[0].end_date": "2024-12-31",
+                    f"entries[{index}].procedures[0].frequency": "Weekly",
+                }
+            )
+        response = self.client.post(
+            "/api/authorization-entries/", data, format="multipart"
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(
+            [entry["auth_number"] for entry in response.json()["data"]],
+            ["AUTH0", "AUTH3"],
+        )
+
+
+@override_settings(RESPONSE_CACHE_TIMEOUT=0)
+class LimitParameterTests(TestCase):
+    """
+    `limit` is clamped to the endpoint's range; anything but an integer is a
+    client error.
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        patient = create_patient(1)
+        allergen_id = lookup_allergens(["Cat"])["Cat"][0]
+        AllergenTest.objects.create(
+            patient=patient,
+            allergen_id=allergen_id,
+            category="food",
+            reaction_level="2+",
+        )
+
+    def test_limit(self):
+        for url, params in [
+            ("/api/analytics/reactions/", {}),
+            ("/api/codes/autocomplete/", {"q": "J30"}),
+        ]:
+            for limit, expected in [
+                ("-5", 200),
+                ("0", 200),
+                ("5000", 200),
+                ("abc", 400),
+                ("1.5", 400),
+            ]:
+                with self.subTest(url=url, limit=limit):
+                    response = self.client.get(url, {**params, "limit": limit})
+                    self.assertEqual(response.status_code, expected)
+
+
+@override_settings(RESPONSE_CACHE_TIMEOUT=0)
+class AuthorizationEntryWriteTests(TestCase):
+    """
+    Batch creation leaves the same rows behind as creating each entry on its
+    own, and updates diff the submitted procedures.
+    """
+
+    def setUp(self):
+        self.patients = [create_patient(1), create_patient(2)]
+        for patient in self.patients:
+            vial = Vial.objects.create(patient=patient, name="Trees")
+            AllergyTemplate.objects.create(vial=vial, dose="0.1", date=date(2024, 2, 1))
+
+    def entries(self, patient):
+        return [
+            {
+                "patient": patient.id,
+                "drug_name": "Xolair",
+                "dose": "150mg",
+                "frequency": "Monthly",
+                "insurance": "Aetna",
+                "auth_number": f"AUTH{index}",
+                "expiration_date": f"203{index}-01-01",
+                "icd10_codes": "J30.1, J45.909",
+                "procedure_codes": "95165",
+                "procedures": [
+                    {
+                        "code": "95165",
+                        "units": 10,
+                        "start_date": "2024-01-01",
+                        "end_date": "2024-12-31",
+                        "frequency": "Weekly",
+                    }
+                ],
+            }
+            for index in (1, 2)
+        ]
+
+    def state(self, patient):
+        return {
+            "summary": PatientSummary.objects.filter(patient=patient).values_list(
+                "auth_expiration_date", flat=True
+            )[0],
+            "codes": sorted(
+                AuthorizationCode.objects.filter(
+                    authorization_entry__patient=patient
+                ).values_list("authorization_entry__auth_number", "system", "code")
+            ),
+            "procedures": sorted(
+                ProcedureDetail.objects.filter(
+                    authorization_entry__patient=patient
+                ).values_list(
+                    "authorization_entry__auth_number",
+                    "code",
+                    "units",
+                    "consumed_units",
+                )
+            ),
+        }
+
+    def test_batch_matches_single_creates(self):
+        batch, single = self.patients
+        serializer = AuthorizationEntrySerializer(data=self.entries(batch), many=True)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        serializer.save()
+        for data in self.entries(single):
+            serializer = AuthorizationEntrySerializer(data=data)
+            self.assertTrue(serializer.is_valid(), serializer.errors)
+            serializer.save()
+
+        expected = self.state(single)
+        self.assertEqual(self.state(batch), expected)
+        self.assertEqual(expected["summary"], date(2032, 1, 1))
+        self.assertEqual(len(expected["codes"]), 6)
+        self.assertEqual({row[3] for row in expected["procedures"]}, {1})
+
+    def update(self, entry, procedures):
+        serializer = AuthorizationEntrySerializer(
+            entry, data={"procedures": procedures}, partial=True
+        )
+        valid = serializer.is_valid()
+        if valid:
+            serializer.save()
+        return valid, serializer.errors
+
+    def test_partial_procedure_updates(self):
+        serializer = AuthorizationEntrySerializer(
+            data=self.entries(self.patients[0])[0]
+        )
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        entry = serializer.save()
+        procedure = entry.procedures.get()
+
+        self.assertEqual(
+            self.update(entry, [{"id": procedure.id, "units": 20}])[0], True
+        )
+        procedure.refresh_from_db()
+        self.assertEqual(procedure.units, 20)
+
+        matched = {"code": "95165", "start_date": "2024-01-01", "units": 30}
+        self.assertEqual(self.update(entry, [matched])[0], True)
+        self.assertEqual(entry.procedures.get().units, 30)
+
+        valid, errors = self.update(entry, [{"code": "95117", "units": 5}])
+        self.assertFalse(valid)
+        self.assertIn("start_date", str(errors["procedures"]))
+        self.assertEqual(entry.procedures.get().pk, procedure.pk)
+
+
+class CodeCatalogTests(SimpleTestCase):
+    """
+    Code normalization and the prefix lookups of the in-memory catalog.
+    """
+
+    catalog = CodeCatalog(
+        [
+            ("icd10", "J30.1", "Allergic rhinitis due to pollen"),
+            ("icd10", "j302", "Other seasonal allergic rhinitis"),
+            ("icd10", "J45.909", "Unspecified asthma, uncomplicated"),
+            ("cpt", "95165", "Preparation of allergen immunotherapy extract"),
+            ("cpt", "95117", "Immunotherapy injections, two or more"),
+            ("icd10", "not a code", "Dropped"),
+            ("other", "J30.1", "Dropped"),
+        ]
+    )
+
+    def codes(self, results):
+        return [row["code"] for row in results]
+
+    def test_normalize_and_extract(self):
+        self.assertEqual(normalize_code(ICD10, " j301 "), "J30.1")
+        self.assertEqual(normalize_code(ICD10, "J45"), "J45")
+        self.assertIsNone(normalize_code(ICD10, "J4"))
+        self.assertEqual(normalize_code(CPT, "95165"), "95165")
+        self.assertIsNone(normalize_code(CPT, "9516"))
+        self.assertEqual(
+            extract_codes(ICD10, "J30.1 - Allergic rhinitis, J45.909; j30.1"),
+            ["J30.1", "J45.909"],
+        )
+        self.assertEqual(extract_codes(CPT, "95165 x10 (95117)"), ["95165", "95117"])
+
+    def test_catalog_rows(self):
+        self.assertEqual(len(self.catalog), 5)
+        self.assertEqual(
+            self.catalog.describe(ICD10, "J30.2"), "Other seasonal allergic rhinitis"
+        )
+        self.assertIsNone(self.catalog.describe(CPT, "J30.1"))
+
+    def test_search_by_code_prefix(self):
+        self.assertEqual(self.codes(self.catalog.search("J30")), ["J30.1", "J30.2"])
+        self.assertEqual(self.codes(self.catalog.search("j30.")), ["J30.1", "J30.2"])
+        self.assertEqual(self.codes(self.catalog.search("951")), ["95117", "95165"])
+        self.assertEqual(self.codes(self.catalog.search("J30", limit=1)), ["J30.1"])
+        self.assertEqual(self.catalog.search("J30", system=CPT), [])
+
+    def test_search_by_description_words(self):
+        self.assertEqual(
+            self.codes(self.catalog.search("allerg rhin")), ["J30.1", "J30.2"]
+        )
+        self.assertEqual(self.codes(self.catalog.search("seas rhin")), ["J30.2"])
+        self.assertEqual(
+            self.codes(self.catalog.search("immuno", system=CPT)), ["95117", "95165"]
+        )
+        self.assertEqual(self.catalog.search("pollen asthma"), [])
+
+    def test_endpoints_do_not_query(self):
+        # SimpleTestCase fails any database query.
+        client = APIClient()
+        response = client.get("/api/codes/autocomplete/", {"q": "J30.1"})
+        self.assertEqual(response.json()[0]["code"], "J30.1")
+
+        response = client.get("/api/codes/validate/", {"codes": "j301,J99.99,X"})
+        self.assertEqual(
+            [(row["normalized"], row["known"]) for row in response.json()],
+            [("J30.1", True), ("J99.99", False), (None, False)],
+        )
+
+
+class VialDiagnosisCodeTests(TestCase):
+    """
+    Diagnosis codes of vials are indexed on save and by the migration, and
+    stored legacy shapes survive an unchanged re-save.
+    """
+
+    def setUp(self):
+        self.patient = create_patient(1)
+
+    def codes(self, vial):
+        return sorted(vial.codes.values_list("code", flat=True))
+
+    def save(self, data, instance=None):
+        data = {"patient": self.patient.id, "name": "Trees", **data}
+        serializer = VialSerializer(instance, data=data)
+        valid = serializer.is_valid()
+        return (serializer.save() if valid else None), serializer.errors
+
+    def test_codes_indexed_on_save(self):
+        vial, errors = self.save(
+            {"diagnosis_codes": ["J30.1 - Allergic rhinitis", {"code": "j45909"}]}
+        )
+        self.assertEqual(errors, {})
+        self.assertEqual(self.codes(vial), ["J30.1", "J45.909"])
+
+        vial, errors = self.save({"diagnosis_codes": ["J30.2, J30.1"]}, vial)
+        self.assertEqual(errors, {})
+        self.assertEqual(self.codes(vial), ["J30.1", "J30.2"])
+
+    def test_new_entries_need_a_code(self):
+        for value in (["Allergic rhinitis"], [{"description": "x"}], [5], {"a": 1}):
+            vial, errors = self.save({"diagnosis_codes": value})
+            self.assertIsNone(vial, value)
+            self.assertIn("diagnosis_codes", errors)
+
+    def test_legacy_shapes_can_be_saved_unchanged(self):
+        for legacy in (
+            "Allergic rhinitis J30.1",
+            ["Allergic rhinitis", {"code": "J45.909", "description": "Asthma"}],
+        ):
+            vial = Vial.objects.create(
+                patient=self.patient, name=str(uuid.uuid4())[:8], diagnosis_codes=legacy
+            )
+            data = {"name": vial.name, "diagnosis_codes": legacy}
+            self.assertEqual(self.save(data, vial)[1], {})
+            vial, errors = self.save({**data, "diagnosis_codes": [legacy, 7]}, vial)
+            self.assertIn("diagnosis_codes", errors)
+
+    def test_migration_backfills_codes(self):
+        migration = import_module(
+            "api.migrations.0035_alter_patient_state_vialdiagnosiscode"
+        )
+        vials = [
+            Vial.objects.create(patient=self.patient, name=name, diagnosis_codes=value)
+            for name, value in (
+                ("Free text", "J30.1 and J30.2"),
+                ("Objects", [{"code": "J45.909"}, {"name": "no code"}]),
+                ("Empty", []),
+            )
+        ]
+        VialDiagnosisCode.objects.all().delete()
+        migration.index_existing_codes(django_apps, None)
+        self.assertEqual(
+            [self.codes(vial) for vial in vials], [["J30.1", "J30.2"], ["J45.909"], []]
+        )
+
+
+@override_settings(RESPONSE_CACHE_TIMEOUT=0)
+class PatientSearchTests(TestCase):
+    """
+    Name search: substring matches of every word, ranking of whole-word and
+    prefix matches, and the token index following renames.
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.patients = {
+            last_name: create_patient(index, first_name="Zed", last_name=last_name)
+            for index, last_name in enumerate(
+                ["Marianne", "Joann", "Ann", "Annabel", "Cabca", "Smith"], 1
+            )
+        }
+
+    def names(self, query):
+        return [patient.last_name for patient in search_patients(query)]
+
+    def test_ranking(self):
+        self.assertEqual(self.names("ANN"), ["Ann", "Annabel", "Joann", "Marianne"])
+        self.assertEqual(self.names("zed ann")[:2], ["Ann", "Annabel"])
+        self.assertEqual(self.names("ann smith"), [])
+
+    def test_short_words_match_word_starts(self):
+        self.assertEqual(self.names("an"), ["Ann", "Annabel"])
+        self.assertEqual(self.names("SM"), ["Smith"])
+        self.assertEqual(self.names("mi"), [])
+        self.assertEqual(self.names("z ith"), ["Smith"])
+
+        # Narrowed through the token index, never a scan of every patient.
+        with CaptureQueriesContext(connections["default"]) as queries:
+            self.names("a")
+        (sql,) = [query["sql"] for query in queries.captured_queries]
+        where = sql.split(" WHERE ", 1)[1].split(" GROUP BY ")[0]
+        self.assertIn(""""api_patientnametoken"."token" IN ('^^a')""", where)
+
+    def test_trigrams_alone_do_not_match(self):
+        # "Cabca" holds every trigram of "abcabc" but not the word.
+        self.assertEqual(self.names("abcabc"), [])
+        self.assertEqual(self.names("abca"), ["Cabca"])
+
+    def test_search_view(self):
+        response = self.client.get("/api/search/", {"name": "ann"})
+        self.assertEqual(
+            [row["Patient Id"] for row in response.json()],
+            [
+                self.patients[name].id
+                for name in ("Ann", "Annabel", "Joann", "Marianne")
+            ],
+        )
+        response = self.client.get("/api/search/", {"name": "abcabc"})
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get("/api/search/", {"name": " "})
+        self.assertEqual(response.status_code, 400)
+
+    def tokens(self, patient):
+        return set(
+            PatientNameToken.objects.filter(patient=patient).values_list(
+                "token", flat=True
+            )
+        )
+
+    def test_rename_updates_tokens(self):
+        patient = self.patients["Smith"]
+        patient.last_name = "Jones"
+        patient.middle_name = "Q"
+        patient.save()
+        self.assertEqual(
+            self.tokens(patient),
+            name_tokens(*(getattr(patient, field) for field in NAME_FIELDS)),
+        )
+        self.assertEqual(self.names("smith"), [])
+        self.assertEqual(self.names("jones"), ["Jones"])
+
+    def test_migration_backfills_tokens(self):
+        migration = import_module(
+            "api.migrations.0022_alter_patient_state_patientnametoken"
+        )
+        PatientNameToken.objects.all().delete()
+        migration.index_existing_names(django_apps, None)
+        self.assertEqual(self.tokens(self.patients["Ann"]), name_tokens("Zed", "Ann"))
+        self.assertEqual(self.names("smith"), ["Smith"])
+
+    def test_rebuild_index(self):
+        PatientNameToken.objects.all().delete()
+        self.assertEqual(self.names("smith"), [])
+        out = io.StringIO()
+        call_command("rebuild_patient_name_index", batch_size=2, stdout=out)
+        self.assertIn("Indexed 6 patient names.", out.getvalue())
+        self.assertEqual(self.names("smith"), ["Smith"])
+        self.assertEqual(self.tokens(self.patients["Ann"]), name_tokens("Zed", "Ann"))
+
+
+class ConsumedUnitsTests(TestCase):
+    """
+    consumed_units follows injections as they are logged, moved, deleted or
+    bulk created, and reconcile_consumed_units repairs counters that drifted.
+    """
+
+    def setUp(self):
+        self.patient = create_patient(1)
+        self.other = create_patient(2)
+        self.vial = Vial.objects.create(patient=self.patient, name="Trees")
+        self.other_vial = Vial.objects.create(patient=self.other, name="Trees")
+        entry = create_authorization(self.patient)
+        self.january = self.procedure(entry, date(2024, 1, 1), date(2024, 1, 31))
+        self.february = self.procedure(entry, date(2024, 2, 1), date(2024, 2, 29))
+        self.year = self.procedure(entry, date(2024, 1, 1), date(2024, 12, 31))
+        self.other_year = self.procedure(
+            create_authorization(self.other), date(2024, 1, 1), date(2024, 12, 31)
+        )
+
+    def procedure(self, entry, start, end):
+        return ProcedureDetail.objects.create(
+            authorization_entry=entry,
+            code="95165",
+            units=10,
+            start_date=start,
+            end_date=end,
+            frequency="Weekly",
+        )
+
+    def inject(self, day, vial=None):
+        return AllergyTemplate.objects.create(
+            vial=vial or self.vial,
+            dose="0.1",
+            date=day,
+            arm="L",
+            peak_flow="300",
+            tech_id="T1",
+            reaction="NR",
+        )
+
+    def consumed(self):
+        return [
+            ProcedureDetail.objects.get(pk=procedure.pk).consumed_units
+            for procedure in (self.january, self.february, self.year, self.other_year)
+        ]
+
+    def test_create(self):
+        self.inject(date(2024, 1, 10))
+        self.inject(date(2024, 1, 10))
+        self.inject(date(2023, 12, 31))
+        self.assertEqual(self.consumed(), [2, 0, 2, 0])
+
+    def test_move(self):
+        injection = self.inject(date(2024, 1, 10))
+        injection.date = date(2024, 2, 5)
+        injection.save()
+        self.assertEqual(self.consumed(), [0, 1, 1, 0])
+
+        injection.vial = self.other_vial
+        injection.save()
+        self.assertEqual(self.consumed(), [0, 0, 0, 1])
+
+        injection.dose = "0.2"
+        injection.save()
+        self.assertEqual(self.consumed(), [0, 0, 0, 1])
+
+    def test_delete(self):
+        first = self.inject(date(2024, 1, 10))
+        self.inject(date(2024, 2, 5))
+        first.delete()
+        self.assertEqual(self.consumed(), [0, 1, 1, 0])
+
+        # A counter that drifted low never goes below zero.
+        ProcedureDetail.objects.update(consumed_units=0)
+        AllergyTemplate.objects.get().delete()
+        self.assertEqual(self.consumed(), [0, 0, 0, 0])
+
+    def test_bulk_create(self):
+        row = {"dose": "0.1", "arm": "L", "peak_flow": "300", "tech_id": "T1"}
+        serializer = InjectionSessionSerializer(
+            data={
+                "injections": [
+                    {
+                        **row,
+                        "vial": self.vial.id,
+                        "date": "2024-01-10",
+                        "reaction": "NR",
+                    },
+                    {
+                        **row,
+                        "vial": self.vial.id,
+                        "date": "2024-01-10",
+                        "reaction": "NR",
+                    },
+                    {
+                        **row,
+                        "vial": self.vial.id,
+                        "date": "2024-02-05",
+                        "reaction": "NR",
+                    },
+                    {
+                        **row,
+                        "vial": self.other_vial.id,
+                        "date": "2024-03-01",
+                        "reaction": "NR",
+                    },
+                ]
+            }
+        )
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        serializer.save()
+        self.assertEqual(self.consumed(), [2, 1, 3, 1])
+
+    def test_new_procedure_counts_logged_injections(self):
+        self.inject(date(2024, 1, 10))
+        self.inject(date(2024, 3, 1))
+        spring = self.procedure(
+            self.january.authorization_entry, date(2024, 3, 1), date(2024, 5, 31)
+        )
+        spring.refresh_from_db()
+        self.assertEqual(spring.consumed_units, 1)
+
+    def test_reconcile_repairs_drift(self):
+        self.inject(date(2024, 1, 10))
+        self.inject(date(2024, 2, 5))
+        self.inject(date(2024, 2, 5), vial=self.other_vial)
+        expected = self.consumed()
+        self.assertEqual(expected, [1, 1, 2, 1])
+
+        ProcedureDetail.objects.filter(pk=self.january.pk).update(consumed_units=7)
+        ProcedureDetail.objects.filter(pk=self.year.pk).update(consumed_units=0)
+        ProcedureDetail.objects.filter(pk=self.other_year.pk).update(consumed_units=5)
+
+        own = ProcedureDetail.objects.filter(authorization_entry__patient=self.patient)
+        self.assertEqual(reconcile_consumed_units(own, batch_size=1), 2)
+        self.assertEqual(self.consumed(), [*expected[:3], 5])
+        self.assertEqual(reconcile_consumed_units(own), 0)
+
+        out = io.StringIO()
+        call_command("reconcile_authorization_units", stdout=out)
+        self.assertIn("Corrected consumed units on 1 procedures.", out.getvalue())
+        self.assertEqual(self.consumed(), expected)
+
+
+@override_settings(RESPONSE_CACHE_TIMEOUT=0)
+class KeysetPaginationTests(TestCase):
+    """
+    Following `next` links visits every row once, even when the leading
+    ordering value is tied, and tampered cursors are a 404.
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.patient = create_patient(1)
+        for index in range(7):
+            vial = Vial.objects.create(patient=self.patient, name=f"Vial {index}")
+            AllergyTemplate.objects.create(
+                vial=vial,
+                dose="0.1",
+                date=date(2024, 1, 1 + index % 2),
+                arm="L",
+                peak_flow="300",
+                tech_id="T1",
+                reaction="NR",
+            )
+        tied = timezone.now()
+        Vial.objects.filter(id__in=Vial.objects.order_by("id")[1:6]).update(
+            created_at=tied
+        )
+
+    def walk(self, url, params):
+        ids = []
+        response = self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            body = response.json()
+            ids.extend(row["id"] for row in body["results"])
+            if body["next"] is None:
+                return ids
+            response = self.client.get(body["next"])
+
+    def test_walk_pages(self):
+        ids = self.walk("/api/vials/", {"page_size": 2})
+        expected = list(
+            Vial.objects.order_by("-created_at", "-id").values_list("id", flat=True)
+        )
+        self.assertEqual(ids, expected)
+
+        ids = self.walk("/api/allergy-templates/", {"page_size": 3})
+        expected = list(
+            AllergyTemplate.objects.order_by("-date", "-id").values_list(
+                "id", flat=True
+            )
+        )
+        self.assertEqual(ids, expected)
+
+    def test_bad_cursor(self):
+        paginator = KeysetPagination()
+        for values in (
+            ["x", "y"],
+            [None, 1],
+            [{"a": 1}, 2],
+            ["2024-01-01", "1.5"],
+            [1],
+        ):
+            cursor = paginator.encode_cursor(values)
+            response = self.client.get("/api/vials/", {"cursor": cursor})
+            self.assertEqual(response.status_code, 404, values)
+            self.assertEqual(response.json()["detail"], "Invalid cursor")
+        response = self.client.get("/api/vials/", {"cursor": "%%%"})
+        self.assertEqual(response.status_code, 404)
+
+    @override_settings(API_PAGE_SIZE=2, API_MAX_PAGE_SIZE=4)
+    def test_unfiltered_lists_are_paged(self):
+        for url in ("/api/allergy-templates/", "/api/vials/"):
+            body = self.client.get(url).json()
+            self.assertEqual(len(body["results"]), 2)
+            self.assertIsNotNone(body["next"])
+            body = self.client.get(url, {"page_size": 100}).json()
+            self.assertEqual(len(body["results"]), 4)
+
+            rows = self.client.get(url, {"patient": self.patient.id}).json()
+            self.assertEqual(len(rows), 7)
+
+
+def log_injection(vial, day):
+    return AllergyTemplate.objects.create(
+        vial=vial,
+        dose="0.1",
+        date=day,
+        arm="L",
+        peak_flow="300",
+        tech_id="T1",
+        reaction="NR",
+    )
+
+
+@override_settings(RESPONSE_CACHE_TIMEOUT=0)
+class MissedInjectionSnapshotTests(TestCase):
+    """
+    The nightly worklist snapshot: refreshing it for a date, pruning old
+    ones, and serving it as JSON and CSV.
+    """
+
+    day = date(2024, 6, 1)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.patients = {}
+        for index, (name, days) in enumerate(
+            [
+                ("Early", [date(2024, 4, 1)]),
+                ("Recent", [date(2024, 5, 20)]),
+                ("Later", [date(2024, 3, 1), date(2024, 6, 10)]),
+                ("Never", []),
+            ],
+            1,
+        ):
+            patient = create_patient(
+                index, last_name=name, middle_name="Q", phone=f"555000000{index}"
+            )
+            vial = Vial.objects.create(patient=patient, name="Trees")
+            for day in days:
+                log_injection(vial, day)
+            self.patients[name] = patient
+
+    def refresh(self, *args):
+        out = io.StringIO()
+        call_command("refresh_missed_injections", *args, stdout=out)
+        return out.getvalue()
+
+    def test_refresh_for_date(self):
+        old = self.day - timedelta(days=400)
+        MissedInjectionSnapshot.objects.create(
+            snapshot_date=old,
+            patient=self.patients["Early"],
+            patient_name="Old",
+            phone="1",
+            last_injection_date=old,
+            days_since_last_injection=1,
+        )
+        output = self.refresh("--date", self.day.isoformat())
+        self.assertIn("Stored 3 overdue patients for 2024-06-01.", output)
+        self.assertNotIn("Pruned", output)
+        self.assertEqual(
+            dict(
+                MissedInjectionSnapshot.objects.filter(
+                    snapshot_date=self.day
+                ).values_list("patient__last_name", "days_since_last_injection")
+            ),
+            {"Early": 61, "Recent": 12, "Later": 92},
+        )
+        self.assertTrue(
+            MissedInjectionSnapshot.objects.filter(snapshot_date=old).exists()
+        )
+
+        # Refreshing replaces the day's rows; a nightly run prunes old days.
+        self.refresh("--date", self.day.isoformat())
+        self.assertEqual(
+            MissedInjectionSnapshot.objects.filter(snapshot_date=self.day).count(), 3
+        )
+        output = self.refresh("--keep-days", "30")
+        self.assertIn("Pruned 4 snapshot rows", output)
+        self.assertEqual(
+            set(
+                MissedInjectionSnapshot.objects.values_list("snapshot_date", flat=True)
+            ),
+            {date.today()},
+        )
+
+    def test_worklist(self):
+        self.assertEqual(
+            self.client.get("/api/missed-injections/worklist/").status_code, 404
+        )
+        self.refresh("--date", self.day.isoformat())
+
+        response = self.client.get("/api/missed-injections/worklist/", {"weeks": 4})
+        self.assertEqual(response["X-Snapshot-Date"], "2024-06-01")
+        self.assertEqual(
+            response.json(),
+            [
+                {
+                    "patient_id": self.patients["Later"].id,
+                    "patient_name": "John Q Later",
+                    "phone": "5550000003",
+                    "last_injection_date": "2024-03-01",
+                    "weeks_since_last_injection": 13,
+                },
+                {
+                    "patient_id": self.patients["Early"].id,
+                    "patient_name": "John Q Early",
+                    "phone": "5550000001",
+                    "last_injection_date": "2024-04-01",
+                    "weeks_since_last_injection": 8,
+                },
+            ],
+        )
+        response = self.client.get(
+            "/api/missed-injections/worklist/",
+            {"weeks": 1, "date": "2024-06-01", "page_size": 2},
+        )
+        self.assertEqual(len(response.json()["results"]), 2)
+        response = self.client.get(response.json()["next"])
+        self.assertEqual(
+            [row["patient_id"] for row in response.json()["results"]],
+            [self.patients["Recent"].id],
+        )
+        response = self.client.get(
+            "/api/missed-injections/worklist/", {"date": "2024-06-02"}
+        )
+        self.assertEqual(response.json(), [])
+        response = self.client.get("/api/missed-injections/worklist/", {"weeks": "x"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_export(self):
+        self.refresh("--date", self.day.isoformat())
+        response = self.client.get(
+            "/api/missed-injections/worklist/export/",
+            {"weeks": 4, "fields": "patient_id,days_since_last_injection"},
+        )
+        self.assertEqual(response["Content-Type"], "text/csv")
+        self.assertIn(
+            'filename="missed-injections-2024-06-01.csv"',
+            response["Content-Disposition"],
+        )
+        self.assertEqual(
+            b"".join(response.streaming_content).decode().splitlines(),
+            [
+                "patient_id,days_since_last_injection",
+                f"{self.patients['Later'].id},92",
+                f"{self.patients['Early'].id},61",
+            ],
+        )
+
+
+@override_settings(RESPONSE_CACHE_TIMEOUT=0)
+class MissedInjectionsReportTests(TestCase):
+    """
+    The live missed injection report: who is overdue, by how many weeks, in
+    either order, page by page.
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        today = date.today()
+        self.patients = {}
+        for index, (name, days_ago) in enumerate(
+            [
+                ("Early", [60]),
+                ("Recent", [20]),
+                ("Later", [100, 40]),
+                ("Never", []),
+                ("Tied", [60]),
+            ],
+            1,
+        ):
+            patient = create_patient(
+                index, last_name=name, middle_name="Q", phone=f"555000000{index}"
+            )
+            vial = Vial.objects.create(patient=patient, name="Trees")
+            for days in days_ago:
+                log_injection(vial, today - timedelta(days=days))
+            self.patients[name] = patient
+
+    def ids(self, *names):
+        return [self.patients[name].id for name in names]
+
+    def test_rows(self):
+        response = self.client.get("/api/missed-injections/")
+        self.assertEqual(response.status_code, 200)
+        rows = response.json()
+        self.assertEqual(
+            [row["patient_id"] for row in rows], self.ids("Early", "Tied", "Later")
+        )
+        self.assertEqual(
+            rows[0],
+            {
+                "patient_id": self.patients["Early"].id,
+                "patient_name": "John Q Early",
+                "phone": "5550000001",
+                "last_injection_date": (date.today() - timedelta(days=60)).isoformat(),
+                "weeks_since_last_injection": 8,
+            },
+        )
+        self.assertEqual([row["weeks_since_last_injection"] for row in rows], [8, 8, 5])
+
+        rows = self.client.get("/api/missed-injections/", {"weeks": 1}).json()
+        self.assertEqual(
+            [(row["patient_id"], row["weeks_since_last_injection"]) for row in rows],
+            list(zip(self.ids("Early", "Tied", "Later", "Recent"), [8, 8, 5, 2])),
+        )
+
+    def test_sorts(self):
+        rows = self.client.get(
+            "/api/missed-injections/", {"sort": "weeks_asc", "weeks": 1}
+        ).json()
+        self.assertEqual(
+            [row["patient_id"] for row in rows],
+            self.ids("Recent", "Later", "Tied", "Early"),
+        )
+        response = self.client.get("/api/missed-injections/", {"sort": "name"})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get("/api/missed-injections/", {"weeks": "x"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_keyset_pages(self):
+        for sort, expected in [
+            ("weeks_desc", ["Early", "Tied", "Later", "Recent"]),
+            ("weeks_asc", ["Recent", "Later", "Tied", "Early"]),
+        ]:
+            with self.subTest(sort=sort):
+                seen = []
+                response = self.client.get(
+                    "/api/missed-injections/",
+                    {"sort": sort, "weeks": 1, "page_size": 1},
+                )
+                # Early and Tied share a date, so the pages split the tie.
+                while True:
+                    body = response.json()
+                    self.assertEqual(len(body["results"]), 1)
+                    seen += [row["patient_id"] for row in body["results"]]
+                    if not body["next"]:
+                        break
+                    response = self.client.get(body["next"])
+                self.assertEqual(seen, self.ids(*expected))
+
+
+class PatientSummaryTests(TestCase):
+    """
+    The summary row follows every write path incrementally, and the backfill
+    command rebuilds it to the values recomputed from the source tables.
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.patient = create_patient(1)
+        self.vial = Vial.objects.create(patient=self.patient, name="Trees")
+
+    def summary(self, patient=None):
+        summary = PatientSummary.objects.get(patient=patient or self.patient)
+        return (
+            summary.last_test_date,
+            summary.last_injection_date,
+            summary.visit_count,
+            summary.auth_expiration_date,
+        )
+
+    def allergen_test(self, name, test_date):
+        allergen_id = lookup_allergens([name])[name][0]
+        return AllergenTest.objects.create(
+            patient=self.patient,
+            allergen_id=allergen_id,
+            category="food",
+            reaction_level="1+",
+            test_date=test_date,
+        )
+
+    def test_new_patient_has_empty_summary(self):
+        self.assertEqual(self.summary(), (None, None, 0, None))
+
+    def test_record_test(self):
+        newer = datetime(2024, 5, 1, tzinfo=dt_timezone.utc)
+        older = datetime(2024, 3, 1, tzinfo=dt_timezone.utc)
+        self.allergen_test("Cat", newer)
+        self.allergen_test("Dog", older)
+        self.assertEqual(self.summary()[0], newer)
+
+        PatientSummary.objects.filter(patient=self.patient).delete()
+        summaries.record_test(self.patient.id, older)
+        self.assertEqual(self.summary()[0], newer)
+
+    def test_record_injections(self):
+        log_injection(self.vial, date(2024, 2, 1))
+        log_injection(self.vial, date(2024, 1, 1))
+        self.assertEqual(self.summary()[1:3], (date(2024, 2, 1), 2))
+
+        summaries.record_injections(self.patient.id, date(2024, 3, 1), count=3)
+        self.assertEqual(self.summary()[1:3], (date(2024, 3, 1), 5))
+
+    def test_edit_and_delete_refresh(self):
+        newest = log_injection(self.vial, date(2024, 2, 1))
+        log_injection(self.vial, date(2024, 1, 1))
+        newest.date = date(2023, 12, 1)
+        newest.save()
+        self.assertEqual(self.summary()[1:3], (date(2024, 1, 1), 2))
+        newest.delete()
+        self.assertEqual(self.summary()[1:3], (date(2024, 1, 1), 1))
+
+        first = self.allergen_test("Cat", datetime(2024, 5, 1, tzinfo=dt_timezone.utc))
+        self.allergen_test("Dog", datetime(2024, 3, 1, tzinfo=dt_timezone.utc))
+        first.test_date = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+        first.save()
+        self.assertEqual(self.summary()[0].month, 3)
+        AllergenTest.objects.get(allergen__name="Dog").delete()
+        self.assertEqual(self.summary()[0].month, 1)
+
+        entry = create_authorization(self.patient, expiration_date=date(2025, 1, 1))
+        create_authorization(self.patient, expiration_date=date(2024, 6, 1))
+        self.assertEqual(self.summary()[3], date(2025, 1, 1))
+        entry.delete()
+        self.assertEqual(self.summary()[3], date(2024, 6, 1))
+
+    def test_bulk_session_and_panel(self):
+        row = {"dose": "0.1", "arm": "L", "peak_flow": "300", "tech_id": "T1"}
+        response = self.client.post(
+            "/api/allergy-templates/bulk/",
+            {
+                "patient": self.patient.id,
+                "injections": [
+                    {**row, "vial": self.vial.id, "date": day, "reaction": "NR"}
+                    for day in ("2024-01-05", "2024-02-05", "2024-01-20")
+                ],
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.summary()[1:3], (date(2024, 2, 5), 3))
+
+        response = self.client.post(
+            "/api/allergen-tests/panel/",
+            {
+                "patient": self.patient.id,
+                "test_date": "2024-04-01T09:00:00Z",
+                "results": [
+                    {"allergen_name": "Cat", "category": "environmental"},
+                    {"allergen_name": "Egg", "category": "food"},
+                ],
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            self.summary()[0], datetime(2024, 4, 1, 9, tzinfo=dt_timezone.utc)
+        )
+
+    def test_backfill_matches_recomputed_values(self):
+        other = create_patient(2)
+        log_injection(self.vial, date(2024, 2, 1))
+        log_injection(self.vial, date(2024, 3, 1))
+        self.allergen_test("Cat", datetime(2024, 5, 1, tzinfo=dt_timezone.utc))
+        create_authorization(self.patient, expiration_date=date(2025, 1, 1))
+
+        PatientSummary.objects.filter(patient=self.patient).update(
+            visit_count=99, last_test_date=None, last_injection_date=date(2000, 1, 1)
+        )
+        PatientSummary.objects.filter(patient=other).delete()
+        out = io.StringIO()
+        call_command("backfill_patient_summaries", batch_size=1, stdout=out)
+        self.assertIn("Backfilled 2 patient summaries.", out.getvalue())
+
+        for patient in (self.patient, other):
+            values = summaries._compute(patient.id, summaries.ALL_FIELDS)
+            self.assertEqual(
+                self.summary(patient),
+                (
+                    values["last_test_date"],
+                    values["last_injection_date"],
+                    values["visit_count"],
+                    values["auth_expiration_date"],
+                ),
+            )
+        self.assertEqual(
+            self.summary(),
+            (
+                datetime(2024, 5, 1, tzinfo=dt_timezone.utc),
+                date(2024, 3, 1),
+                2,
+                date(2025, 1, 1),
+            ),
+        )
+
+
+class InjectionSessionTests(TestCase):
+    """
+    A session is validated as a whole: errors line up with the rows sent, and
+    nothing is written unless every row is valid.
+    """
+
+    url = "/api/allergy-templates/bulk/"
+
+    def setUp(self):
+        self.client = APIClient()
+        self.patient = create_patient(1)
+        self.other = create_patient(2)
+        self.vial = Vial.objects.create(patient=self.patient, name="Trees")
+        self.other_vial = Vial.objects.create(patient=self.other, name="Trees")
+
+    def row(self, vial, **extra):
+        return {
+            "vial": vial,
+            "dose": "0.1",
+            "date": "2024-01-10",
+            "arm": "L",
+            "peak_flow": "300",
+            "tech_id": "T1",
+            "reaction": "NR",
+            **extra,
+        }
+
+    def post(self, injections, patient=None):
+        data = {"injections": injections}
+        if patient is not None:
+            data["patient"] = patient.id
+        return self.client.post(self.url, data, format="json")
+
+    def test_valid_session(self):
+        response = self.post(
+            [self.row(self.vial.id), self.row(self.vial.id, arm="R")], self.patient
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["count"], 2)
+        self.assertEqual(
+            sorted(AllergyTemplate.objects.values_list("arm", flat=True)), ["L", "R"]
+        )
+
+    def test_errors_line_up_with_rows(self):
+        missing = self.vial.id + self.other_vial.id + 100
+        response = self.post(
+            [
+                self.row(self.vial.id),
+                self.row(missing),
+                self.row(self.other_vial.id),
+                self.row(self.vial.id, arm="X"),
+                self.row(self.vial.id),
+            ],
+            self.patient,
+        )
+        self.assertEqual(response.status_code, 400)
+        errors = response.json()["injections"]
+        self.assertEqual(len(errors), 5)
+        self.assertEqual(errors[0], {})
+        self.assertEqual(errors[1], {"vial": ["Vial does not exist."]})
+        self.assertEqual(errors[2], {"vial": ["Vial does not belong to this patient."]})
+        self.assertEqual(list(errors[3]), ["arm"])
+        self.assertEqual(errors[4], {})
+
+    def test_nothing_written_when_a_row_fails(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.post(
+                [self.row(self.vial.id), self.row(self.other_vial.id)], self.patient
+            )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(AllergyTemplate.objects.exists())
+        self.assertEqual(
+            PatientSummary.objects.get(patient=self.patient).visit_count, 0
+        )
+
+    def test_vials_of_several_patients_without_patient(self):
+        response = self.post([self.row(self.vial.id), self.row(self.other_vial.id)])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            [
+                PatientSummary.objects.get(patient=patient).visit_count
+                for patient in (self.patient, self.other)
+            ],
+            [1, 1],
+        )
+
+    def test_empty_or_malformed_session(self):
+        self.assertEqual(self.post([]).status_code, 400)
+        response = self.client.post(self.url, {"injections": "x"}, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(AllergyTemplate.objects.exists())
@@ -0,0 +1,109 @@
+from bisect import bisect_left, bisect_right
+from collections import Counter, defaultdict
+from itertools import accumulate, islice
+
+from django.db.models import Count, F, IntegerField, Value
+from django.db.models.functions import Cast, Greatest
+from django.utils import timezone
+
+from api.caching import invalidate_patients
+from api.models import AllergyTemplate, ProcedureDetail
+
+# Every injection logged for a patient uses one unit of each of the patient's
+# authorized procedures whose start_date..end_date window covers its date.
+
+
+def remaining_units():
+    # Cast first: MySQL refuses to subtract past zero on unsigned columns.
+    return Cast("units", IntegerField()) - Cast("consumed_units", IntegerField())
+
+
+def record_injection_units(injections, delta=1):
+    """
+    Add `delta` units per injection to the covering procedures. `injections`
+    is an iterable of (patient_id, date) pairs; each distinct pair costs one
+    UPDATE.
+    """
+    for (patient_id, day), count in Counter(injections).items():
+        change = delta * count
+        consumed = (
+            F("consumed_units") + change
+            if change > 0
+            else Greatest(F("consumed_units") + change, Value(0))
+        )
+        ProcedureDetail.objects.filter(
+            authorization_entry__patient_id=patient_id,
+            start_date__lte=day,
+            end_date__gte=day,
+        ).update(consumed_units=consumed, updated_at=timezone.now())
+
+
+def _injection_counts(patient_ids):
+    """
+    Return {patient_id: (sorted dates, cumulative injection counts)}.
+    """
+    per_day = defaultdict(list)
+    rows = (
+        AllergyTemplate.objects.filter(vial__patient_id__in=patient_ids)
+        .values_list("vial__patient_id", "date")
+        .annotate(count=Count("id"))
+        .order_by("vial__patient_id", "date")
+    )
+    for patient_id, day, count in rows:
+        per_day[patient_id].append((day, count))
+    return {
+        patient_id: ([day for day, _ in days], list(accumulate(c for _, c in days)))
+        for patient_id, days in per_day.items()
+    }
+
+
+def _count_between(counts, start, end):
+    days, totals = counts
+    low = bisect_left(days, start)
+    high = bisect_right(days, end)
+    if high <= low:
+        return 0
+    return totals[high - 1] - (totals[low - 1] if low else 0)
+
+
+def reconcile_consumed_units(procedures=None, batch_size=500):
+    """
+    Recount consumed_units from the logged injections for `procedures` (a
+    ProcedureDetail queryset, all of them by default), writing only counters
+    that drifted. Returns the number of procedures corrected.
+    """
+    if procedures is None:
+        procedures = ProcedureDetail.objects.all()
+    rows = (
+        procedures.order_by("authorization_entry__patient_id", "id")
+        .values_list(
+            "id",
+            "authorization_entry__patient_id",
+            "start_date",
+            "end_date",
+            "consumed_units",
+        )
+        .iterator(chunk_size=batch_size)
+    )
+
+    corrected = 0
+    now = timezone.now()
+    while batch := list(islice(rows, batch_size)):
+        counts = _injection_counts({row[1] for row in batch})
+        stale = []
+        patients = set()
+        for pk, patient_id, start, end, consumed in batch:
+            actual = (
+                _count_between(counts[patient_id], start, end)
+                if patient_id in counts
+                else 0
+            )
+            if actual != consumed:
+                stale.append(
+                    ProcedureDetail(id=pk, consumed_units=actual, updated_at=now)
+                )
+                patients.add(patient_id)
+        ProcedureDetail.objects.bulk_update(stale, ["consumed_units", "updated_at"])
+        invalidate_patients(patients)
+        corrected += len(stale)
+    return corrected
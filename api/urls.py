@@ -3,10 +3,22 @@ from api.views import (
     PatienSearchView,
     VialListCreateAPIView,
     AllergyTemplateView,
+    InjectionSessionView,
     MissedInjectionsView,
+    MissedInjectionWorklistView,
+    MissedInjectionExportView,
     AllergenTestListCreateView,
+    AllergenPanelView,
+    AllergenMatrixView,
     AllergenTestRetrieveUpdateDestroyView,
     AuthorizationEntryView,
+    AuthorizationDocumentView,
+    ExpiringAuthorizationsView,
+    LowUnitsView,
+    AuthorizationsByCodeView,
+    CodeAutocompleteView,
+    CodeValidateView,
+    ReactionAnalyticsView,
     AddPatientView,
 )
 
@@ -18,12 +30,31 @@ urlpatterns = [
         AllergyTemplateView.as_view(),
         name="allergy_template_create",
     ),
+    path(
+        "allergy-templates/bulk/",
+        InjectionSessionView.as_view(),
+        name="allergy_template_bulk_create",
+    ),
     path(
         "missed-injections/", MissedInjectionsView.as_view(), name="missed_injections"
     ),
+    path(
+        "missed-injections/worklist/",
+        MissedInjectionWorklistView.as_view(),
+        name="missed_injections_worklist",
+    ),
+    path(
+        "missed-injections/worklist/export/",
+        MissedInjectionExportView.as_view(),
+        name="missed_injections_export",
+    ),
     path(
         "allergen-tests/", AllergenTestListCreateView.as_view(), name="allergen-tests"
     ),
+    path("allergen-tests/panel/", AllergenPanelView.as_view(), name="allergen-panel"),
+    path(
+        "allergen-tests/matrix/", AllergenMatrixView.as_view(), name="allergen-matrix"
+    ),
     path(
         "allergen-tests/<int:pk>/",
         AllergenTestRetrieveUpdateDestroyView.as_view(),
@@ -34,8 +65,45 @@ urlpatterns = [
         AuthorizationEntryView.as_view(),
         name="authorization-entries",
     ),
+    path(
+        "authorization-entries/expiring/",
+        ExpiringAuthorizationsView.as_view(),
+        name="authorization-entries-expiring",
+    ),
+    path(
+        "authorization-entries/low-units/",
+        LowUnitsView.as_view(),
+        name="authorization-entries-low-units",
+    ),
+    path(
+        "authorization-entries/by-code/",
+        AuthorizationsByCodeView.as_view(),
+        name="authorization-entries-by-code",
+    ),
+    path(
+        "codes/autocomplete/",
+        CodeAutocompleteView.as_view(),
+        name="code_autocomplete",
+    ),
+    path("codes/validate/", CodeValidateView.as_view(), name="code_validate"),
+    path(
+        "authorization-entries/<int:pk>/document/",
+        AuthorizationDocumentView.as_view(),
+        name="authorization-document",
+    ),
+    path(
+        "authorization-entries/<int:pk>/thumbnail/",
+        AuthorizationDocumentView.as_view(),
+        {"kind": "thumbnail"},
+        name="authorization-thumbnail",
+    ),
     path(
         "authorization/", AuthorizationEntryView.as_view(), name="authorization_entry"
     ),
+    path(
+        "analytics/reactions/",
+        ReactionAnalyticsView.as_view(),
+        name="reaction_analytics",
+    ),
     path("patients/add/", AddPatientView.as_view(), name="add_patient"),
 ]
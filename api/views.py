@@ -1,59 +1,127 @@
-from django.db.models import Q
+import os
 from datetime import date, timedelta
+
+from django.db import transaction
+from django.db.models import Max, prefetch_related_objects
+from django.http import StreamingHttpResponse
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework import status
 from rest_framework import generics
-
-from api.models import AuthorizationEntry, Patient, Vial, AllergyTemplate, AllergenTest
+from rest_framework.settings import api_settings
+
+from api.models import (
+    AuthorizationEntry,
+    MissedInjectionSnapshot,
+    Vial,
+    AllergyTemplate,
+    AllergenTest,
+)
 from api.serializers import (
     VialSerializer,
     AllergyTemplateSerializer,
     AllergenTestSerializer,
+    AllergenPanelSerializer,
+    InjectionSessionSerializer,
     AuthorizationEntrySerializer,
     PatientSerializer,
 )
+from api.analytics import (
+    MATRIX_VALUES,
+    REACTION_SOURCES,
+    cohort_allergen_matrix,
+    patient_allergen_matrix,
+    reaction_analytics,
+)
+from api.caching import cache_patient_response
+from api.conditional import conditional_get
+from api.codes import CODE_SYSTEMS, ICD10, code_catalog, normalize_code
+from api.documents import enqueue_document_jobs
+from api.fieldsets import SparseFieldsetMixin
+from api.downloads import serve_document
+from api.pagination import KeysetPagination
+from api.renderers import CSVRenderer
+from api.reports import (
+    AUTHORIZATION_SUMMARY_FIELDS,
+    SNAPSHOT_EXPORT_FIELDS,
+    authorization_summary_row,
+    expiring_authorizations,
+    low_unit_procedures,
+    low_units_row,
+    missed_injection_row,
+    missed_injections,
+    procedure_summaries,
+    snapshot_row,
+    stream_csv,
+)
+from api.projections import (
+    ALLERGEN_TEST_PROJECTION,
+    ALLERGY_TEMPLATE_PROJECTION,
+    PATIENT_SEARCH_LOOKUPS,
+    VIAL_PROJECTION,
+    patient_search_rows,
+)
+from api.parsers import FastJSONParser, NestedFormParser, NestedMultiPartParser
+from api.search import search_patients
+
+
+def _is_list_of_dicts(value):
+    return isinstance(value, list) and all(isinstance(item, dict) for item in value)
 
 
-class PatienSearchView(APIView):
+class ProjectedListMixin(SparseFieldsetMixin):
+    """
+    ListModelMixin.list() over values() rows of `list_projection` instead of
+    serializer instances, with the same output. `serializer_class` is still
+    used for writes.
+    """
+
+    list_projection = None
+
+    def list(self, request, *args, **kwargs):
+        projection = self.list_projection.select(self.fieldset)
+        ordering = [field.lstrip("-") for field in self.pagination_ordering]
+        rows = projection.values(self.filter_queryset(self.get_queryset()), *ordering)
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(projection.rows(page))
+        return Response(projection.rows(rows))
+
+
+class PatienSearchView(SparseFieldsetMixin, APIView):
     """
     API view to handle patient search.
     """
 
+    pagination_ordering = ("-search_rank", "id")
+
     def get(self, request):
         name_query = request.query_params.get("name", "")
-        patients = Patient.objects.filter(
-            Q(first_name__icontains=name_query)
-            | Q(middle_name__icontains=name_query)
-            | Q(last_name__icontains=name_query)
-        )
 
-        if not name_query:
+        if not name_query.strip():
             return Response(
                 {"message": "Please provide a name to search."},
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        if not patients.exists():
+        patients = search_patients(name_query).values(
+            *PATIENT_SEARCH_LOOKUPS, "search_rank"
+        )
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(patients, request, view=self)
+        if page is None:
+            page = list(patients)
+
+        if not page and paginator.cursor_query_param not in request.query_params:
             return Response(
                 {"message": "No patients found."}, status=status.HTTP_404_NOT_FOUND
             )
 
-        data = []
-        for patient in patients:
-            patient_data = {
-                "Patient Id": patient.id,
-                "Patient Name": f"{patient.first_name} {patient.middle_name} {patient.last_name}",
-                "Date of birth": patient.birth_date,
-                "Last Test Date": "NA",
-                "Insurance": patient.insurance_type,
-                "Referral": "Yes" if patient.referral else "No",
-                "Visits/Exp": "NA",
-                "Billout Date": "NA",
-            }
-
-            data.append(patient_data)
+        data = patient_search_rows(page)
+
+        if paginator.is_requested(request, self):
+            return paginator.get_paginated_response(data)
 
         return Response(
             data,
@@ -74,93 +142,244 @@ class VialCreateView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class VialListCreateAPIView(generics.ListCreateAPIView):
+class VialListCreateAPIView(ProjectedListMixin, generics.ListCreateAPIView):
     """
     API view to list vials.
     """
 
     # queryset = Vial.objects.all()
     serializer_class = VialSerializer
+    list_projection = VIAL_PROJECTION
+    pagination_class = KeysetPagination
+    pagination_ordering = ("-created_at", "-id")
+
+    @property
+    def pagination_required(self):
+        # Only one patient's vials may be listed in full.
+        return not self.request.query_params.get("patient")
 
     def get_queryset(self):
+        vials = Vial.objects.all()
         patient_id = self.request.query_params.get("patient")
         if patient_id:
-            return Vial.objects.filter(patient_id=patient_id)
-        return Vial.objects.all()
+            return vials.filter(patient_id=patient_id)
+        return vials
+
+    @cache_patient_response("patient")
+    @conditional_get()
+    def get(self, request, *args, **kwargs):
+        return self.list(request, *args, **kwargs)
 
 
-class AllergyTemplateView(APIView):
+class AllergyTemplateView(SparseFieldsetMixin, APIView):
     """
     API view to create and list allergy templates.
     """
 
-    def get(self, request):
-        patient_id = request.query_params.get("patient", None)
+    pagination_ordering = ("-date", "-id")
+
+    @property
+    def pagination_required(self):
+        # Only one patient's templates may be listed in full.
+        return not self.request.query_params.get("patient")
 
+    def get_queryset(self):
+        patient_id = self.request.query_params.get("patient", None)
+
+        templates = AllergyTemplate.objects.all()
         if patient_id:
-            templates = AllergyTemplate.objects.filter(vial__patient__id=patient_id)
-        else:
-            templates = AllergyTemplate.objects.all()
+            templates = templates.filter(vial__patient__id=patient_id)
+        return templates
 
-        serializer = AllergyTemplateSerializer(templates, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+    @cache_patient_response("patient")
+    @conditional_get("updated_at", "vial__updated_at")
+    def get(self, request):
+        projection = ALLERGY_TEMPLATE_PROJECTION.select(self.fieldset)
+        ordering = [field.lstrip("-") for field in self.pagination_ordering]
+        templates = projection.values(self.get_queryset(), *ordering)
+
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(templates, request, view=self)
+        if page is not None:
+            return paginator.get_paginated_response(projection.rows(page))
+
+        return Response(projection.rows(templates), status=status.HTTP_200_OK)
 
     def post(self, request):
         serializer = AllergyTemplateSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save()
+            # The injection and its units consumption commit together.
+            with transaction.atomic():
+                serializer.save()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class MissedInjectionsView(APIView):
+class InjectionSessionView(APIView):
+    """
+    API view to log a whole session of injections in one request.
+    """
+
+    def post(self, request):
+        serializer = InjectionSessionSerializer(data=request.data)
+        if serializer.is_valid():
+            templates = serializer.save()
+            return Response(
+                {
+                    "message": "Injections logged successfully.",
+                    "count": len(templates),
+                },
+                status=status.HTTP_201_CREATED,
+            )
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class MissedInjectionsView(SparseFieldsetMixin, APIView):
     """
     API View to handle missed injections.
     """
 
+    sort_orderings = {
+        "weeks_desc": ("last_injection_date", "id"),
+        "weeks_asc": ("-last_injection_date", "-id"),
+    }
+
     def get(self, request):
-        weeks = int(request.query_params.get("weeks", 4))
-        print("!!!!!!!!!!!!!!!", timedelta(weeks=weeks))
-        threshold_date = date.today() - timedelta(weeks=weeks)
-
-        patients = Patient.objects.filter(
-            vial__templates__date__lt=threshold_date
-        ).distinct()
-        data = []
-
-        print("***********", patients)
-
-        for patient in patients:
-            # Get the most recent injection date
-            latest_template = (
-                AllergyTemplate.objects.filter(vial__patient=patient)
-                .order_by("-date")
-                .first()
+        try:
+            weeks = int(request.query_params.get("weeks", 4))
+        except ValueError:
+            return Response(
+                {"message": "weeks must be an integer."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        sort = request.query_params.get("sort", "weeks_desc")
+        if sort not in self.sort_orderings:
+            return Response(
+                {"message": f"sort must be one of {', '.join(self.sort_orderings)}."},
+                status=status.HTTP_400_BAD_REQUEST,
             )
+        self.pagination_ordering = self.sort_orderings[sort]
 
-            print("latest_template date", latest_template.date)
-            print("threshold_date", threshold_date)
+        today = date.today()
+        threshold_date = today - timedelta(weeks=weeks)
+        patients = missed_injections(threshold_date).order_by(*self.pagination_ordering)
 
-            if latest_template and latest_template.date < threshold_date:
-                data.append(
-                    {
-                        "patient_id": patient.id,
-                        "patient_name": f"{patient.first_name} {patient.middle_name} {patient.last_name}",
-                        "phone": patient.phone,
-                        "last_injection_date": latest_template.date,
-                        "weeks_since_last_injection": (
-                            date.today() - latest_template.date
-                        ).days
-                        // 7,
-                    }
-                )
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(patients, request, view=self)
+        rows = page if page is not None else patients
+        data = [missed_injection_row(row, today) for row in rows]
 
+        if page is not None:
+            return paginator.get_paginated_response(data)
         return Response(data, status=status.HTTP_200_OK)
 
 
-class AllergenTestListCreateView(generics.ListCreateAPIView):
+class MissedInjectionSnapshotMixin:
+    """
+    Shared lookup of the precomputed missed injection worklist.
+    """
+
+    def get_worklist(self, request):
+        """
+        Return `(snapshot_date, queryset, None)`, or `(None, None, response)`
+        when the request cannot be served.
+        """
+        try:
+            weeks = int(request.query_params.get("weeks", 4))
+            requested = request.query_params.get("date")
+            snapshot_date = date.fromisoformat(requested) if requested else None
+        except ValueError:
+            return (
+                None,
+                None,
+                Response(
+                    {"message": "weeks must be an integer and date YYYY-MM-DD."},
+                    status=status.HTTP_400_BAD_REQUEST,
+                ),
+            )
+
+        if snapshot_date is None:
+            snapshot_date = MissedInjectionSnapshot.objects.aggregate(
+                latest=Max("snapshot_date")
+            )["latest"]
+        if snapshot_date is None:
+            return (
+                None,
+                None,
+                Response(
+                    {"message": "No missed injection snapshot available."},
+                    status=status.HTTP_404_NOT_FOUND,
+                ),
+            )
+
+        snapshots = MissedInjectionSnapshot.objects.filter(
+            snapshot_date=snapshot_date, days_since_last_injection__gt=weeks * 7
+        ).order_by("-days_since_last_injection", "patient_id")
+        return snapshot_date, snapshots, None
+
+
+class MissedInjectionWorklistView(
+    SparseFieldsetMixin, MissedInjectionSnapshotMixin, APIView
+):
+    """
+    API view to serve the missed injection worklist from the nightly snapshot.
+    """
+
+    pagination_ordering = ("-days_since_last_injection", "patient_id")
+
+    def get(self, request):
+        snapshot_date, snapshots, error = self.get_worklist(request)
+        if error:
+            return error
+
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(snapshots, request, view=self)
+        rows = page if page is not None else snapshots
+        data = [snapshot_row(snapshot) for snapshot in rows]
+
+        if page is not None:
+            response = paginator.get_paginated_response(data)
+        else:
+            response = Response(data, status=status.HTTP_200_OK)
+        response["X-Snapshot-Date"] = snapshot_date.isoformat()
+        return response
+
+
+class MissedInjectionExportView(
+    SparseFieldsetMixin, MissedInjectionSnapshotMixin, APIView
+):
+    """
+    API view to stream the missed injection worklist as a CSV call list.
+    """
+
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, CSVRenderer]
+
+    def get(self, request):
+        snapshot_date, snapshots, error = self.get_worklist(request)
+        if error:
+            return error
+
+        # An empty selection would make values_list() read every column.
+        fields = [
+            field for field in SNAPSHOT_EXPORT_FIELDS if self.fieldset.wants(field)
+        ] or SNAPSHOT_EXPORT_FIELDS
+        rows = snapshots.values_list(*fields).iterator(chunk_size=2000)
+        response = StreamingHttpResponse(
+            stream_csv(fields, rows), content_type="text/csv"
+        )
+        response["Content-Disposition"] = (
+            f'attachment; filename="missed-injections-{snapshot_date.isoformat()}.csv"'
+        )
+        return response
+
+
+class AllergenTestListCreateView(ProjectedListMixin, generics.ListCreateAPIView):
     queryset = AllergenTest.objects.all()
     serializer_class = AllergenTestSerializer
+    list_projection = ALLERGEN_TEST_PROJECTION
+    pagination_class = KeysetPagination
+    pagination_ordering = ("-test_date", "-id")
 
     def get_queryset(self):
         patient_id = self.request.query_params.get("patientId")
@@ -168,30 +387,158 @@ class AllergenTestListCreateView(generics.ListCreateAPIView):
             return self.queryset.filter(patient_id=patient_id).order_by("-test_date")
         return self.queryset.none()
 
+    @cache_patient_response("patientId")
+    @conditional_get("updated_at", "allergen__updated_at")
+    def get(self, request, *args, **kwargs):
+        return self.list(request, *args, **kwargs)
 
-class AllergenTestRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
-    queryset = AllergenTest.objects.all()
+
+class AllergenPanelView(APIView):
+    """
+    API view to record a full allergen skin-test panel in one request.
+    """
+
+    def post(self, request):
+        serializer = AllergenPanelSerializer(data=request.data)
+        if serializer.is_valid():
+            tests = serializer.save()
+            return Response(
+                AllergenTestSerializer(tests, many=True).data,
+                status=status.HTTP_201_CREATED,
+            )
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class AllergenTestRetrieveUpdateDestroyView(
+    SparseFieldsetMixin, generics.RetrieveUpdateDestroyAPIView
+):
+    queryset = AllergenTest.objects.select_related("allergen")
     serializer_class = AllergenTestSerializer
     lookup_field = "pk"
 
 
-class AuthorizationEntryView(APIView):
+class ReactionAnalyticsView(SparseFieldsetMixin, APIView):
     """
-    API view to handle authorization entries with file upload.
+    API view to report reaction distributions and trends for allergen tests
+    or logged injections.
     """
 
     def get(self, request):
-        patient_id = request.query_params.get("patient_id")
+        source = request.query_params.get("source", "tests")
+        if source not in REACTION_SOURCES:
+            return Response(
+                {"message": f"source must be one of {', '.join(REACTION_SOURCES)}."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        try:
+            limit = max(1, min(int(request.query_params.get("limit", 100)), 1000))
+        except ValueError:
+            return Response(
+                {"message": "limit must be an integer."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        data = reaction_analytics(
+            source,
+            patient_id=request.query_params.get("patient"),
+            allergen=request.query_params.get("allergen"),
+            limit=limit,
+        )
+        return Response(data, status=status.HTTP_200_OK)
+
+
+class AllergenMatrixView(SparseFieldsetMixin, APIView):
+    """
+    API view to return allergen results pivoted into a compact matrix, either
+    allergens by test date for one patient or patients by allergens.
+    """
+
+    layouts = ("auto", "dense", "sparse")
+
+    def get(self, request):
+        patient_id = request.query_params.get("patient")
+        patient_ids = request.query_params.get("patients")
+        value = request.query_params.get("value", "grade")
+        layout = request.query_params.get("layout", "auto")
+
+        if value not in MATRIX_VALUES or layout not in self.layouts:
+            return Response(
+                {
+                    "message": f"value must be one of {', '.join(MATRIX_VALUES)} "
+                    f"and layout one of {', '.join(self.layouts)}."
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        if patient_id:
+            data = patient_allergen_matrix(patient_id, value=value, layout=layout)
+        elif patient_ids:
+            try:
+                ids = [int(pk) for pk in patient_ids.split(",") if pk.strip()]
+            except ValueError:
+                return Response(
+                    {"message": "patients must be a comma separated list of ids."},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            data = cohort_allergen_matrix(ids, value=value, layout=layout)
+        else:
+            return Response(
+                {"message": "patient or patients is required."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        return Response(data, status=status.HTTP_200_OK)
+
+
+class AuthorizationEntryView(SparseFieldsetMixin, APIView):
+    """
+    API view to handle authorization entries with file upload.
+    """
+
+    parser_classes = [NestedMultiPartParser, NestedFormParser, FastJSONParser]
+    entry_fields = (
+        "drug_name",
+        "dose",
+        "frequency",
+        "insurance",
+        "auth_number",
+        "expiration_date",
+        "cost_estimate",
+        "visit_history",
+    )
+    procedure_fields = (
+        "code",
+        "units",
+        "start_date",
+        "end_date",
+        "frequency",
+        "description",
+    )
+
+    def get_queryset(self):
+        patient_id = self.request.query_params.get("patient_id")
         if not patient_id:
+            return None
+        return AuthorizationEntry.objects.filter(patient_id=patient_id)
+
+    @cache_patient_response("patient_id")
+    @conditional_get("updated_at", "procedures__updated_at")
+    def get(self, request):
+        entries = self.get_queryset()
+        if entries is None:
             return Response(
                 {"message": "patient_id is required"},
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        entries = AuthorizationEntry.objects.filter(
-            patient_id=patient_id
-        ).prefetch_related("procedures")
-        serializer = AuthorizationEntrySerializer(entries, many=True)
+        # Only the requested columns are read; visit_history, the code lists
+        # and the extracted document text stay on disk unless asked for.
+        serializer = AuthorizationEntrySerializer(many=True, fieldset=self.fieldset)
+        entries = entries.only(*serializer.child.column_names())
+        if "procedures" in serializer.child.fields:
+            entries = entries.prefetch_related("procedures")
+        serializer.instance = entries
         return Response(serializer.data, status=status.HTTP_200_OK)
 
     def post(self, request):
@@ -203,68 +550,48 @@ class AuthorizationEntryView(APIView):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        entries = []
-        index = 0
-
-        # Loop through flattened form data: entries[0].field, entries[1].procedures[0].field, etc.
-        while f"entries[{index}].drug_name" in request.data:
-            # Extract flat fields
-            entry = {
-                "patient": patient_id,
-                "drug_name": request.data.get(f"entries[{index}].drug_name"),
-                "dose": request.data.get(f"entries[{index}].dose"),
-                "frequency": request.data.get(f"entries[{index}].frequency"),
-                "insurance": request.data.get(f"entries[{index}].insurance"),
-                "auth_number": request.data.get(f"entries[{index}].auth_number"),
-                "expiration_date": request.data.get(
-                    f"entries[{index}].expiration_date"
-                ),
-                "at_home": request.data.get(f"entries[{index}].at_home")
-                in ["true", "True", "1"],
-                "cost_estimate": request.data.get(f"entries[{index}].cost_estimate"),
-                "visit_history": request.data.get(f"entries[{index}].visit_history"),
-                "uploaded_doc": request.FILES.get(f"entries[{index}].docs"),
-                "icd10_codes": request.data.get(f"entries[{index}].icd10_codes", ""),
-                "procedure_codes": request.data.get(
-                    f"entries[{index}].procedure_codes", ""
-                ),
-            }
-
-            # Gather nested procedures
-            procedures = []
-            p_index = 0
-            while f"entries[{index}].procedures[{p_index}].code" in request.data:
-                procedures.append(
+        # NestedMultiPartParser has already turned entries[0].procedures[0].code
+        # style keys into lists of dicts, with each entry's file under "docs".
+        submitted = request.data.get("entries", [])
+        if not _is_list_of_dicts(submitted):
+            return Response(
+                {"message": "entries must be a list of objects."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        for index, data in enumerate(submitted):
+            if not _is_list_of_dicts(data.get("procedures", [])):
+                return Response(
                     {
-                        "code": request.data.get(
-                            f"entries[{index}].procedures[{p_index}].code"
-                        ),
-                        "units": request.data.get(
-                            f"entries[{index}].procedures[{p_index}].units"
-                        ),
-                        "start_date": request.data.get(
-                            f"entries[{index}].procedures[{p_index}].start_date"
-                        ),
-                        "end_date": request.data.get(
-                            f"entries[{index}].procedures[{p_index}].end_date"
-                        ),
-                        "frequency": request.data.get(
-                            f"entries[{index}].procedures[{p_index}].frequency"
-                        ),
-                        "description": request.data.get(
-                            f"entries[{index}].procedures[{p_index}].description"
-                        ),
-                    }
+                        "message": f"entries[{index}].procedures must be a list "
+                        "of objects."
+                    },
+                    status=status.HTTP_400_BAD_REQUEST,
                 )
-                p_index += 1
 
-            entry["procedures"] = procedures
+        entries = []
+        for data in submitted:
+            entry = {field: data.get(field) for field in self.entry_fields}
+            entry.update(
+                patient=patient_id,
+                at_home=data.get("at_home") in [True, "true", "True", "1"],
+                uploaded_doc=data.get("docs"),
+                icd10_codes=data.get("icd10_codes", ""),
+                procedure_codes=data.get("procedure_codes", ""),
+                procedures=[
+                    {field: procedure.get(field) for field in self.procedure_fields}
+                    for procedure in data.get("procedures", [])
+                ],
+            )
             entries.append(entry)
-            index += 1
 
         serializer = AuthorizationEntrySerializer(data=entries, many=True)
         if serializer.is_valid():
-            serializer.save()
+            with transaction.atomic():
+                serializer.save()
+                # Compression, thumbnails and text extraction run in the
+                # process_document_jobs worker, not in this request.
+                enqueue_document_jobs(serializer.instance)
+            prefetch_related_objects(serializer.instance, "procedures")
             return Response(
                 {
                     "message": "Authorization entries created successfully.",
@@ -275,6 +602,210 @@ class AuthorizationEntryView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class ExpiringAuthorizationsView(SparseFieldsetMixin, APIView):
+    """
+    API view to list authorization entries of all patients that expire within
+    the next `days` days (default 30), soonest first.
+    """
+
+    pagination_required = True
+    pagination_ordering = ("expiration_date", "patient_id", "id")
+
+    def get(self, request):
+        try:
+            days = int(request.query_params.get("days", 30))
+        except ValueError:
+            return Response(
+                {"message": "days must be an integer."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if not 0 <= days <= 366:
+            return Response(
+                {"message": "days must be between 0 and 366."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        today = date.today()
+        entries = expiring_authorizations(today, today + timedelta(days=days))
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(entries, request, view=self)
+        procedures = (
+            procedure_summaries([row["id"] for row in page])
+            if self.fieldset.wants("procedures")
+            else {}
+        )
+        return paginator.get_paginated_response(
+            [authorization_summary_row(row, procedures, today) for row in page]
+        )
+
+
+class LowUnitsView(SparseFieldsetMixin, APIView):
+    """
+    API view to list authorized procedures, still in effect, that are about
+    to run out of units.
+    """
+
+    pagination_required = True
+    pagination_ordering = ("remaining_units", "id")
+
+    def get(self, request):
+        try:
+            threshold = int(request.query_params.get("threshold", 2))
+        except ValueError:
+            return Response(
+                {"message": "threshold must be an integer."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        procedures = low_unit_procedures(threshold, date.today())
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(procedures, request, view=self)
+        return paginator.get_paginated_response([low_units_row(row) for row in page])
+
+
+class AuthorizationsByCodeView(SparseFieldsetMixin, APIView):
+    """
+    API view to list the authorization entries carrying an ICD-10 or CPT code,
+    newest first.
+    """
+
+    pagination_required = True
+    pagination_ordering = ("-id",)
+
+    def get(self, request):
+        system = request.query_params.get("system", ICD10)
+        code = request.query_params.get("code", "")
+        if system not in CODE_SYSTEMS:
+            return Response(
+                {"message": f"system must be one of {', '.join(CODE_SYSTEMS)}."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        normalized = normalize_code(system, code)
+        if normalized is None:
+            return Response(
+                {"message": f"{code!r} is not a valid {system} code."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        entries = AuthorizationEntry.objects.filter(
+            codes__system=system, codes__code=normalized
+        ).values(*AUTHORIZATION_SUMMARY_FIELDS)
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(entries, request, view=self)
+        procedures = (
+            procedure_summaries([row["id"] for row in page])
+            if self.fieldset.wants("procedures")
+            else {}
+        )
+        today = date.today()
+        return paginator.get_paginated_response(
+            [authorization_summary_row(row, procedures, today) for row in page]
+        )
+
+
+class CodeAutocompleteView(SparseFieldsetMixin, APIView):
+    """
+    API view to suggest ICD-10 and CPT codes by code or description prefix,
+    served from the in-memory catalog.
+    """
+
+    def get(self, request):
+        query = request.query_params.get("q", "").strip()
+        system = request.query_params.get("system") or None
+        if system is not None and system not in CODE_SYSTEMS:
+            return Response(
+                {"message": f"system must be one of {', '.join(CODE_SYSTEMS)}."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        try:
+            limit = max(1, min(int(request.query_params.get("limit", 20)), 100))
+        except ValueError:
+            return Response(
+                {"message": "limit must be an integer."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if not query:
+            return Response([], status=status.HTTP_200_OK)
+
+        return Response(
+            code_catalog().search(query, system=system, limit=limit),
+            status=status.HTTP_200_OK,
+        )
+
+
+class CodeValidateView(SparseFieldsetMixin, APIView):
+    """
+    API view to check a comma separated list of codes: whether each is well
+    formed and whether it is in the catalog.
+    """
+
+    def get(self, request):
+        system = request.query_params.get("system", ICD10)
+        if system not in CODE_SYSTEMS:
+            return Response(
+                {"message": f"system must be one of {', '.join(CODE_SYSTEMS)}."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        catalog = code_catalog()
+        results = []
+        for code in request.query_params.get("codes", "").split(","):
+            if not code.strip():
+                continue
+            normalized = normalize_code(system, code)
+            description = normalized and catalog.describe(system, normalized)
+            results.append(
+                {
+                    "code": code.strip(),
+                    "normalized": normalized,
+                    "valid": normalized is not None,
+                    "known": bool(description),
+                    "description": description or None,
+                }
+            )
+        return Response(results, status=status.HTTP_200_OK)
+
+
+class AuthorizationDocumentView(APIView):
+    """
+    API view to download the document, or its thumbnail, of an authorization
+    entry. Supports range and conditional requests.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk, kind="document"):
+        entry = (
+            AuthorizationEntry.objects.only(
+                "id", "uploaded_doc", "uploaded_doc_name", "document_thumbnail"
+            )
+            .filter(pk=pk)
+            .first()
+        )
+        if entry is None:
+            return Response(
+                {"message": "Authorization entry not found."},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+
+        filename = entry.uploaded_doc_name or None
+        if kind == "thumbnail":
+            field_file = entry.document_thumbnail
+            if filename:
+                filename = f"{os.path.splitext(filename)[0]}.png"
+        else:
+            field_file = entry.uploaded_doc
+
+        try:
+            if not field_file:
+                raise FileNotFoundError
+            return serve_document(request, field_file, filename)
+        except FileNotFoundError:
+            return Response(
+                {"message": "Document not found."}, status=status.HTTP_404_NOT_FOUND
+            )
+
+
 class AddPatientView(APIView):
     permission_classes = [IsAuthenticated]
 